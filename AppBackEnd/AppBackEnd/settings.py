@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework_simplejwt',
     'rest_framework',
 
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'boardgames.middleware.QueryProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,20 +80,106 @@ WSGI_APPLICATION = 'AppBackEnd.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# DB_CONN_MAX_AGE keeps connections open between requests (seconds, 0 closes them after every request),
+# health checks replace connections the server dropped before they are reused.
+# DB_POOL=1 switches to the psycopg 3 pool (Django 5.1+, psycopg[pool]), which also serves ASGI,
+# where persistent connections are not reused across requests.
+# DB_PGBOUNCER=1 is for PgBouncer in transaction pooling mode: no server-side cursors.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'boardGames_db',
-        'USER': 'postgres',
-        'PASSWORD': '1234qwer',
-        'HOST': 'localhost',
-        'PORT': '5432'
+        'NAME': os.environ.get('DB_NAME', 'boardGames_db'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', '1234qwer'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER') == '1',
     }
 }
 
+if os.environ.get('DB_POOL') == '1':
+    # the pool owns the connections, Django must not keep them itself
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+
+# DB_REPLICA_HOSTS=host[:port],... adds read replicas with the primary's credentials. Safe requests
+# of the API read from them (boardgames.db_router), except for users who wrote something in the
+# last DB_REPLICA_STICKY_SECONDS, so they always see their own changes. The window is kept in the
+# cache, so replicas need REDIS_URL when more than one process serves the API.
+
+REPLICA_DATABASES = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    replica_host, _, replica_port = replica.strip().partition(':')
+    DATABASES['replica%d' % number] = dict(DATABASES['default'], HOST=replica_host,
+                                           PORT=replica_port or DATABASES['default']['PORT'],
+                                           TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append('replica%d' % number)
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+
+DATABASE_ROUTERS = ['boardgames.db_router.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# local memory by default, any Redis-compatible server when REDIS_URL is set
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'boardgames',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# background tasks (boardgames.tasks), run by `manage.py run_worker`
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', 5))
+TASK_RETRY_BASE_SECONDS = 10
+TASK_RETRY_MAX_SECONDS = 3600
+# a running task is handed to another worker if it is not finished within the lease
+TASK_LEASE_SECONDS = 300
+
+# run_worker deactivates started events every EVENT_SWEEP_INTERVAL seconds (0 leaves it to cron and
+# `manage.py sweep_events`); inactive events older than EVENT_ARCHIVE_AFTER_DAYS move to the archive tables
+EVENT_SWEEP_INTERVAL = int(os.environ.get('EVENT_SWEEP_INTERVAL', 300))
+EVENT_ARCHIVE_AFTER_DAYS = int(os.environ.get('EVENT_ARCHIVE_AFTER_DAYS', 0))
+
+# run_worker refreshes the recommendations of users whose scores changed every RECOMMENDATION_REFRESH_INTERVAL
+# seconds (0 leaves it to cron and `manage.py build_recommendations --incremental`)
+RECOMMENDATION_REFRESH_INTERVAL = int(os.environ.get('RECOMMENDATION_REFRESH_INTERVAL', 600))
+
+# /api/sync/: rows per collection in one response, how far back the next token starts to catch
+# transactions that committed late, and how long deletions are remembered (older tokens get 410)
+SYNC_PAGE_SIZE = 500
+SYNC_OVERLAP_SECONDS = 5
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+
+# /api/stream/ (boardgames.push): LocalBackend only reaches streams of the publishing process,
+# with several ASGI processes or the task worker publishing, set PUSH_REDIS_URL
+PUSH_REDIS_URL = os.environ.get('PUSH_REDIS_URL')
+PUSH_BACKEND = 'boardgames.push.RedisBackend' if PUSH_REDIS_URL else 'boardgames.push.LocalBackend'
+PUSH_QUEUE_SIZE = 100
+PUSH_HEARTBEAT_SECONDS = 15
+PUSH_RETRY_SECONDS = 5
+
 
 
 # Password validation
@@ -137,17 +225,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'boardgames.renderers.FastJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        # 'boardgames.jwt.JWTAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'boardgames.jwt.JWTAuthentication',
+        # 'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'boardgames.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
+# upper bound for ?page_size= on paginated endpoints
+PAGINATION_MAX_PAGE_SIZE = 200
+
+# fail requests that run more SQL queries than their view declares (query_budgets), meant for test runs
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+
+# geocoder used to fill Event coordinates, see boardgames.geo.Geocoder
+EVENT_GEOCODER = 'boardgames.geo.OfflineGeocoder'
+NEARBY_MAX_RADIUS_KM = 100
+# events of /api/events/nearby/ whose exact distance is computed, the closest ones first
+NEARBY_MAX_CANDIDATES = 1000
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1000),
@@ -180,6 +282,10 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# tokens carry email, is_active and is_staff as claims; a change of them revokes the tokens issued
+# before (Profile.tokens_valid_after), which processes cache for this long
+AUTH_REVOCATION_CACHE_SECONDS = int(os.environ.get('AUTH_REVOCATION_CACHE_SECONDS', 60))
+
 
 AUTH_USER_MODEL = 'boardgames.Profile'
 
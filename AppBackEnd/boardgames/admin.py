@@ -1,10 +1,16 @@
 from django.contrib import admin
 
-from boardgames.models import Profile, Event,ParticipationRequest, UserScore, FriendshipStatus
+from boardgames.models import Profile, Event,ParticipationRequest, UserScore, FriendshipStatus, GameScoreAggregate, \
+    GameSimilarity, Recommendation, Game, ArchivedEvent, ArchivedParticipationRequest
 
 admin.site.register(Profile)
 admin.site.register(Event)
-# admin.site.register(Game)
+admin.site.register(Game)
 admin.site.register(ParticipationRequest)
 admin.site.register(UserScore)
 admin.site.register(FriendshipStatus)
+admin.site.register(GameScoreAggregate)
+admin.site.register(GameSimilarity)
+admin.site.register(Recommendation)
+admin.site.register(ArchivedEvent)
+admin.site.register(ArchivedParticipationRequest)
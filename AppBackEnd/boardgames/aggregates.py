@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models import Count
+
+from boardgames.models import GameScoreAggregate, UserScore
+
+
+def apply_score_change(game, old_score=None, new_score=None):
+    """
+    Update the per-game aggregate after a single UserScore change.
+    old_score is None for a new score, new_score is None for a deleted one.
+    """
+    if old_score == new_score:
+        return
+    with transaction.atomic():
+        aggregate, _ = GameScoreAggregate.objects.select_for_update().get_or_create(game_id=game)
+        histogram = aggregate.histogram
+        if old_score is not None:
+            aggregate.score_sum -= old_score
+            aggregate.score_count -= 1
+            key = str(old_score)
+            histogram[key] = histogram.get(key, 0) - 1
+            if histogram[key] <= 0:
+                del histogram[key]
+        if new_score is not None:
+            aggregate.score_sum += new_score
+            aggregate.score_count += 1
+            key = str(new_score)
+            histogram[key] = histogram.get(key, 0) + 1
+        aggregate.save()
+
+
+def compute_aggregates(games=None):
+    """
+    Build aggregates from UserScore rows: {game: (score_sum, score_count, histogram)}.
+    """
+    queryset = UserScore.objects.all()
+    if games is not None:
+        queryset = queryset.filter(game__in=games)
+    result = {}
+    rows = queryset.values('game', 'score').annotate(number=Count('id')).order_by()
+    for row in rows.iterator():
+        score_sum, score_count, histogram = result.get(row['game'], (0, 0, {}))
+        histogram[str(row['score'])] = row['number']
+        result[row['game']] = (score_sum + row['score'] * row['number'], score_count + row['number'], histogram)
+    return result
+
+
+def rebuild_aggregates(games=None):
+    """
+    Recompute the aggregates from UserScore. The aggregate rows are locked before the scores are read,
+    so apply_score_change() of a concurrent score write waits and is applied on top of the rebuilt values
+    instead of being overwritten.
+    """
+    with transaction.atomic():
+        scored = UserScore.objects.values_list('game', flat=True).distinct().order_by()
+        existing = GameScoreAggregate.objects.all()
+        if games is not None:
+            scored = scored.filter(game__in=games)
+            existing = existing.filter(game__in=games)
+        # rows to lock for games that have scores but no aggregate yet
+        GameScoreAggregate.objects.bulk_create([GameScoreAggregate(game_id=game) for game in scored.iterator()],
+                                               batch_size=1000, ignore_conflicts=True)
+        aggregates = list(existing.select_for_update().order_by('game'))
+        computed = compute_aggregates(games)
+        for aggregate in aggregates:
+            aggregate.score_sum, aggregate.score_count, aggregate.histogram = \
+                computed.get(aggregate.game_id, (0, 0, {}))
+        GameScoreAggregate.objects.bulk_update(aggregates, ['score_sum', 'score_count', 'histogram'],
+                                               batch_size=1000)
+        GameScoreAggregate.objects.filter(pk__in=[aggregate.pk for aggregate in aggregates
+                                                  if aggregate.game_id not in computed]).delete()
+    return len(computed)
+
+
+def verify_aggregates(games=None):
+    """
+    Return the list of games whose stored aggregate differs from UserScore.
+    """
+    computed = compute_aggregates(games)
+    stored = GameScoreAggregate.objects.all()
+    if games is not None:
+        stored = stored.filter(game__in=games)
+    mismatched = []
+    seen = set()
+    for aggregate in stored.iterator():
+        seen.add(aggregate.game_id)
+        expected = computed.get(aggregate.game_id, (0, 0, {}))
+        if (aggregate.score_sum, aggregate.score_count, aggregate.histogram) != expected:
+            mismatched.append(aggregate.game_id)
+    mismatched.extend(game for game in computed if game not in seen)
+    return mismatched
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BoardgamesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'boardgames'
+
+    def ready(self):
+        from boardgames import notifications, signals  # noqa: F401
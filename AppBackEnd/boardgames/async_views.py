@@ -0,0 +1,180 @@
+import asyncio
+import base64
+import json
+from datetime import date, time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from boardgames.db_router import acan_read_from_replica, mark_write, replica_reads
+from boardgames.filters import EventFilter
+from boardgames.jwt import JWTAuthentication
+from boardgames.models import Event, GameScoreAggregate, ParticipationRequest
+from boardgames.pagination import EventCursorPagination
+from boardgames.push import broker, format_event, get_backend
+from boardgames.search import FullTextSearchFilter
+from boardgames.serializers import EventListSerializer, EventsSerializer, ProfileShortSerializer, \
+    ParticipationRequestsSerializer
+from boardgames.utils import requested_fields
+
+
+class AsyncAPIView(View):
+    """
+    Read-only endpoint served natively under ASGI: JWT authentication, rendering and
+    query_budget work as in the DRF views, while the handlers await the async ORM
+    instead of holding a worker thread for the whole request.
+    """
+    query_budget = None
+    authentication = JWTAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await self.authenticate(request)
+            if auth is None:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as error:
+            return self.render(request, {'detail': error.detail}, error.status_code)
+        request.user, request.auth = auth
+        with replica_reads(await acan_read_from_replica(request.method, request.user.pk)):
+            response = await super().dispatch(request, *args, **kwargs)
+        # the same read-your-writes window as ReplicaReadMixin
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            await sync_to_async(mark_write)(request.user.pk)
+        return response
+
+    async def authenticate(self, request):
+        return await self.authentication.aauthenticate(request)
+
+    def get_serializer_context(self, request):
+        return {'request': Request(request), 'view': self}
+
+    def render(self, request, data, status_code=status.HTTP_200_OK):
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        content = renderer.render(data, renderer.media_type, {'request': request, 'view': self})
+        return HttpResponse(content, content_type=renderer.media_type, status=status_code)
+
+
+async def _all(queryset):
+    return [obj async for obj in queryset]
+
+
+class EventOverviewView(AsyncAPIView):
+    """
+    Everything the event screen needs in one response: the event, its participators,
+    the current user's request and the game's average score, read concurrently.
+    """
+    query_budget = 4
+
+    async def get(self, request, pk):
+        event, participations, my_request, aggregate = await asyncio.gather(
+            Event.objects.select_related('organizer', 'game').filter(pk=pk).afirst(),
+            _all(ParticipationRequest.objects.filter(event=pk, is_accepted=True).select_related('user')
+                 .only('event', 'user', *('user__%s' % field for field in ProfileShortSerializer.only_fields()))
+                 .order_by('id')),
+            ParticipationRequest.objects.filter(event=pk, user=request.user.id).afirst(),
+            GameScoreAggregate.objects.filter(game__events=pk).afirst(),
+        )
+        if event is None:
+            return self.render(request, {'detail': exceptions.NotFound.default_detail}, status.HTTP_404_NOT_FOUND)
+        context = self.get_serializer_context(request)
+        score = None
+        if aggregate is not None and aggregate.score_count:
+            score = {'score_value': aggregate.average, 'score_number': aggregate.score_count}
+        return self.render(request, {
+            'event': EventsSerializer(event, context=context).data,
+            'participators': ProfileShortSerializer([participation.user for participation in participations],
+                                                    many=True, context=context).data,
+            'my_request': ParticipationRequestsSerializer(my_request, context=context).data if my_request else None,
+            'score': score,
+        })
+
+
+class EventFeedView(AsyncAPIView):
+    """
+    Async version of the event list: the same filters, ?search= and ?fields=, ordered by
+    (date, time, id) and paged with an opaque ?after= cursor pointing at the last row of the page.
+    """
+    query_budget = 1
+    cursor_query_param = 'after'
+
+    async def get(self, request):
+        drf_request = Request(request)
+        only = EventListSerializer.only_fields(requested_fields(drf_request)) | {'date', 'time'}
+        queryset = Event.objects.only(*only).select_related(*{'organizer', 'game'} & only)
+        filterset = EventFilter(request.GET, queryset=queryset)
+        if not filterset.is_valid():
+            return self.render(request, filterset.errors, status.HTTP_400_BAD_REQUEST)
+        queryset = FullTextSearchFilter().filter_queryset(drf_request, filterset.qs, self)
+        after = request.GET.get(self.cursor_query_param)
+        if after:
+            try:
+                day, moment, last_id = json.loads(base64.urlsafe_b64decode(after.encode()))
+                day, moment, last_id = date.fromisoformat(day), time.fromisoformat(moment), int(last_id)
+            except (TypeError, ValueError):
+                return self.render(request, {'detail': 'Invalid cursor'}, status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(Q(date__gt=day) | Q(date=day, time__gt=moment) |
+                                       Q(date=day, time=moment, id__gt=last_id))
+        page_size = EventCursorPagination().get_page_size(drf_request)
+        events = await _all(queryset.order_by('date', 'time', 'id')[:page_size + 1])
+        next_url = None
+        if len(events) > page_size:
+            events = events[:page_size]
+            last = events[-1]
+            cursor = json.dumps([last.date.isoformat(), last.time.isoformat(), last.id])
+            query = request.GET.copy()
+            query[self.cursor_query_param] = base64.urlsafe_b64encode(cursor.encode()).decode()
+            next_url = request.build_absolute_uri('?' + query.urlencode())
+        results = EventListSerializer(events, many=True, context=self.get_serializer_context(request)).data
+        return self.render(request, {'next': next_url, 'results': results})
+
+
+class EventStreamView(AsyncAPIView):
+    """
+    Server-Sent Events with the current user's updates (see boardgames.push): new and answered
+    participation requests, friend requests and changes of events they take part in. Browsers'
+    EventSource cannot send headers, so the access token may come as ?token= instead.
+    Served only by the ASGI application; an idle WSGI worker would be held by every stream.
+    """
+    query_budget = 1
+
+    async def authenticate(self, request):
+        token = request.GET.get('token')
+        if token and 'HTTP_AUTHORIZATION' not in request.META:
+            return await self.authentication.aauthenticate_token(token.encode())
+        return await super().authenticate(request)
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return self.render(request, {'detail': 'Push is only served by the ASGI application'},
+                               status.HTTP_501_NOT_IMPLEMENTED)
+        await get_backend().listen()
+        user_id = request.user.pk
+
+        async def stream():
+            subscription = broker.subscribe(user_id)
+            try:
+                # reconnect delay for EventSource, in milliseconds
+                yield 'retry: %d\n\n' % (settings.PUSH_RETRY_SECONDS * 1000)
+                while True:
+                    try:
+                        message = await subscription.get(settings.PUSH_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        # keeps proxies from closing an idle connection
+                        yield ': ping\n\n'
+                        continue
+                    yield format_event(message)
+            finally:
+                broker.unsubscribe(subscription)
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,93 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+from boardgames.models import Event
+
+cache = caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return 'ns:%s' % namespace
+
+
+def get_versions(namespaces):
+    """
+    Current version of every namespace. A missing version (never bumped or
+    evicted) starts from the clock, so it can never repeat an older one.
+    """
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate_on_commit(*namespaces):
+    """
+    invalidate() once the current transaction commits: invalidating earlier lets a concurrent
+    request cache the rows from before the change again.
+    """
+    transaction.on_commit(lambda: invalidate(*namespaces))
+
+
+def profile_namespaces(profile_id):
+    """
+    Namespaces of the responses that show the profile: its own and the events it organizes (organizer_info).
+    """
+    event_ids = Event.objects.filter(organizer=profile_id).values_list('pk', flat=True)
+    return ['profile:%s' % profile_id, 'events', *('event:%s' % pk for pk in event_ids)]
+
+
+def cache_response(*namespaces):
+    """
+    Cache the rendered body of a successful GET action. Namespaces are formatted
+    with the view kwargs (e.g. 'event:{pk}') and invalidated by boardgames.signals.
+    Responses carry an ETag and If-None-Match is answered with 304. Pagination links are
+    absolute, so the key includes the scheme and host along with the path.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            names = [namespace.format(**kwargs) for namespace in namespaces]
+            versions = get_versions(names)
+            path_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+            key = 'response:%s:%s:%s' % (','.join(names), ':'.join(map(str, versions)), path_hash)
+            entry = cache.get(key)
+            if entry is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != 200 or not hasattr(response, 'data'):
+                    return response
+                renderer = view.get_renderers()[0]
+                content = renderer.render(response.data, renderer.media_type,
+                                          dict(view.get_renderer_context(), response=response))
+                entry = (content, renderer.media_type, '"%s"' % hashlib.md5(content).hexdigest())
+                cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+            content, content_type, etag = entry
+            if request.headers.get('If-None-Match') == etag:
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,131 @@
+import csv
+from xml.etree.ElementTree import iterparse
+
+from django.db import transaction
+
+from boardgames.models import Game
+
+CATALOG_FIELDS = ('name', 'year_published', 'min_players', 'max_players', 'min_play_time', 'max_play_time', 'rating',
+                  'thumbnail', 'image', 'description')
+
+# column names used by the common BGG dumps, lower-cased
+CSV_COLUMNS = {
+    'id': ('id', 'bggid', 'bgg_id', 'objectid', 'game_id'),
+    'name': ('name', 'primary', 'title'),
+    'year_published': ('yearpublished', 'year_published', 'year'),
+    'min_players': ('minplayers', 'min_players'),
+    'max_players': ('maxplayers', 'max_players'),
+    'min_play_time': ('minplaytime', 'min_play_time', 'playingtime'),
+    'max_play_time': ('maxplaytime', 'max_play_time', 'playingtime'),
+    'rating': ('average', 'avgrating', 'rating', 'bayesaverage'),
+    'thumbnail': ('thumbnail', 'thumbnail_url'),
+    'image': ('image', 'image_url', 'imagepath'),
+    'description': ('description',),
+}
+INTEGER_FIELDS = {'id', 'year_published', 'min_players', 'max_players', 'min_play_time', 'max_play_time'}
+
+
+def _clean(field, value):
+    value = (value or '').strip()
+    if field in INTEGER_FIELDS:
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+    if field == 'rating':
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return value
+
+
+def read_csv(path):
+    """
+    Yield catalog rows ({field: value}) from a CSV dump, matching columns by CSV_COLUMNS.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        sources = {field: next((columns[alias] for alias in aliases if alias in columns), None)
+                   for field, aliases in CSV_COLUMNS.items()}
+        if sources['id'] is None or sources['name'] is None:
+            raise ValueError('%s has no id or name column' % path)
+        for record in reader:
+            row = {field: _clean(field, record.get(source)) for field, source in sources.items() if source is not None}
+            if row['id'] is not None and row['name']:
+                yield row
+
+
+def read_xml(path):
+    """
+    Yield catalog rows from a dump of BGG XML API2 <item> elements, parsed incrementally.
+    """
+    for _, element in iterparse(path):
+        if element.tag != 'item':
+            continue
+        row = {'id': _clean('id', element.get('id'))}
+        for name in element.iterfind('name'):
+            if name.get('type', 'primary') == 'primary':
+                row['name'] = name.get('value', '').strip()
+                break
+        for field, tag in (('year_published', 'yearpublished'), ('min_players', 'minplayers'),
+                           ('max_players', 'maxplayers'), ('min_play_time', 'minplaytime'),
+                           ('max_play_time', 'maxplaytime'), ('rating', 'statistics/ratings/average')):
+            node = element.find(tag)
+            if node is not None:
+                row[field] = _clean(field, node.get('value'))
+        for field in ('thumbnail', 'image', 'description'):
+            node = element.find(field)
+            if node is not None:
+                row[field] = _clean(field, node.text)
+        element.clear()
+        if row['id'] is not None and row.get('name'):
+            yield row
+
+
+def import_games(rows, batch_size=1000):
+    """
+    Insert new catalog rows and update changed ones in batches.
+    Returns (created, updated ids) so callers can refresh what depends on the game names.
+    """
+    created, updated = 0, []
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            created += _import_batch(batch, updated)
+            batch = []
+    if batch:
+        created += _import_batch(batch, updated)
+    return created, updated
+
+
+def _import_batch(rows, updated):
+    rows = {row['id']: row for row in rows}
+    with transaction.atomic():
+        existing = Game.objects.in_bulk(list(rows))
+        changed, new = [], []
+        for game_id, row in rows.items():
+            game = existing.get(game_id)
+            if game is None:
+                new.append(Game(**row))
+                continue
+            fields = [field for field in CATALOG_FIELDS if field in row and getattr(game, field) != row[field]]
+            if fields:
+                for field in fields:
+                    setattr(game, field, row[field])
+                changed.append(game)
+        Game.objects.bulk_create(new)
+        Game.objects.bulk_update(changed, CATALOG_FIELDS)
+    updated.extend(game.id for game in changed)
+    return len(new)
+
+
+def ensure_game(game_id, name='', thumbnail=''):
+    """
+    Catalog row for game_id, created as a stub from the client's data when the game
+    is not in the imported catalog yet (the next import fills in the rest).
+    """
+    game, _ = Game.objects.get_or_create(pk=game_id, defaults={'name': name or '', 'thumbnail': thumbnail or ''})
+    return game
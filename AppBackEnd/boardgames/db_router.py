@@ -0,0 +1,101 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.permissions import SAFE_METHODS
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def _sticky_key(user_id):
+    return 'replica:sticky:%s' % user_id
+
+
+def mark_write(*user_ids):
+    """
+    Keep the users' reads on the primary until the replicas have caught up with a write made
+    for them. The window starts when the current transaction commits.
+    """
+    keys = {_sticky_key(user_id): True for user_id in user_ids if user_id is not None}
+    if settings.REPLICA_DATABASES and keys:
+        transaction.on_commit(lambda: cache.set_many(keys, settings.REPLICA_STICKY_SECONDS))
+
+
+def can_read_from_replica(method, user_id):
+    if not settings.REPLICA_DATABASES or method not in SAFE_METHODS:
+        return False
+    return user_id is None or not cache.get(_sticky_key(user_id), False)
+
+
+async def acan_read_from_replica(method, user_id):
+    if not settings.REPLICA_DATABASES or method not in SAFE_METHODS:
+        return False
+    return user_id is None or not await cache.aget(_sticky_key(user_id), False)
+
+
+@checks.register(checks.Tags.database, deploy=True)
+def check_sticky_cache(app_configs, **kwargs):
+    if not settings.REPLICA_DATABASES or \
+            settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [checks.Error('Read replicas need a cache shared by all processes: with a per-process cache the next '
+                         'request of a user who just wrote may reach another process and read a stale replica',
+                         hint='Set REDIS_URL to share the cache.', id='boardgames.E001')]
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside replica_reads() to a random replica from settings.REPLICA_DATABASES.
+    Everything else, and all writes, use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.REPLICA_DATABASES:
+            return random.choice(settings.REPLICA_DATABASES)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Viewset mixin: safe requests read from the replicas unless the user wrote something
+    in the last REPLICA_STICKY_SECONDS, successful unsafe requests start that window.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user_id = request.user.pk if request.user.is_authenticated else None
+        if can_read_from_replica(request.method, user_id):
+            self._replica_token = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self._replica_token = None
+        elif request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            mark_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
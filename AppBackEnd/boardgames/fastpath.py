@@ -0,0 +1,194 @@
+from operator import itemgetter, methodcaller
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from boardgames.serializers import PictureField
+from boardgames.utils import serialize_data
+
+# fields whose representation of a column value is the value itself
+PLAIN_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+def exact_float(value):
+    """
+    True when orjson writes the float exactly like json.dumps: they differ only in exponent notation
+    (1e-05 vs 1e-5), which repr() uses below 1e-4 and from 1e16, and for nan/inf.
+    """
+    magnitude = abs(value)
+    return magnitude == 0 or 1e-4 <= magnitude < 1e16
+
+
+def model_field(model, attrs):
+    """
+    Model field behind a serializer source ('game.name' -> Game.name), following forward relations only.
+    """
+    field = None
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # game_id and other attnames
+            field = next((field for field in model._meta.concrete_fields if field.attname == attr), None)
+        if field is None or not field.concrete or field.many_to_many:
+            raise UnsupportedField('.'.join(attrs))
+        if index < len(attrs) - 1:
+            if not field.is_relation:
+                raise UnsupportedField('.'.join(attrs))
+            model = field.related_model
+    return field
+
+
+def iso_format(field, default):
+    output_format = getattr(field, 'format', default)
+    return output_format is not None and output_format.lower() == ISO_8601
+
+
+def datetime_representation(field):
+    """
+    DateTimeField.to_representation() for ISO 8601 with the field's time zone looked up once.
+    """
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def represent(value):
+        if not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return represent
+
+
+class ValuesSerializer:
+    """
+    Read-only twin of a ModelSerializer instance for QuerySet.values() rows: the readable fields
+    (after ?fields=) are compiled once into getters of the row columns, so a row is represented
+    without model instances and the serializer machinery, with the same output as the serializer.
+    Raises UnsupportedField for fields that need the instance (methods, many-to-many, ...).
+    exact_floats turns False once a row has a float that FastJSONRenderer would not write exactly.
+    """
+
+    def __init__(self, serializer):
+        self.columns = []
+        self.exact_floats = True
+        self.getters = self.compile(serializer, serializer.Meta.model, '')
+
+    def column(self, name):
+        if name not in self.columns:
+            self.columns.append(name)
+        return name
+
+    def compile(self, serializer, model, prefix):
+        return [(field.field_name, self.compile_field(field, model, prefix))
+                for field in serializer._readable_fields]
+
+    def compile_field(self, field, model, prefix):
+        if isinstance(field, serializers.ListSerializer) or field.source == '*':
+            raise UnsupportedField(field.field_name)
+        try:
+            source = model_field(model, field.source_attrs)
+        except UnsupportedField:
+            return self.compile_property(field, model, prefix)
+        column = self.column(prefix + '__'.join(field.source_attrs))
+
+        if isinstance(field, serializers.ModelSerializer):
+            getters = self.compile(field, source.related_model, column + '__')
+
+            def nested(row):
+                if row[column] is None:
+                    return None
+                return {name: getter(row) for name, getter in getters}
+
+            return nested
+
+        if isinstance(field, PictureField):
+            variants = self.column(prefix + 'picture_variants')
+            return lambda row: field.to_representation((FieldFile(None, source, row[column]), row[variants]))
+
+        if isinstance(field, PLAIN_FIELDS) or (isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None):
+            return itemgetter(column)
+        if isinstance(field, (serializers.RelatedField, serializers.FileField)):
+            # their to_representation() needs the related object or the file
+            raise UnsupportedField(field.field_name)
+
+        if isinstance(field, serializers.FloatField):
+            def float_value(row):
+                value = row[column]
+                if value is not None and not exact_float(value):
+                    self.exact_floats = False
+                return value
+
+            return float_value
+
+        represent = field.to_representation
+        if isinstance(field, serializers.DateTimeField) and iso_format(field, api_settings.DATETIME_FORMAT):
+            represent = datetime_representation(field)
+        elif (isinstance(field, serializers.DateField) and iso_format(field, api_settings.DATE_FORMAT)) or \
+                (isinstance(field, serializers.TimeField) and iso_format(field, api_settings.TIME_FORMAT)):
+            represent = methodcaller('isoformat')
+
+        def value(row):
+            value = row[column]
+            return None if value is None else represent(value)
+
+        return value
+
+    def compile_property(self, field, model, prefix):
+        """
+        Computed model properties (seats_left) read from the columns listed in the serializer's field_sources.
+        """
+        name = field.source_attrs[0]
+        sources = getattr(field.parent, 'field_sources', {}).get(field.field_name)
+        prop = getattr(model, name, None)
+        if len(field.source_attrs) != 1 or not sources or not isinstance(prop, property):
+            raise UnsupportedField(field.field_name)
+        columns = {source: self.column(prefix + source) for source in sources}
+
+        def computed(row):
+            value = prop.fget(SimpleNamespace(**{source: row[column] for source, column in columns.items()}))
+            return None if value is None else field.to_representation(value)
+
+        return computed
+
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+
+    def represent(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+def serialize_values(view_set, queryset, serializer_class=None):
+    """
+    serialize_data() for read-only list actions: reads only the needed columns with QuerySet.values()
+    and marks the response for FastJSONRenderer. Serializers with fields that cannot be read from
+    values go through serialize_data().
+    """
+    serializer_class = serializer_class or view_set.get_serializer_class()
+    try:
+        values = ValuesSerializer(serializer_class(context=view_set.get_serializer_context()))
+    except UnsupportedField:
+        return serialize_data(view_set, queryset, serializer_class)
+    # the cursor is read from the rows
+    ordering = getattr(view_set.paginator, 'ordering', None) or ()
+    for name in (ordering,) if isinstance(ordering, str) else ordering:
+        values.column(name.lstrip('-'))
+    queryset = queryset.values(*values.columns)
+    page = view_set.paginate_queryset(queryset)
+    if page is not None:
+        response = view_set.get_paginated_response(values.represent(page))
+    else:
+        response = Response(values.represent(queryset))
+    response.fast_json = values.exact_floats
+    return response
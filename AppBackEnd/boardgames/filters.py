@@ -0,0 +1,23 @@
+from django.db.models import F, Q
+from django_filters import rest_framework as filters
+
+from boardgames.models import Event
+
+
+class EventFilter(filters.FilterSet):
+    # по id, без проверки наличия игры и организатора лишним запросом
+    game = filters.NumberFilter(field_name='game')
+    organizer = filters.NumberFilter(field_name='organizer')
+    has_free_seats = filters.BooleanFilter(method='filter_has_free_seats')
+
+    class Meta:
+        model = Event
+        fields = {
+            'is_active': ['exact'],
+            'city': ['exact'],
+            'date': ['gte', 'lte', ]
+        }
+
+    def filter_has_free_seats(self, queryset, name, value):
+        free = Q(max_players__isnull=True) | Q(accepted_count__lt=F('max_players'))
+        return queryset.filter(free) if value else queryset.exclude(free)
@@ -0,0 +1,36 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from boardgames.models import FriendshipStatus
+
+FRIENDS_CACHE_TIMEOUT = 60 * 60
+
+
+def friends_cache_key(user_id):
+    return 'friends:%d' % int(user_id)
+
+
+def get_friend_ids(user_id):
+    """
+    Ids of accepted friends of the user. Both directions of FriendshipStatus
+    are resolved in one query and the result is cached per user.
+    """
+    user_id = int(user_id)
+    key = friends_cache_key(user_id)
+    friend_ids = cache.get(key)
+    if friend_ids is None:
+        pairs = FriendshipStatus.objects.filter(Q(user1=user_id) | Q(user2=user_id), isAccepted=True) \
+            .values_list('user1', 'user2')
+        friend_ids = sorted({user2 if user1 == user_id else user1 for user1, user2 in pairs})
+        cache.set(key, friend_ids, FRIENDS_CACHE_TIMEOUT)
+    return friend_ids
+
+
+def invalidate_friends(*user_ids):
+    """
+    Drop the cached friend lists once the current transaction commits, so a concurrent
+    get_friend_ids() cannot cache the list from before the change.
+    """
+    keys = [friends_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,157 @@
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.utils.module_loading import import_string
+
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """
+    Height and width of a geohash cell in degrees.
+    """
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose union covers the circle around the point: the cell of
+    the point and its eight neighbours at the finest precision still wider than the radius.
+    """
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lon_size = cell_size(candidate)
+        height_km = math.radians(lat_size) * EARTH_RADIUS_KM
+        width_km = math.radians(lon_size) * EARTH_RADIUS_KM * math.cos(math.radians(latitude))
+        if min(height_km, width_km) >= radius_km:
+            precision = candidate
+            break
+    lat_size, lon_size = cell_size(precision)
+    cells = set()
+    for d_lat in (-lat_size, 0, lat_size):
+        for d_lon in (-lon_size, 0, lon_size):
+            lat = max(min(latitude + d_lat, 90.0), -90.0)
+            lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(lat, lon, precision))
+    return sorted(cells)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    ((min_lat, max_lat), [(min_lon, max_lon), ...]) around the circle; the longitudes are split
+    in two ranges across the antimeridian and cover everything when the circle reaches a pole.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - d_lat, latitude + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return (max(min_lat, -90.0), min(max_lat, 90.0)), [(-180.0, 180.0)]
+    d_lon = math.degrees(math.asin(min(math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)), 1)))
+    min_lon, max_lon = longitude - d_lon, longitude + d_lon
+    if min_lon < -180:
+        return (min_lat, max_lat), [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return (min_lat, max_lat), [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return (min_lat, max_lat), [(min_lon, max_lon)]
+
+
+def within(latitude, longitude, radius_km):
+    """
+    Filter for the rows with a geohash and coordinates that may lie within the circle:
+    the covering cells narrowed down to the bounding box.
+    """
+    cells = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        cells |= Q(geohash__startswith=cell)
+    lat_range, lon_ranges = bounding_box(latitude, longitude, radius_km)
+    longitudes = Q()
+    for lon_range in lon_ranges:
+        longitudes |= Q(longitude__range=lon_range)
+    return cells & Q(latitude__range=lat_range) & longitudes
+
+
+def approximate_distance(latitude, longitude):
+    """
+    Expression ordering rows by the equirectangular distance to the point (squared degrees of
+    latitude), close to the great-circle order within the radii used for nearby searches.
+    """
+    d_lon = Case(
+        When(longitude__gt=longitude + 180, then=F('longitude') - (longitude + 360)),
+        When(longitude__lt=longitude - 180, then=F('longitude') - (longitude - 360)),
+        default=F('longitude') - longitude,
+        output_field=FloatField(),
+    )
+    d_lat = F('latitude') - latitude
+    scale = Value(math.cos(math.radians(latitude)) ** 2, output_field=FloatField())
+    return d_lat * d_lat + d_lon * d_lon * scale
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class Geocoder:
+    def geocode(self, city, address):
+        """
+        Return (latitude, longitude) for the address or None if it cannot be resolved.
+        """
+        raise NotImplementedError
+
+
+class OfflineGeocoder(Geocoder):
+    """
+    Resolves only the city, to its centre, from a built-in table. Used in development and tests.
+    """
+    CITIES = {
+        'москва': (55.7558, 37.6173),
+        'санкт-петербург': (59.9343, 30.3351),
+        'новосибирск': (55.0084, 82.9357),
+        'екатеринбург': (56.8389, 60.6057),
+        'казань': (55.7887, 49.1221),
+        'нижний новгород': (56.2965, 43.9361),
+        'челябинск': (55.1644, 61.4368),
+        'самара': (53.1959, 50.1002),
+        'омск': (54.9885, 73.3242),
+        'ростов-на-дону': (47.2357, 39.7015),
+        'уфа': (54.7388, 55.9721),
+        'красноярск': (56.0153, 92.8932),
+        'пермь': (58.0105, 56.2502),
+        'воронеж': (51.6720, 39.1843),
+        'волгоград': (48.7080, 44.5133),
+    }
+
+    def geocode(self, city, address):
+        return self.CITIES.get((city or '').strip().lower())
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    return import_string(settings.EVENT_GEOCODER)()
@@ -0,0 +1,85 @@
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from boardgames.tasks import enqueue, task
+
+PICTURE_SIZES = (64, 128, 512)
+PICTURE_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+PICTURE_QUALITY = 82
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:20]
+
+
+def picture_upload_to(instance, filename):
+    """
+    Content-hashed name (avatars/ab/ab12....jpg), so uploaded files and their variants
+    never change under the same URL and can be cached forever.
+    """
+    digest = content_hash(instance.profilePicture.file)
+    extension = os.path.splitext(filename)[1].lower() or '.jpg'
+    return 'avatars/%s/%s%s' % (digest[:2], digest, extension)
+
+
+def variant_name(source, size, file_format):
+    return '%s_%d.%s' % (os.path.splitext(source)[0], size, file_format)
+
+
+def make_variants(source):
+    """
+    Resize the stored picture to every PICTURE_SIZES square in every PICTURE_FORMATS
+    and return {'source': name, '64': {'webp': name, 'jpeg': name}, ...}.
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(source, 'rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    variants = {'source': source}
+    for size in PICTURE_SIZES:
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS) if min(image.size) > size else image
+        variants[str(size)] = {}
+        for file_format, pil_format in PICTURE_FORMATS.items():
+            name = variant_name(source, size, file_format)
+            if not default_storage.exists(name):
+                output = io.BytesIO()
+                converted = resized.convert('RGB') if pil_format == 'JPEG' else resized
+                converted.save(output, pil_format, quality=PICTURE_QUALITY, optimize=True)
+                default_storage.save(name, ContentFile(output.getvalue()))
+            variants[str(size)][file_format] = name
+    return variants
+
+
+def process_picture(profile_id, source):
+    from boardgames.caching import invalidate_on_commit, profile_namespaces
+    from boardgames.models import Profile
+
+    variants = make_variants(source)
+    # a newer upload may have replaced the picture in the meantime
+    if Profile.objects.filter(pk=profile_id, profilePicture=source).update(picture_variants=variants):
+        invalidate_on_commit(*profile_namespaces(profile_id))
+
+
+@task('process_picture')
+def process_picture_task(task, profile_id, source):
+    process_picture(profile_id, source)
+
+
+def schedule_picture_processing(profile_id, source):
+    """
+    Resize in the task worker instead of the request; queued in the transaction that saved the upload.
+    """
+    enqueue('process_picture', {'profile_id': profile_id, 'source': source},
+            key='process_picture:%s:%s' % (profile_id, source))
@@ -1,43 +1,123 @@
-from rest_framework.authentication import get_authorization_header, BaseAuthentication
-from rest_framework import exceptions
-
-import jwt
+import math
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-
-from boardgames.models import Profile
-
-
-class JWTAuthentication(BaseAuthentication):
-
-    def authenticate(self, request):
-
-        authHeader = get_authorization_header(request)
-
-        authData = authHeader.decode('utf-8')
-
-        authToken = authData.split(' ')
-
-        if len(authToken) != 2:
-            raise exceptions.AuthenticationFailed('Token not valid')
-
-        token = authToken[1]
-
-
+from django.core.cache import cache
+from django.core import checks
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication as SimpleJWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from boardgames.models import ClaimsProfile, Profile
+
+# claims added by CustomTokenObtainPairSerializer.get_token, auth_time is the login time
+PRINCIPAL_CLAIMS = Profile.TOKEN_CLAIM_FIELDS
+AUTH_TIME_CLAIM = 'auth_time'
+
+
+def _valid_after_key(user_id):
+    return 'auth:valid_after:%s' % user_id
+
+
+def load_valid_after(user_id):
+    rows = list(Profile.objects.filter(pk=user_id).values_list('tokens_valid_after', flat=True))
+    if not rows:
+        # deleted profile
+        return math.inf
+    return rows[0].timestamp() if rows[0] is not None else 0
+
+
+def tokens_valid_after(user_id):
+    """
+    Login time before which the user's tokens are rejected: Profile.tokens_valid_after cached for
+    AUTH_REVOCATION_CACHE_SECONDS. With a per-process cache other processes see a revocation after
+    that time at the latest, a shared cache sees it at once.
+    """
+    key = _valid_after_key(user_id)
+    valid_after = cache.get(key)
+    if valid_after is None:
+        valid_after = load_valid_after(user_id)
+        cache.set(key, valid_after, settings.AUTH_REVOCATION_CACHE_SECONDS)
+    return valid_after
+
+
+async def atokens_valid_after(user_id):
+    key = _valid_after_key(user_id)
+    valid_after = await cache.aget(key)
+    if valid_after is None:
+        valid_after = await sync_to_async(load_valid_after)(user_id)
+        await cache.aset(key, valid_after, settings.AUTH_REVOCATION_CACHE_SECONDS)
+    return valid_after
+
+
+def forget_revocations(*user_ids):
+    """
+    Drop the cached revocation times once the current transaction commits, so they are read again.
+    """
+    keys = [_valid_after_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def is_revoked(payload, valid_after):
+    # tokens from before auth_time was added count as issued at the epoch
+    return payload.get(AUTH_TIME_CLAIM, 0) < valid_after
+
+
+@checks.register(checks.Tags.security, deploy=True)
+def check_revocation_cache(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [checks.Warning('Token revocations reach other processes only after AUTH_REVOCATION_CACHE_SECONDS '
+                           'with a per-process cache', hint='Set REDIS_URL to share the cache.', id='boardgames.W001')]
+
+
+class JWTAuthentication(SimpleJWTAuthentication):
+    """
+    Authenticates without querying Profile: request.user is a ClaimsProfile built
+    from the token claims, which loads the remaining columns only when a view reads them.
+    Tokens issued without the claims fall back to the usual lookup.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        if not self.has_principal_claims(validated_token):
+            return super().get_user(validated_token)
+        return self.user_from_claims(user_id, validated_token, tokens_valid_after(user_id))
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views: token checks are CPU only and the revocation
+        flag is read from the cache without blocking the event loop.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return await self.aauthenticate_token(raw_token)
+
+    async def aauthenticate_token(self, raw_token):
+        validated_token = self.get_validated_token(raw_token)
+        user_id = self.get_user_id(validated_token)
+        if not self.has_principal_claims(validated_token):
+            return await sync_to_async(super().get_user)(validated_token), validated_token
+        return self.user_from_claims(user_id, validated_token, await atokens_valid_after(user_id)), validated_token
+
+    def get_user_id(self, validated_token):
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms='HS256')
-
-            username = payload['username']
-
-            user = Profile.objects.get(username=username)
-
-            return user, token
-
-        except jwt.ExpiredSignatureError as ex:
-            raise exceptions.AuthenticationFailed('Token is expired, login again')
-
-        except jwt.DecodeError as ex:
-            raise exceptions.AuthenticationFailed('Token is invalid')
-
-        except "Profile".DoesNotExist as no_user:
-            raise exceptions.AuthenticationFailed('No such user')
\ No newline at end of file
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def has_principal_claims(self, validated_token):
+        return all(claim in validated_token for claim in (*PRINCIPAL_CLAIMS, AUTH_TIME_CLAIM))
+
+    def user_from_claims(self, user_id, validated_token, valid_after):
+        if is_revoked(validated_token, valid_after):
+            raise AuthenticationFailed(_('Token was revoked, log in again'), code='token_revoked')
+        if not validated_token['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return ClaimsProfile.from_claims(user_id, {claim: validated_token[claim] for claim in PRINCIPAL_CLAIMS})
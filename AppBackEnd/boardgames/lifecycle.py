@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from boardgames.caching import invalidate
+from boardgames.models import ArchivedEvent, ArchivedParticipationRequest, Event, ParticipationRequest
+
+SWEEP_BATCH_SIZE = 1000
+
+ARCHIVED_EVENT_FIELDS = ('id', 'name', 'address', 'city', 'date', 'time', 'description', 'max_players',
+                         'accepted_count', 'game_id', 'organizer_id')
+ARCHIVED_REQUEST_FIELDS = ('id', 'event_id', 'user_id', 'message', 'is_accepted', 'answer', 'is_handled')
+
+
+def started_before(moment):
+    """
+    Events whose date and time (stored in local time) are not later than moment.
+    """
+    moment = timezone.localtime(moment)
+    return Q(date__lt=moment.date()) | Q(date=moment.date(), time__lte=moment.time())
+
+
+def deactivate_past_events(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """
+    Set is_active=False on every active event that has started, one bounded UPDATE per batch,
+    so the sweep never holds many row locks or a long transaction. Returns the number of events.
+    """
+    past = started_before(now or timezone.now())
+    deactivated = 0
+    while True:
+        ids = list(Event.objects.filter(past, is_active=True).order_by('date', 'time')
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deactivated
+        with transaction.atomic():
+            deactivated += Event.objects.filter(pk__in=ids, is_active=True) \
+                .update(is_active=False, updated_at=timezone.now())
+            transaction.on_commit(lambda ids=ids: invalidate('events', *('event:%s' % pk for pk in ids)))
+
+
+def archive_events(older_than_days, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Move inactive events older than older_than_days, with all their participation requests,
+    to the archive tables. Returns the number of archived events.
+    """
+    cutoff = timezone.localdate() - timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            events = list(Event.objects.select_for_update(skip_locked=True)
+                          .filter(is_active=False, date__lt=cutoff).order_by('date', 'time')
+                          .only(*ARCHIVED_EVENT_FIELDS)[:batch_size])
+            if not events:
+                return archived
+            ids = [event.pk for event in events]
+            requests = ParticipationRequest.objects.filter(event__in=ids).only(*ARCHIVED_REQUEST_FIELDS)
+            ArchivedParticipationRequest.objects.bulk_create(
+                [ArchivedParticipationRequest(**{field: getattr(request, field) for field in ARCHIVED_REQUEST_FIELDS})
+                 for request in requests.iterator()], batch_size=batch_size, ignore_conflicts=True)
+            ArchivedEvent.objects.bulk_create(
+                [ArchivedEvent(**{field: getattr(event, field) for field in ARCHIVED_EVENT_FIELDS})
+                 for event in events], ignore_conflicts=True)
+            # the requests go by cascade, after the pre_delete signal of the events has recorded the sync tombstones
+            Event.objects.filter(pk__in=ids).delete()
+        archived += len(events)
@@ -0,0 +1,75 @@
+import http.client
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class LoadResult:
+    def __init__(self, label, latencies_ms, errors, elapsed):
+        self.label = label
+        self.latencies_ms = sorted(latencies_ms)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'requests': len(self.latencies_ms),
+            'errors': self.errors,
+            'throughput': round(len(self.latencies_ms) / self.elapsed, 1) if self.elapsed else 0,
+            'p50_ms': round(percentile(self.latencies_ms, 0.5), 2),
+            'p95_ms': round(percentile(self.latencies_ms, 0.95), 2),
+            'p99_ms': round(percentile(self.latencies_ms, 0.99), 2),
+        }
+
+
+def run(label, base_url, paths, concurrency=32, duration=30.0, headers=None, timeout=10.0):
+    """
+    Closed-loop load: `concurrency` clients, each with its own keep-alive connection,
+    request the paths round-robin for `duration` seconds. Only 2xx/3xx answers count
+    towards the latency percentiles, everything else is an error.
+    """
+    target = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+    prefix = target.path.rstrip('/')
+    headers = dict(headers or {})
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        connection = connection_class(target.netloc, timeout=timeout)
+        local_latencies, local_errors = [], 0
+        for path in itertools.islice(itertools.cycle(paths), offset, None):
+            if time.perf_counter() >= deadline:
+                break
+            started = time.perf_counter()
+            try:
+                connection.request('GET', prefix + path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status < 400:
+                    local_latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = connection_class(target.netloc, timeout=timeout)
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return LoadResult(label, latencies, errors[0], time.perf_counter() - started)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from boardgames.caching import invalidate
+from boardgames.models import Event, Game, GameScoreAggregate, UserScore
+
+LEGACY_COLUMNS = ('game_name', 'game_thumbnail')
+
+
+class Command(BaseCommand):
+    help = 'Adds a catalog row for every game id used by events and scores that is not in the catalog, named ' \
+           'from the game_name and game_thumbnail columns events had before the catalog. Run it on databases ' \
+           'from before the catalog, before the game foreign keys are added and the legacy columns dropped; ' \
+           'import_bgg_catalog fills in the rest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        games = {}
+        for game_id, name, thumbnail in self.event_games():
+            # the latest event wins, like the latest import
+            games[game_id] = (name or '')[:Game._meta.get_field('name').max_length], \
+                (thumbnail or '')[:Game._meta.get_field('thumbnail').max_length]
+        for model in (UserScore, GameScoreAggregate):
+            for game_id in model.objects.values_list('game', flat=True).distinct().iterator():
+                games.setdefault(game_id, ('', ''))
+        existing = set(Game.objects.filter(pk__in=list(games)).values_list('pk', flat=True))
+        missing = [Game(pk=game_id, name=name, thumbnail=thumbnail)
+                   for game_id, (name, thumbnail) in sorted(games.items()) if game_id not in existing]
+        Game.objects.bulk_create(missing, batch_size=options['batch_size'], ignore_conflicts=True)
+        if missing:
+            invalidate('games')
+        self.stdout.write(self.style.SUCCESS('Added %d of %d games in use to the catalog' % (len(missing), len(games))))
+
+    @staticmethod
+    def event_games():
+        """
+        (game id, name, thumbnail) of every event, from the legacy columns while the table still has them.
+        """
+        table, quote = Event._meta.db_table, connection.ops.quote_name
+        with connection.cursor() as cursor:
+            columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+            legacy = ', '.join(map(quote, LEGACY_COLUMNS)) if set(LEGACY_COLUMNS) <= columns else 'NULL, NULL'
+            cursor.execute('SELECT %s, %s FROM %s ORDER BY %s' % (
+                quote(Event._meta.get_field('game').column), legacy, quote(table), quote(Event._meta.pk.column)))
+            yield from cursor
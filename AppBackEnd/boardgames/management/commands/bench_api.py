@@ -0,0 +1,231 @@
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from boardgames.loadtest import LoadResult
+from boardgames.models import Event, GameScoreAggregate, ParticipationRequest, Profile
+from boardgames.participation import PENDING, move_request, request_state
+from boardgames.seeding import SEED_DOMAIN
+from boardgames.serializers import CustomTokenObtainPairSerializer
+
+BENCH_USER_EMAIL = 'bench-api-%d@' + SEED_DOMAIN
+
+
+class Scenarios:
+    """
+    Requests of the benchmarked endpoints, built from a sample of the seeded data. A scenario
+    returns (method, path, data, user id, cleanup); cleanup runs outside the measurement and
+    undoes a write, so repeated runs see the same data.
+    """
+
+    def __init__(self, concurrency, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = {}
+        seeded = Profile.objects.filter(email__endswith='@' + SEED_DOMAIN)
+        self.user_ids = list(seeded.order_by('pk').values_list('pk', flat=True)[:1000])
+        today = date.today()
+        upcoming = Event.objects.filter(is_active=True, date__gte=today).order_by('date', 'time', 'id')
+        self.event_ids = list(upcoming.values_list('pk', flat=True)[:1000])
+        self.cities = list(upcoming.values_list('city', flat=True).distinct()[:10])
+        self.game_ids = list(GameScoreAggregate.objects.filter(score_count__gt=0).values_list('game', flat=True)[:1000])
+        self.pending = list(ParticipationRequest.objects.filter(event__in=self.event_ids, is_handled=False)
+                            .values_list('pk', 'event', 'user', 'event__organizer')[:1000])
+        if not (self.user_ids and self.event_ids and self.game_ids and self.pending):
+            raise CommandError('Not enough data to benchmark, run seed_data first')
+        # profiles without requests, one per client thread, so participate never hits "already sent"
+        self.participants = []
+        for number in range(concurrency):
+            email = BENCH_USER_EMAIL % number
+            user, _ = Profile.objects.get_or_create(email=email, defaults={'username': email, 'city': self.cities[0]})
+            ParticipationRequest.objects.filter(user=user).delete()
+            self.participants.append(user.pk)
+
+    def token(self, user_id):
+        with self.lock:
+            if user_id not in self.tokens:
+                user = Profile.objects.get(pk=user_id)
+                self.tokens[user_id] = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+            return self.tokens[user_id]
+
+    def event_list(self, worker):
+        return 'get', '/api/events/', None, self.random.choice(self.user_ids), None
+
+    def event_filter(self, worker):
+        today = date.today()
+        path = '/api/events/?city=%s&is_active=true&date__gte=%s&date__lte=%s&has_free_seats=true' % (
+            self.random.choice(self.cities), today, today + timedelta(days=14))
+        return 'get', path, None, self.random.choice(self.user_ids), None
+
+    def event_search(self, worker):
+        return 'get', '/api/events/?search=Игра', None, self.random.choice(self.user_ids), None
+
+    def friend_list(self, worker):
+        user_id = self.random.choice(self.user_ids)
+        return 'get', '/api/profiles/friendlist/%d/' % user_id, None, user_id, None
+
+    def score_average(self, worker):
+        return 'get', '/api/scores/score/%d/' % self.random.choice(self.game_ids), None, \
+            self.random.choice(self.user_ids), None
+
+    def participate(self, worker):
+        user_id, event_id = self.participants[worker], self.random.choice(self.event_ids)
+
+        def cleanup():
+            with transaction.atomic():
+                request = ParticipationRequest.objects.select_for_update().filter(user=user_id, event=event_id).first()
+                if request is not None:
+                    request.delete()
+                    move_request(event_id, old_state=request_state(request))
+
+        return 'post', '/api/requests/participate/%d/' % event_id, {'message': 'bench'}, user_id, cleanup
+
+    def respond(self, worker):
+        request_id, event_id, user_id, organizer_id = self.random.choice(self.pending)
+
+        def cleanup():
+            with transaction.atomic():
+                request = ParticipationRequest.objects.select_for_update().filter(pk=request_id).first()
+                if request is not None:
+                    old_state = request_state(request)
+                    ParticipationRequest.objects.filter(pk=request_id) \
+                        .update(is_handled=False, is_accepted=False, answer=None, updated_at=timezone.now())
+                    move_request(event_id, old_state, PENDING)
+
+        return 'patch', '/api/requests/respond/%d/%d/' % (event_id, user_id), {'is_accepted': False}, \
+            organizer_id, cleanup
+
+    def all(self):
+        return {
+            'events.list': self.event_list,
+            'events.filter': self.event_filter,
+            'events.search': self.event_search,
+            'profiles.friendlist': self.friend_list,
+            'scores.average': self.score_average,
+            'requests.participate': self.participate,
+            'requests.respond': self.respond,
+        }
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main API endpoints in-process on seeded data (see seed_data): throughput, ' \
+           'p50/p95/p99 latency and queries per request, optionally saved as JSON and compared with an earlier run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run the given scenario')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Client threads; above 1 the requests run concurrently against the database')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Save the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        scenarios = Scenarios(options['concurrency'], options['seed'])
+        available = scenarios.all()
+        names = options['scenarios'] or list(available)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError('Unknown scenarios: %s (available: %s)' % (', '.join(sorted(unknown)),
+                                                                          ', '.join(available)))
+        results = []
+        for name in names:
+            self.stderr.write('Running %s' % name)
+            self.run_scenario(scenarios, available[name], options['warmup'], 1)
+            results.append(self.run_scenario(scenarios, available[name], options['requests'],
+                                             options['concurrency'], name))
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = {result['label']: result for result in json.load(file)['results']}
+        self.print_results(results, baseline)
+
+    def run_scenario(self, scenarios, scenario, count, concurrency, label=None):
+        latencies, queries, errors = [], [], [0]
+        lock = threading.Lock()
+        remaining = iter(range(count))
+
+        def client(worker):
+            api = APIClient()
+            local_latencies, local_queries, local_errors = [], [], 0
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            break
+                    method, path, data, user_id, cleanup = scenario(worker)
+                    api.credentials(HTTP_AUTHORIZATION='Bearer ' + scenarios.token(user_id))
+                    try:
+                        started = time.perf_counter()
+                        response = getattr(api, method)(path, data, format='json')
+                        elapsed = (time.perf_counter() - started) * 1000
+                        if cleanup is not None:
+                            cleanup()
+                    except Exception as error:
+                        # e.g. lock timeouts under concurrency, reported as errors instead of aborting the run
+                        self.stderr.write('%s %s: %r' % (method.upper(), path, error))
+                        local_errors += 1
+                        continue
+                    if response.status_code < 400:
+                        local_latencies.append(elapsed)
+                        local_queries.append(int(response.get('X-Query-Count', 0)))
+                    else:
+                        local_errors += 1
+            finally:
+                if concurrency > 1:
+                    connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                queries.extend(local_queries)
+                errors[0] += local_errors
+
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(client, range(concurrency)))
+        else:
+            client(0)
+        result = LoadResult(label, latencies, errors[0], time.perf_counter() - started).as_dict()
+        result['queries_mean'] = round(statistics.mean(queries), 2) if queries else 0
+        result['queries_max'] = max(queries, default=0)
+        return result
+
+    def print_results(self, results, baseline):
+        self.stdout.write('%-22s %8s %6s %9s %9s %9s %9s %8s' % (
+            'scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for result in results:
+            self.stdout.write('%-22s %8d %6d %9.1f %9.2f %9.2f %9.2f %8.1f' % (
+                result['label'], result['requests'], result['errors'], result['throughput'], result['p50_ms'],
+                result['p95_ms'], result['p99_ms'], result['queries_mean']))
+            before = baseline.get(result['label'])
+            if before is not None:
+                self.stdout.write('%-22s %8s %6s %9s %9s %9s %9s %8s' % (
+                    '  vs baseline', '', '', self.change(before['throughput'], result['throughput']),
+                    self.change(before['p50_ms'], result['p50_ms']), self.change(before['p95_ms'], result['p95_ms']),
+                    self.change(before['p99_ms'], result['p99_ms']),
+                    '%+.1f' % (result['queries_mean'] - before['queries_mean'])))
+
+    @staticmethod
+    def change(before, after):
+        if not before:
+            return '-'
+        return '%+.0f%%' % ((after - before) * 100 / before)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication as SimpleJWTAuthentication
+
+from boardgames.jwt import JWTAuthentication
+from boardgames.models import Profile
+from boardgames.serializers import CustomTokenObtainPairSerializer
+
+BENCH_EMAIL = 'auth@bench.local'
+
+
+class Command(BaseCommand):
+    help = 'Compares per-request authentication overhead of simplejwt and boardgames.jwt.JWTAuthentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        user, created = Profile.objects.get_or_create(email=BENCH_EMAIL, defaults={'username': BENCH_EMAIL})
+        try:
+            token = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+            request = APIRequestFactory().get('/api/events/', HTTP_AUTHORIZATION='Bearer ' + token)
+            for label, backend in (('simplejwt (Profile lookup)', SimpleJWTAuthentication()),
+                                   ('boardgames.jwt (claims)', JWTAuthentication())):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        authenticated_user, _ = backend.authenticate(request)
+                        authenticated_user.pk
+                    elapsed = time.perf_counter() - started
+                self.stdout.write('%s: %.1f us per request, %.2f queries per request' % (
+                    label, elapsed * 1_000_000 / options['requests'], len(queries) / options['requests']))
+        finally:
+            if created:
+                user.delete()
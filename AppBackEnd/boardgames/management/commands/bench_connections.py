@@ -0,0 +1,75 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+
+from boardgames.loadtest import percentile
+
+
+class Command(BaseCommand):
+    help = 'Measures per-request connection setup cost under concurrent load: a new connection per request ' \
+           'against persistent connections (CONN_MAX_AGE) and the psycopg pool when DB_POOL=1 (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per thread')
+        parser.add_argument('--queries', type=int, default=3, help='Queries per request')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Connection setup can only be measured against PostgreSQL')
+        settings_dict = connections.settings['default']
+        modes = []
+        if 'pool' in settings_dict.get('OPTIONS', {}):
+            modes.append(('psycopg pool', {}))
+        else:
+            modes.append(('new connection per request', {'CONN_MAX_AGE': 0}))
+            modes.append(('persistent connections', {'CONN_MAX_AGE': 600}))
+        connects = [0]
+
+        def count_connect(**kwargs):
+            connects[0] += 1
+
+        connection_created.connect(count_connect)
+        connection.close()
+        try:
+            for label, overrides in modes:
+                original = {key: settings_dict.get(key) for key in overrides}
+                settings_dict.update(overrides)
+                connects[0] = 0
+                try:
+                    timings, elapsed = self.load(options['threads'], options['requests'], options['queries'])
+                finally:
+                    settings_dict.update(original)
+                timings.sort()
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                self.stdout.write('  %.0f req/s, mean %.2f ms, p50 %.2f ms, p99 %.2f ms, '
+                                  '%d connects for %d requests' % (
+                                      len(timings) / elapsed, statistics.mean(timings), percentile(timings, 0.5),
+                                      percentile(timings, 0.99), connects[0], len(timings)))
+        finally:
+            connection_created.disconnect(count_connect)
+
+    def load(self, threads, requests, queries):
+        def worker(_):
+            timings = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                # what the request_started and request_finished signals do around every request
+                close_old_connections()
+                with connection.cursor() as cursor:
+                    for _ in range(queries):
+                        cursor.execute('SELECT 1')
+                        cursor.fetchone()
+                close_old_connections()
+                timings.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            return timings
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(worker, range(threads)))
+        return [timing for timings in results for timing in timings], time.perf_counter() - started
@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from boardgames.models import Profile, Event, ParticipationRequest, UserScore, FriendshipStatus, Game
+
+BENCH_DOMAIN = 'bench.local'
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Самара', 'Омск', 'Пермь']
+
+
+class Command(BaseCommand):
+    help = 'Seeds a large data set and compares query plans and latencies of the hot lookups ' \
+           'with and without index scans (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Rows per seeded table')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query when measuring latency')
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows afterwards')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous --keep run')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans can only be compared on PostgreSQL')
+        self.chunk_size = options['chunk_size']
+        if not options['skip_seed']:
+            self.seed(options['rows'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        try:
+            for title, queryset in self.hot_queries():
+                self.stdout.write(self.style.MIGRATE_HEADING(title))
+                for label, use_indexes in (('before (sequential scans)', False), ('after (indexes)', True)):
+                    plan, latency = self.measure(queryset, use_indexes, options['repeat'])
+                    self.stdout.write('  %s: %.2f ms' % (label, latency))
+                    for line in plan.splitlines():
+                        self.stdout.write('    ' + line)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, rows):
+        users_count = max(rows // 100, 10)
+        games_count = 5000
+        self.stdout.write('Seeding %d profiles' % users_count)
+        self.bulk(Profile, (Profile(username='bench%d@%s' % (i, BENCH_DOMAIN), email='bench%d@%s' % (i, BENCH_DOMAIN),
+                                    city=random.choice(CITIES)) for i in range(users_count)))
+        user_ids = list(Profile.objects.filter(email__endswith=BENCH_DOMAIN).values_list('id', flat=True))
+
+        Game.objects.bulk_create([Game(id=game, name='Game %d' % game) for game in range(1, games_count + 1)],
+                                 ignore_conflicts=True)
+
+        self.stdout.write('Seeding %d events' % (rows // 10))
+        today = date.today()
+
+        def events():
+            for i in range(rows // 10):
+                game = random.randint(1, games_count)
+                yield Event(name='Event %d' % i, address='-', city=random.choice(CITIES), max_players=6,
+                            date=today + timedelta(days=random.randint(-365, 365)), time=dt_time(18, 0),
+                            is_active=random.random() < 0.3, game_id=game,
+                            organizer_id=random.choice(user_ids))
+
+        self.bulk(Event, events())
+        event_ids = list(Event.objects.filter(organizer__email__endswith=BENCH_DOMAIN).values_list('id', flat=True))
+
+        self.stdout.write('Seeding %d scores, participation requests and friendships' % rows)
+        per_user = max(rows // len(user_ids), 1)
+
+        def scores():
+            for user_id in user_ids:
+                for game in random.sample(range(1, games_count + 1), min(per_user, games_count)):
+                    yield UserScore(user_id=user_id, game_id=game, score=random.randint(1, 10))
+
+        def requests():
+            for user_id in user_ids:
+                for event_id in random.sample(event_ids, min(per_user, len(event_ids))):
+                    handled = random.random() < 0.5
+                    yield ParticipationRequest(user_id=user_id, event_id=event_id, is_handled=handled,
+                                               is_accepted=handled and random.random() < 0.7)
+
+        def friendships():
+            for user_id in user_ids:
+                for friend_id in random.sample(user_ids, min(per_user, len(user_ids))):
+                    if friend_id != user_id:
+                        yield FriendshipStatus(user1_id=user_id, user2_id=friend_id, isAccepted=random.random() < 0.8)
+
+        self.bulk(UserScore, scores())
+        self.bulk(ParticipationRequest, requests())
+        self.bulk(FriendshipStatus, friendships())
+
+    def bulk(self, model, objects):
+        chunk = []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) >= self.chunk_size:
+                model.objects.bulk_create(chunk, ignore_conflicts=True)
+                chunk = []
+        if chunk:
+            model.objects.bulk_create(chunk, ignore_conflicts=True)
+
+    def hot_queries(self):
+        score = UserScore.objects.filter(user__email__endswith=BENCH_DOMAIN).only('user', 'game').first()
+        request = ParticipationRequest.objects.filter(user__email__endswith=BENCH_DOMAIN).only('event').first()
+        friendship = FriendshipStatus.objects.filter(user1__email__endswith=BENCH_DOMAIN).only('user1').first()
+        if score is None or request is None or friendship is None:
+            raise CommandError('No seeded rows found, run without --skip-seed first')
+        today = date.today()
+        return [
+            ('UserScore(user, game): rate / my_score / delete',
+             UserScore.objects.filter(user=score.user_id, game=score.game_id)),
+            ('UserScore(game): scores_by_games', UserScore.objects.filter(game=score.game_id)),
+            ('ParticipationRequest(event, is_handled): unhandled_requests',
+             ParticipationRequest.objects.filter(event=request.event_id, is_handled=False)),
+            ('ParticipationRequest(event, is_accepted): participators',
+             ParticipationRequest.objects.filter(event=request.event_id, is_accepted=True)),
+            ('FriendshipStatus(user1, isAccepted)',
+             FriendshipStatus.objects.filter(user1=friendship.user1_id, isAccepted=True)),
+            ('FriendshipStatus(user2, isAccepted)',
+             FriendshipStatus.objects.filter(user2=friendship.user1_id, isAccepted=True)),
+            ('Event(city, is_active, date): EventViewSet filters',
+             Event.objects.filter(city=CITIES[0], is_active=True, date__gte=today,
+                                  date__lte=today + timedelta(days=14))),
+        ]
+
+    def measure(self, queryset, use_indexes, repeat):
+        with transaction.atomic():
+            if not use_indexes:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_indexscan = off')
+                    cursor.execute('SET LOCAL enable_bitmapscan = off')
+                    cursor.execute('SET LOCAL enable_indexonlyscan = off')
+            plan = queryset.explain(analyze=True)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset)
+            latency = (time.perf_counter() - started) * 1000 / repeat
+        return plan, latency
+
+    def cleanup(self):
+        self.stdout.write('Removing seeded rows')
+        bench_users = Profile.objects.filter(email__endswith=BENCH_DOMAIN)
+        UserScore.objects.filter(user__in=bench_users).delete()
+        FriendshipStatus.objects.filter(user1__in=bench_users).delete()
+        ParticipationRequest.objects.filter(user__in=bench_users).delete()
+        Event.objects.filter(organizer__in=bench_users).delete()
+        bench_users.delete()
@@ -0,0 +1,92 @@
+import math
+import random
+import statistics
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from boardgames.geo import OfflineGeocoder, distance_km, encode_geohash, within
+from boardgames.models import Event, Game, Profile
+
+BENCH_DOMAIN = 'bench.local'
+
+
+class Command(BaseCommand):
+    help = 'Seeds events around city centres and compares the geohash lookup used by ' \
+           '/api/events/nearby/ with a bounding-box table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=500_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=5.0, help='Search radius in km')
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows afterwards')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous --keep run')
+
+    def handle(self, *args, **options):
+        centres = list(OfflineGeocoder.CITIES.items())
+        if not options['skip_seed']:
+            self.seed(options['events'], centres, options['chunk_size'])
+        points = []
+        for _ in range(options['queries']):
+            _, (lat, lon) = random.choice(centres)
+            points.append((lat + random.gauss(0, 0.1), lon + random.gauss(0, 0.15)))
+        try:
+            radius = options['radius']
+            for label, build in (('table scan (bounding box)', self.scan_queryset),
+                                 ('geohash index', self.indexed_queryset)):
+                timings, found = [], 0
+                for lat, lon in points:
+                    started = time.perf_counter()
+                    rows = [event for event in build(lat, lon, radius)
+                            if distance_km(lat, lon, event.latitude, event.longitude) <= radius]
+                    timings.append((time.perf_counter() - started) * 1000)
+                    found += len(rows)
+                timings.sort()
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                self.stdout.write('  mean %.2f ms, p50 %.2f ms, p95 %.2f ms, %.1f events per query' % (
+                    statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.95)],
+                    found / len(points)))
+                if connection.vendor == 'postgresql':
+                    lat, lon = points[0]
+                    for line in build(lat, lon, radius).explain(analyze=True).splitlines():
+                        self.stdout.write('    ' + line)
+        finally:
+            if not options['keep']:
+                Event.objects.filter(organizer__email__endswith=BENCH_DOMAIN).delete()
+                Profile.objects.filter(email__endswith=BENCH_DOMAIN).delete()
+
+    def seed(self, count, centres, chunk_size):
+        organizer, _ = Profile.objects.get_or_create(email='geo@%s' % BENCH_DOMAIN,
+                                                     defaults={'username': 'geo@%s' % BENCH_DOMAIN})
+        Game.objects.bulk_create([Game(id=1, name='Game 1')], ignore_conflicts=True)
+        today = date.today()
+        self.stdout.write('Seeding %d events' % count)
+        chunk = []
+        for i in range(count):
+            city, (lat, lon) = random.choice(centres)
+            lat, lon = lat + random.gauss(0, 0.1), lon + random.gauss(0, 0.15)
+            chunk.append(Event(name='Event %d' % i, address='-', city=city, latitude=lat, longitude=lon,
+                               geohash=encode_geohash(lat, lon), date=today + timedelta(days=random.randint(-60, 60)),
+                               time=dt_time(18, 0), is_active=True, game_id=1, organizer=organizer))
+            if len(chunk) >= chunk_size:
+                Event.objects.bulk_create(chunk)
+                chunk = []
+        if chunk:
+            Event.objects.bulk_create(chunk)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE boardgames_event')
+
+    def indexed_queryset(self, lat, lon, radius):
+        return Event.objects.filter(within(lat, lon, radius), is_active=True, date__gte=date.today()) \
+            .only('latitude', 'longitude')
+
+    def scan_queryset(self, lat, lon, radius):
+        d_lat = radius / 111.0
+        d_lon = radius / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        return Event.objects.filter(latitude__range=(lat - d_lat, lat + d_lat),
+                                    longitude__range=(lon - d_lon, lon + d_lon),
+                                    is_active=True, date__gte=date.today()).only('latitude', 'longitude')
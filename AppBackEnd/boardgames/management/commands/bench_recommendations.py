@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from scipy import sparse
+
+from boardgames.recommendations import NEIGHBOURS, RECOMMENDATIONS_PER_USER, USER_CHUNK_SIZE, centred_ratings, \
+    game_affinities, game_similarity, incidence, rank_events
+
+
+class Command(BaseCommand):
+    help = 'Times the recommendation pipeline on a synthetic in-memory rating matrix (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--games', type=int, default=10_000)
+        parser.add_argument('--events', type=int, default=20_000)
+        parser.add_argument('--scores-per-user', type=int, default=30)
+        parser.add_argument('--friends-per-user', type=int, default=20)
+        parser.add_argument('--cities', type=int, default=50)
+        parser.add_argument('--scored-users', type=int, default=10_000,
+                            help='Users to score (the rest of the run is extrapolated)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        users, games, n_events = options['users'], options['games'], options['events']
+
+        started = time.perf_counter()
+        # Zipf-like game popularity, scores 1..10 shifted by a per-game quality
+        popularity = 1 / np.arange(1, games + 1) ** 0.8
+        popularity /= popularity.sum()
+        count = users * options['scores_per_user']
+        user_index = np.repeat(np.arange(users), options['scores_per_user'])
+        game_index = rng.choice(games, size=count, p=popularity)
+        quality = rng.normal(0, 1.5, games)
+        scores = np.clip(np.rint(6 + quality[game_index] + rng.normal(0, 1.5, count)), 1, 10)
+        ratings = centred_ratings(user_index, game_index, scores, (users, games))
+        self.report('rating matrix (%d scores)' % ratings.nnz, started)
+
+        started = time.perf_counter()
+        similarity = game_similarity(ratings, NEIGHBOURS)
+        self.report('game similarity (%d pairs)' % similarity.nnz, started)
+
+        game_events = incidence(rng.choice(games, size=n_events, p=popularity), games).T.tocsr()
+        city_events = incidence(rng.integers(0, options['cities'], n_events), options['cities']).T.tocsr()
+        user_cities = incidence(rng.integers(0, options['cities'], users), options['cities'])
+        participation = self.random_links(rng, users, n_events, 3)
+        friends = self.random_links(rng, users, users, options['friends_per_user'])
+
+        scored = min(options['scored_users'], users)
+        started = time.perf_counter()
+        recommended = 0
+        for start in range(0, scored, USER_CHUNK_SIZE):
+            chunk = slice(start, min(start + USER_CHUNK_SIZE, scored))
+            affinity = game_affinities(ratings[chunk], similarity) @ game_events
+            friend_activity = friends[chunk] @ participation
+            same_city = user_cities[chunk] @ city_events
+            rows, _, _ = rank_events(affinity, friend_activity, same_city, participation[chunk],
+                                     RECOMMENDATIONS_PER_USER)
+            recommended += len(rows)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.MIGRATE_HEADING('user scoring'))
+        self.stdout.write('  %d users in %.2f s (%.2f ms per user, %.1f recommendations each), '
+                          '%d users extrapolated to %.1f s' % (
+                              scored, elapsed, elapsed * 1000 / scored, recommended / scored, users,
+                              elapsed * users / scored))
+
+    def random_links(self, rng, rows, columns, per_row):
+        links = sparse.csr_matrix((np.ones(rows * per_row, dtype=np.float32),
+                                   (np.repeat(np.arange(rows), per_row), rng.integers(0, columns, rows * per_row))),
+                                  shape=(rows, columns))
+        links.data = np.minimum(links.data, 1)
+        return links
+
+    def report(self, label, started):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write('  %.2f s' % (time.perf_counter() - started))
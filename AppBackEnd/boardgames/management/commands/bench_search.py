@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from boardgames.models import Profile
+from boardgames.search import PROFILE_SEARCH_VECTOR, search, update_in_batches
+
+BENCH_DOMAIN = 'bench.local'
+FIRST_NAMES = ['Алексей', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Никита', 'Дарья',
+               'Artem', 'Sofia', 'Maxim', 'Polina', 'Egor', 'Alice']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+              'Новиков', 'Федоров', 'Morozov', 'Volkov', 'Alekseev', 'Lebedev', 'Semenov', 'Egorov']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Самара', 'Омск', 'Пермь']
+
+
+class Command(BaseCommand):
+    help = 'Seeds profiles and measures ranked prefix search over the search_vector GIN index (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows afterwards')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous --keep run')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Full-text search requires PostgreSQL')
+        if not options['skip_seed']:
+            self.seed(options['profiles'], options['chunk_size'])
+        terms = []
+        for _ in range(options['queries']):
+            name = random.choice(FIRST_NAMES + LAST_NAMES + CITIES)
+            terms.append(name[:random.randint(2, len(name))])
+        try:
+            timings = []
+            for term in terms:
+                started = time.perf_counter()
+                list(search(Profile.objects.all(), term).values_list('id', flat=True)[:options['limit']])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write('%d ranked prefix queries: mean %.2f ms, p50 %.2f ms, p95 %.2f ms, p99 %.2f ms' % (
+                len(timings), statistics.mean(timings), timings[len(timings) // 2],
+                timings[int(len(timings) * 0.95)], timings[int(len(timings) * 0.99)]))
+            plan = search(Profile.objects.all(), terms[0]).values_list('id', flat=True)[:options['limit']] \
+                .explain(analyze=True)
+            for line in plan.splitlines():
+                self.stdout.write('    ' + line)
+        finally:
+            if not options['keep']:
+                Profile.objects.filter(email__endswith=BENCH_DOMAIN).delete()
+
+    def seed(self, count, chunk_size):
+        self.stdout.write('Seeding %d profiles' % count)
+        chunk = []
+        for i in range(count):
+            email = 'search%d@%s' % (i, BENCH_DOMAIN)
+            chunk.append(Profile(email=email, username=email, first_name=random.choice(FIRST_NAMES),
+                                 last_name=random.choice(LAST_NAMES), city=random.choice(CITIES)))
+            if len(chunk) >= chunk_size:
+                Profile.objects.bulk_create(chunk)
+                chunk = []
+        if chunk:
+            Profile.objects.bulk_create(chunk)
+        update_in_batches(Profile, PROFILE_SEARCH_VECTOR, 50_000,
+                          Profile.objects.filter(email__endswith=BENCH_DOMAIN))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE boardgames_profile')
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from boardgames.fastpath import ValuesSerializer
+from boardgames.models import Event, ParticipationRequest, UserScore
+from boardgames.renderers import FastJSONRenderer, orjson
+from boardgames.serializers import EventListSerializer, ParticipationRequestsSerializer, UserScoresSerializer
+
+PER_ROWS = 10_000
+
+
+class Command(BaseCommand):
+    help = 'Measures list serialization per %d rows on existing data (see seed_data): model instances, serializers ' \
+           'and JSONRenderer before, QuerySet.values() rows, precompiled fields and FastJSONRenderer after; ' \
+           'fails if the two produce different bytes' % PER_ROWS
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=PER_ROWS, help='Rows read per list')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per step, the fastest one is reported')
+        parser.add_argument('--host', default='localhost', help='Host of the absolute picture URLs')
+
+    def lists(self):
+        only = EventListSerializer.only_fields() | {'date', 'time'}
+        return {
+            'events': (Event.objects.only(*only).select_related('organizer', 'game').order_by('date', 'time', 'id'),
+                       EventListSerializer),
+            'scores': (UserScore.objects.order_by('id'), UserScoresSerializer),
+            'requests': (ParticipationRequest.objects.order_by('id'), ParticipationRequestsSerializer),
+        }
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed, FastJSONRenderer falls back to JSONRenderer')
+        request = Request(APIRequestFactory().get('/api/', SERVER_NAME=options['host']))
+        context = {'request': request}
+        self.stdout.write('%-10s %6s %-7s %10s %12s %10s %10s %12s' % (
+            'list', 'rows', 'path', 'fetch ms', 'represent ms', 'render ms', 'total ms', 'rows/s'))
+        mismatches = []
+        for name, (queryset, serializer_class) in self.lists().items():
+            queryset = queryset[:options['rows']]
+            instances = self.measure(lambda: list(queryset.all()), options['repeat'])
+            data = self.measure(lambda: serializer_class(instances[1], many=True, context=context).data,
+                                options['repeat'])
+            content = self.measure(lambda: JSONRenderer().render(data[1]), options['repeat'])
+            count = len(instances[1])
+            if not count:
+                raise CommandError('No %s to serialize, run seed_data first' % name)
+            self.report(name, count, 'before', instances[0], data[0], content[0])
+
+            values = ValuesSerializer(serializer_class(context=context))
+            rows = self.measure(lambda: list(queryset.values(*values.columns)), options['repeat'])
+            fast_data = self.measure(lambda: values.represent(rows[1]), options['repeat'])
+            response = Response()
+            response.fast_json = values.exact_floats
+            renderer = FastJSONRenderer()
+            fast_content = self.measure(lambda: renderer.render(fast_data[1], renderer.media_type,
+                                                                {'response': response}), options['repeat'])
+            self.report(name, count, 'after', rows[0], fast_data[0], fast_content[0])
+            if fast_content[1] != content[1]:
+                mismatches.append(name)
+        if mismatches:
+            raise CommandError('The fast path output differs from the serializers for: %s' % ', '.join(mismatches))
+        self.stdout.write(self.style.SUCCESS('Both paths produce the same bytes'))
+
+    @staticmethod
+    def measure(step, repeat):
+        """
+        (fastest time in ms, result) of repeat runs of step.
+        """
+        best, result = None, None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            result = step()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def report(self, name, count, label, fetch, represent, render):
+        scale = PER_ROWS / count
+        total = fetch + represent + render
+        self.stdout.write('%-10s %6d %-7s %10.1f %12.1f %10.1f %10.1f %12.0f' % (
+            name, PER_ROWS, label, fetch * scale, represent * scale, render * scale, total * scale,
+            count * 1000 / total if total else 0))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from boardgames.recommendations import NEIGHBOURS, RECOMMENDATIONS_PER_USER, build_recommendations, refresh_pending
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the events served by /api/events/recommended/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only refresh users whose scores changed, reusing the stored game similarity')
+        parser.add_argument('--per-user', type=int, default=RECOMMENDATIONS_PER_USER)
+        parser.add_argument('--neighbours', type=int, default=NEIGHBOURS)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['incremental']:
+            users = refresh_pending(per_user=options['per_user'], neighbours=options['neighbours'])
+        else:
+            users = build_recommendations(per_user=options['per_user'], neighbours=options['neighbours'])
+        self.stdout.write(self.style.SUCCESS('Recommendations of %d users built in %.1f s' % (
+            users, time.perf_counter() - started)))
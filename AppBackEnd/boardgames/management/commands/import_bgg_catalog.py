@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boardgames.caching import invalidate
+from boardgames.catalog import import_games, read_csv, read_xml
+from boardgames.models import Event
+from boardgames.search import EVENT_SEARCH_VECTOR, update_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Imports the board game catalog from a local BoardGameGeek dump (CSV or XML API2 items)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'xml'), help='Taken from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in ('csv', 'xml'):
+            raise CommandError('Unknown dump format, pass --format csv or --format xml')
+        reader = read_csv if file_format == 'csv' else read_xml
+        try:
+            created, updated = import_games(reader(path), options['batch_size'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        # game names are part of the event search vector
+        if updated:
+            update_in_batches(Event, EVENT_SEARCH_VECTOR, options['batch_size'],
+                              Event.objects.filter(game__in=updated))
+        invalidate('events', 'event_details', 'games')
+        self.stdout.write(self.style.SUCCESS('Imported %d new games, updated %d' % (created, len(updated))))
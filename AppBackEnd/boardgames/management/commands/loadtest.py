@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from boardgames.loadtest import run
+from boardgames.models import Profile
+from boardgames.serializers import CustomTokenObtainPairSerializer
+
+DEFAULT_PATHS = ['/api/events/', '/api/events/feed/']
+
+
+class Command(BaseCommand):
+    help = 'Compares throughput and latency percentiles of running deployments, e.g. ' \
+           '`gunicorn AppBackEnd.wsgi -w 4` against `uvicorn AppBackEnd.asgi:application --workers 4`: ' \
+           'loadtest --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, help='label=base URL, may be repeated')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, may be repeated (default: %s)' % ', '.join(DEFAULT_PATHS))
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds per target')
+        parser.add_argument('--token', help='Access token sent as Bearer authorization')
+        parser.add_argument('--user', help='Email of a user to issue the access token for instead of --token')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        token = options['token']
+        if token is None and options['user']:
+            user = Profile.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError('No user with email %s' % options['user'])
+            token = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+        if token:
+            headers['Authorization'] = 'Bearer %s' % token
+        targets = []
+        for target in options['target']:
+            label, separator, url = target.partition('=')
+            if not separator:
+                raise CommandError('Targets are given as label=url, got %s' % target)
+            targets.append((label, url))
+        results = []
+        for label, url in targets:
+            self.stderr.write('Loading %s (%s) for %.0f s' % (label, url, options['duration']))
+            results.append(run(label, url, options['paths'] or DEFAULT_PATHS, options['concurrency'],
+                               options['duration'], headers).as_dict())
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('%-12s %10s %8s %10s %10s %10s %10s' % (
+            'target', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for result in results:
+            self.stdout.write('%-12s %10d %8d %10.1f %10.2f %10.2f %10.2f' % (
+                result['label'], result['requests'], result['errors'], result['throughput'], result['p50_ms'],
+                result['p95_ms'], result['p99_ms']))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from boardgames.images import process_picture
+from boardgames.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Makes the resized variants of profile pictures uploaded before the image pipeline ' \
+           'or whose processing failed'
+
+    def handle(self, *args, **options):
+        pending = 0
+        profiles = Profile.objects.exclude(profilePicture='').exclude(profilePicture__isnull=True) \
+            .only('profilePicture', 'picture_variants')
+        for profile in profiles.iterator():
+            if profile.picture_variants.get('source') != profile.profilePicture.name:
+                try:
+                    process_picture(profile.pk, profile.profilePicture.name)
+                except Exception as error:
+                    self.stderr.write('%s: %s' % (profile.profilePicture.name, error))
+                    continue
+                pending += 1
+        self.stdout.write(self.style.SUCCESS('Processed %d pictures' % pending))
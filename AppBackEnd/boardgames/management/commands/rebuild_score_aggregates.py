@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boardgames.aggregates import rebuild_aggregates, verify_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies per-game score aggregates from UserScore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only compare stored aggregates with UserScore')
+        parser.add_argument('--game', type=int, action='append', dest='games', help='Limit to the given game id')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatched = verify_aggregates(options['games'])
+            if mismatched:
+                raise CommandError('Aggregates out of date for games: %s' % ', '.join(map(str, sorted(mismatched))))
+            self.stdout.write(self.style.SUCCESS('All aggregates are consistent'))
+            return
+        count = rebuild_aggregates(options['games'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt aggregates for %d games' % count))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from boardgames.models import Event, Profile
+from boardgames.search import EVENT_SEARCH_VECTOR, PROFILE_SEARCH_VECTOR, update_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the full-text search columns of events and profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50_000)
+
+    def handle(self, *args, **options):
+        for model, vector in ((Event, EVENT_SEARCH_VECTOR), (Profile, PROFILE_SEARCH_VECTOR)):
+            updated = update_in_batches(model, vector, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('Updated %d %s rows' % (updated, model._meta.model_name)))
+
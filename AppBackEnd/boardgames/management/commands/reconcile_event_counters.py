@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from boardgames.caching import invalidate
+from boardgames.models import Event, ParticipationRequest
+
+ACCEPTED = Q(is_accepted=True)
+PENDING = Q(is_accepted=False, is_handled=False)
+
+
+def counted(condition):
+    """
+    Number of the event's participation requests matching condition, for use in an UPDATE.
+    """
+    return Coalesce(Subquery(ParticipationRequest.objects.filter(condition, event=OuterRef('pk')).order_by()
+                             .values('event').annotate(count=Count('pk')).values('count')), 0)
+
+
+class Command(BaseCommand):
+    help = 'Verifies Event.accepted_count and pending_count against ParticipationRequest rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite the counters that are out of date')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        events = Event.objects.only('accepted_count', 'pending_count').annotate(
+            actual_accepted=Count('participation_requests', filter=Q(participation_requests__is_accepted=True)),
+            actual_pending=Count('participation_requests', filter=Q(participation_requests__is_accepted=False,
+                                                                    participation_requests__is_handled=False)),
+        ).order_by('pk')
+        mismatched = [event.pk for event in events.iterator(chunk_size=options['batch_size'])
+                      if (event.accepted_count, event.pending_count) != (event.actual_accepted, event.actual_pending)]
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('All event counters are consistent'))
+            return
+        if not options['fix']:
+            raise CommandError('Counters out of date for events: %s' % ', '.join(map(str, mismatched)))
+        fixed = 0
+        for start in range(0, len(mismatched), options['batch_size']):
+            fixed += self.fix(mismatched[start:start + options['batch_size']])
+        invalidate('events', *('event:%s' % pk for pk in mismatched))
+        self.stdout.write(self.style.SUCCESS('Fixed counters of %d events' % fixed))
+
+    def fix(self, pks):
+        """
+        Recount and overwrite the counters of the events in one UPDATE. The rows are locked first:
+        adjust_counters() of a request changed meanwhile waits for the commit and applies its delta
+        on top of the recount, and a committed one is seen by the UPDATE.
+        """
+        accepted, pending = counted(ACCEPTED), counted(PENDING)
+        with transaction.atomic():
+            list(Event.objects.select_for_update().filter(pk__in=pks).values_list('pk', flat=True))
+            # queryset updates skip auto_now, the sync feed relies on updated_at
+            return Event.objects.filter(~Q(accepted_count=accepted) | ~Q(pending_count=pending), pk__in=pks) \
+                .update(accepted_count=accepted, pending_count=pending, updated_at=timezone.now())
@@ -0,0 +1,78 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from boardgames.lifecycle import archive_events, deactivate_past_events
+from boardgames.recommendations import refresh_pending
+from boardgames.sync import purge_tombstones
+from boardgames.tasks import purge_finished, run_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks (notifications, picture resizing) and periodic jobs ' \
+           '(event sweeps, recommendation refreshes, purging old tasks and sync tombstones) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed per query')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit as soon as the queue is empty')
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='Delete finished tasks older than this many days (0 keeps them)')
+        parser.add_argument('--sweep-every', type=int, default=settings.EVENT_SWEEP_INTERVAL,
+                            help='Seconds between event sweeps (0 disables them)')
+        parser.add_argument('--recommend-every', type=int, default=settings.RECOMMENDATION_REFRESH_INTERVAL,
+                            help='Seconds between refreshes of the recommendations of users whose scores changed '
+                                 '(0 disables them)')
+
+    def periodic_jobs(self, options):
+        """
+        [interval in seconds, name, job] run in the worker loop; jobs are idempotent, so it does not
+        matter if several workers run them.
+        """
+        jobs = []
+        if options['purge_days']:
+            jobs.append([3600, 'purge_finished', lambda: purge_finished(options['purge_days'])])
+        jobs.append([3600, 'purge_tombstones', purge_tombstones])
+        if options['sweep_every']:
+            jobs.append([options['sweep_every'], 'sweep_events', self.sweep_events])
+        if options['recommend_every']:
+            jobs.append([options['recommend_every'], 'refresh_recommendations', refresh_pending])
+        return jobs
+
+    def sweep_events(self):
+        deactivate_past_events()
+        if settings.EVENT_ARCHIVE_AFTER_DAYS:
+            archive_events(settings.EVENT_ARCHIVE_AFTER_DAYS)
+
+    def handle(self, *args, **options):
+        stopping = []
+        # finish the current batch on SIGTERM/SIGINT instead of leaving its tasks to the lease timeout
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.append(True))
+        jobs = self.periodic_jobs(options)
+        last_run = [0.0] * len(jobs)
+        processed = 0
+        while not stopping:
+            close_old_connections()
+            for index, (interval, name, job) in enumerate(jobs):
+                if time.monotonic() - last_run[index] >= interval:
+                    # a failing job is retried at its next interval and must not stop the queue
+                    try:
+                        job()
+                    except Exception:
+                        logger.exception('Periodic job %s failed', name)
+                    last_run[index] = time.monotonic()
+            claimed = run_pending(options['batch_size'])
+            processed += claimed
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        close_old_connections()
+        self.stdout.write(self.style.SUCCESS('Worker stopped after %d tasks' % processed))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from boardgames.seeding import SEED_DOMAIN, SEED_PASSWORD, Seeder, clear
+
+
+class Command(BaseCommand):
+    help = 'Bulk-seeds profiles, a power-law friendship graph, events, participation requests and scores ' \
+           'for benchmarks (profiles get @%s emails and the password %s)' % (SEED_DOMAIN, SEED_PASSWORD)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=10_000)
+        parser.add_argument('--games', type=int, default=2_000)
+        parser.add_argument('--events', type=int, default=20_000)
+        parser.add_argument('--friends', type=int, default=20, help='Mean friendships per profile')
+        parser.add_argument('--requests', type=int, default=8, help='Mean participation requests per event')
+        parser.add_argument('--scores', type=int, default=15, help='Mean scores per profile')
+        parser.add_argument('--days', type=int, default=90, help='Events are spread over this many days around today')
+        parser.add_argument('--chunk-size', type=int, default=10_000, help='Rows per INSERT')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--clear', action='store_true', help='Only delete previously seeded data')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['clear']:
+            clear()
+            self.stdout.write(self.style.SUCCESS('Deleted seeded data in %.1f s' % (time.perf_counter() - started)))
+            return
+        seeder = Seeder(options['chunk_size'], options['seed'], log=self.stdout.write)
+        counts = seeder.seed(options['profiles'], options['games'], options['events'], options['friends'],
+                             options['requests'], options['scores'], options['days'])
+        self.stdout.write(self.style.SUCCESS('Seeded %s in %.1f s' % (
+            ', '.join('%d %s' % (count, model) for model, count in counts.items()), time.perf_counter() - started)))
@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from boardgames.lifecycle import SWEEP_BATCH_SIZE, archive_events, deactivate_past_events
+
+
+class Command(BaseCommand):
+    help = 'Deactivates events that have already started and optionally archives old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help='Events per UPDATE')
+        parser.add_argument('--archive-after', type=int, default=settings.EVENT_ARCHIVE_AFTER_DAYS,
+                            help='Move inactive events older than this many days to the archive tables (0 disables)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deactivated = deactivate_past_events(options['batch_size'])
+        archived = 0
+        if options['archive_after']:
+            archived = archive_events(options['archive_after'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Deactivated %d and archived %d events in %.1f s' % (
+            deactivated, archived, time.perf_counter() - started)))
@@ -1,8 +1,27 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
-class ProfileManager(BaseUserManager):
+class ProfileQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """
+        Updating a column that tokens carry as a claim revokes the tokens of the updated profiles,
+        like Profile.save() does.
+        """
+        if not set(kwargs) & set(self.model.TOKEN_CLAIM_FIELDS):
+            return super().update(**kwargs)
+        from boardgames.jwt import forget_revocations
+
+        kwargs.setdefault('tokens_valid_after', timezone.now())
+        user_ids = list(self.values_list('pk', flat=True))
+        updated = super().update(**kwargs)
+        forget_revocations(*user_ids)
+        return updated
+
+
+class ProfileManager(BaseUserManager.from_queryset(ProfileQuerySet)):
     """
     Custom user model manager where email is the unique identifiers
     for authentication instead of usernames.
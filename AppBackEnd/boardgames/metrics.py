@@ -0,0 +1,72 @@
+import threading
+from collections import defaultdict
+
+TIME_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf'))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_ms = Histogram(TIME_BUCKETS_MS)
+        self.render_ms = Histogram(TIME_BUCKETS_MS)
+        self.total_ms = Histogram(TIME_BUCKETS_MS)
+        self.budget_exceeded = 0
+
+    def as_dict(self):
+        return {
+            'queries': self.queries.as_dict(),
+            'db_ms': self.db_ms.as_dict(),
+            'render_ms': self.render_ms.as_dict(),
+            'total_ms': self.total_ms.as_dict(),
+            'budget_exceeded': self.budget_exceeded,
+        }
+
+
+_lock = threading.Lock()
+_endpoints = defaultdict(EndpointMetrics)
+
+
+def record(endpoint, queries, db_ms, render_ms, total_ms, budget_exceeded=False):
+    with _lock:
+        metrics = _endpoints[endpoint]
+        metrics.queries.observe(queries)
+        metrics.db_ms.observe(db_ms)
+        metrics.render_ms.observe(render_ms)
+        metrics.total_ms.observe(total_ms)
+        if budget_exceeded:
+            metrics.budget_exceeded += 1
+
+
+def snapshot():
+    with _lock:
+        return {endpoint: metrics.as_dict() for endpoint, metrics in sorted(_endpoints.items())}
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
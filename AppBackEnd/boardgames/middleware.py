@@ -0,0 +1,110 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from boardgames import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration_ms += (time.perf_counter() - started) * 1000
+
+
+def resolve_endpoint(view_func, method):
+    """
+    Name of the resolved view and action (e.g. EventViewSet.list) and the query budget declared for it.
+    Viewsets declare budgets as query_budgets = {'list': 2, ...}, other views as query_budget = 2.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return '%s.%s' % (view_func.__module__, view_func.__name__), None
+    actions = getattr(view_func, 'actions', None)
+    if actions is not None:
+        action = actions.get(method.lower(), method.lower())
+        return '%s.%s' % (view_class.__name__, action), getattr(view_class, 'query_budgets', {}).get(action)
+    return '%s.%s' % (view_class.__name__, method.lower()), getattr(view_class, 'query_budget', None)
+
+
+class QueryProfilingMiddleware:
+    """
+    Counts SQL queries and measures DB, render and total time of every resolved view.
+    Results go to the X-Query-Count and Server-Timing headers and to boardgames.metrics.
+    With settings.QUERY_BUDGET_STRICT an endpoint over its declared budget raises QueryBudgetExceeded.
+    Queries of a streaming response body (boardgames.utils.stream_data) run after this and are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with self.start_counting(counter):
+            response = self.get_response(request)
+        return self.process_profile(request, response, counter, started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        # connections belong to threads and the async ORM queries from the request's sync thread
+        stack = await sync_to_async(self.start_counting)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.process_profile(request, response, counter, started)
+
+    def start_counting(self, counter):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def process_profile(self, request, response, counter, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        endpoint = getattr(request, 'profiling_endpoint', None)
+        if endpoint is None:
+            return response
+        render_ms = getattr(request, 'profiling_render_ms', 0)
+        response['X-Query-Count'] = str(counter.count)
+        response['Server-Timing'] = 'db;dur=%.2f, render;dur=%.2f, total;dur=%.2f' % (
+            counter.duration_ms, render_ms, total_ms)
+        budget = request.query_budget
+        exceeded = budget is not None and counter.count > budget
+        metrics.record(endpoint, counter.count, counter.duration_ms, render_ms, total_ms, exceeded)
+        if exceeded:
+            message = '%s ran %d queries, budget is %d' % (endpoint, counter.count, budget)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.profiling_endpoint, request.query_budget = resolve_endpoint(view_func, request.method)
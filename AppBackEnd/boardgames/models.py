@@ -2,8 +2,13 @@ from datetime import datetime, timedelta
 
 import jwt
 from django.contrib.auth.models import User, AbstractUser, PermissionsMixin
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 
+from boardgames.geo import encode_geohash, get_geocoder
+from boardgames.images import picture_upload_to
 from boardgames.managers import ProfileManager
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
@@ -21,12 +26,45 @@ class Profile(AbstractUser, PermissionsMixin):
         ('U', 'Не указан'),
     )
     sex = models.CharField(max_length=1, choices=sexOptions, default='U')
-    profilePicture = models.ImageField(null=True, blank=True)
+    profilePicture = models.ImageField(upload_to=picture_upload_to, null=True, blank=True)
+    # resized copies made by boardgames.images: {'source': name, '64': {'webp': name, 'jpeg': name}, ...}
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     objects = ProfileManager()
     date_of_birth = models.DateField(blank=True, null=True)
     friends = models.ManyToManyField('self', through='FriendshipStatus')
+    search_vector = SearchVectorField(null=True, editable=False)
+    # tokens of logins before this moment are rejected (boardgames.jwt), set when a column they carry changes
+    tokens_valid_after = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # columns copied into the JWT claims, see boardgames.jwt
+    TOKEN_CLAIM_FIELDS = ('email', 'is_active', 'is_staff')
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='profile_search_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_claims()
+        return instance
+
+    def remember_claims(self):
+        self._loaded_claims = {name: self.__dict__[name] for name in self.TOKEN_CLAIM_FIELDS if name in self.__dict__}
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_claims', {})
+        if any(self.__dict__.get(name, value) != value for name, value in loaded.items()):
+            # tokens issued before carry the old values
+            self.tokens_valid_after = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'tokens_valid_after'}
+        super().save(*args, **kwargs)
+        self.remember_claims()
 
     # scores = models.ManyToManyField('Game', through='UserScore')
     def get_full_name(self):
@@ -48,11 +86,77 @@ class Profile(AbstractUser, PermissionsMixin):
         return token
 
 
+class ClaimsProfile(Profile):
+    """
+    Profile built from JWT claims by boardgames.jwt.JWTAuthentication. Columns missing
+    from the token are deferred and all of them are loaded by one query on first access.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, claims):
+        values = dict(claims, id=cls._meta.pk.to_python(user_id))
+        field_names = [field.attname for field in cls._meta.concrete_fields if field.attname in values]
+        return cls.from_db(None, field_names, [values[name] for name in field_names])
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using, fields, **kwargs)
+
+
+class Game(models.Model):
+    """
+    Board game catalog keyed by the BoardGameGeek id, filled by the import_bgg_catalog command.
+    """
+    id = models.PositiveIntegerField(primary_key=True)
+    name = models.CharField(max_length=255)
+    year_published = models.IntegerField(blank=True, null=True)
+    min_players = models.IntegerField(blank=True, null=True)
+    max_players = models.IntegerField(blank=True, null=True)
+    min_play_time = models.IntegerField(blank=True, null=True)
+    max_play_time = models.IntegerField(blank=True, null=True)
+    rating = models.FloatField(blank=True, null=True)
+    thumbnail = models.URLField(max_length=500, blank=True)
+    image = models.URLField(max_length=500, blank=True)
+    description = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_name()
+        return instance
+
+    def remember_name(self):
+        self._loaded_name = self.__dict__.get('name')
+
+    def name_changed(self):
+        """
+        True unless the name is the one loaded from the database; events search by the game name.
+        """
+        return getattr(self, '_loaded_name', None) != self.name
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'name' in update_fields:
+            self.remember_name()
+
+
 class Event(models.Model):
     name = models.CharField(max_length=50)
     address = models.TextField()
     address_additional_info = models.TextField(blank=True, null=True)
     city = models.TextField()
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
     min_play_time = models.IntegerField(blank=True, null=True)
     max_play_time = models.IntegerField(blank=True, null=True)
     min_players = models.IntegerField(blank=True, null=True)
@@ -61,12 +165,66 @@ class Event(models.Model):
     time = models.TimeField()
     description = models.TextField(max_length=400, null=True, blank=True)
     is_active = models.BooleanField(default=True)
-    game = models.IntegerField()
-    game_name = models.TextField()
-    game_thumbnail = models.TextField()
-    # game = models.ForeignKey('Game', on_delete=models.CASCADE, related_name='related_events')
+    accepted_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    game = models.ForeignKey(Game, on_delete=models.PROTECT, related_name='events', db_column='game')
     organizer = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='organized_events')
     potential_participators = models.ManyToManyField(Profile, through='ParticipationRequest')
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='event_search_idx'),
+            models.Index(fields=['organizer', 'updated_at'], name='event_organizer_updated_idx'),
+            models.Index(fields=['city', 'date', 'time'], condition=models.Q(is_active=True),
+                         name='event_active_city_date_idx'),
+            # boardgames.lifecycle finds active events that have already started
+            models.Index(fields=['is_active', 'date', 'time'], name='event_active_date_time_idx'),
+        ]
+
+    LOCATION_FIELDS = ('city', 'address', 'latitude', 'longitude')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_location()
+        return instance
+
+    def remember_location(self):
+        # loaded columns only, deferred ones are not fetched for this
+        self._loaded_location = {name: self.__dict__[name] for name in self.LOCATION_FIELDS if name in self.__dict__}
+
+    def location_moved(self):
+        """
+        True when city or address changed since loading and the coordinates were not set together with them.
+        """
+        loaded = getattr(self, '_loaded_location', {})
+        changed = {name for name, value in loaded.items() if self.__dict__.get(name, value) != value}
+        return bool(changed & {'city', 'address'}) and not changed & {'latitude', 'longitude'}
+
+    def save(self, *args, **kwargs):
+        moved = self.location_moved()
+        if moved or self.latitude is None or self.longitude is None:
+            coordinates = get_geocoder().geocode(self.city, self.address)
+            if coordinates is not None:
+                self.latitude, self.longitude = coordinates
+            elif moved:
+                # the old coordinates belong to the old place
+                self.latitude = self.longitude = None
+        self.geohash = encode_geohash(self.latitude, self.longitude) \
+            if self.latitude is not None and self.longitude is not None else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'city', 'address'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude', 'geohash'}
+        super().save(*args, **kwargs)
+        self.remember_location()
+
+    @property
+    def seats_left(self):
+        if self.max_players is None:
+            return None
+        return max(self.max_players - self.accepted_count, 0)
 
 
 class ParticipationRequest(models.Model):
@@ -76,27 +234,76 @@ class ParticipationRequest(models.Model):
     is_accepted = models.BooleanField(default=False)
     answer = models.TextField(max_length=200, null=True, blank=True)
     is_handled = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event'], name='unique_participation_request'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='request_user_updated_idx'),
+            models.Index(fields=['event', 'updated_at'], name='request_event_updated_idx'),
+            models.Index(fields=['event', 'is_handled'], name='request_event_handled_idx'),
+            models.Index(fields=['event', 'is_accepted'], name='request_event_accepted_idx'),
+        ]
+
+
+class ArchivedEvent(models.Model):
+    """
+    Cold copy of an event removed from the hot table by boardgames.lifecycle.archive_events.
+    References are plain ids, so deleting a profile or a game does not touch the archive.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=50)
+    address = models.TextField()
+    city = models.TextField()
+    date = models.DateField()
+    time = models.TimeField()
+    description = models.TextField(null=True, blank=True)
+    max_players = models.IntegerField(blank=True, null=True)
+    accepted_count = models.PositiveIntegerField(default=0)
+    game_id = models.IntegerField()
+    organizer_id = models.BigIntegerField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
 
 
-# class Game(models.Model):
-#     title = models.CharField(max_length=50)
-#     year = models.IntegerField()
-#     BGGScore = models.DecimalField(max_digits=3, decimal_places=1)
-#     score = models.DecimalField(max_digits=2, decimal_places=2, default=0, blank=True, null=True)
-#     gameTimeMin = models.IntegerField(blank=True, null=True)
-#     gameTimeMax = models.IntegerField(blank=True, null=True)
-#     playersMin = models.IntegerField(blank=True, null=True)
-#     playersMax = models.IntegerField(blank=True, null=True)
-#     description = models.TextField(max_length=3000)
-#     BGGUrl = models.CharField(max_length=100)
-#     pictureUrl = models.CharField(blank=True, max_length=1000, null=True)
+class ArchivedParticipationRequest(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    event_id = models.BigIntegerField(db_index=True)
+    user_id = models.BigIntegerField(db_index=True)
+    message = models.TextField(null=True, blank=True)
+    is_accepted = models.BooleanField(default=False)
+    answer = models.TextField(null=True, blank=True)
+    is_handled = models.BooleanField(default=False)
 
 
 class UserScore(models.Model):
     user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='user_scores')
-    game = models.IntegerField()
-    # game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='game_scores')
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='game_scores', db_column='game')
     score = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'game'], name='unique_user_score'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='score_user_updated_idx'),
+        ]
+
+
+class GameScoreAggregate(models.Model):
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name='score_aggregate',
+                                db_column='game')
+    score_sum = models.BigIntegerField(default=0)
+    score_count = models.IntegerField(default=0)
+    histogram = models.JSONField(default=dict, blank=True)
+
+    @property
+    def average(self):
+        if self.score_count == 0:
+            return None
+        return self.score_sum / self.score_count
 
 
 class FriendshipStatus(models.Model):
@@ -104,3 +311,112 @@ class FriendshipStatus(models.Model):
     user2 = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='user2')
     message = models.TextField(max_length=200, null=True, blank=True)
     isAccepted = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user1', 'isAccepted'], name='friendship_user1_accepted_idx'),
+            models.Index(fields=['user2', 'isAccepted'], name='friendship_user2_accepted_idx'),
+            models.Index(fields=['user1', 'updated_at'], name='friendship_user1_updated_idx'),
+            models.Index(fields=['user2', 'updated_at'], name='friendship_user2_updated_idx'),
+        ]
+
+
+class Tombstone(models.Model):
+    """
+    Deleted row of a synced model, kept for every user whose /api/sync/ feed contained it.
+    user_id is not a foreign key: tombstones are written while profiles are being deleted.
+    """
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'deleted_at'], name='tombstone_user_deleted_idx'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+
+class GameSimilarity(models.Model):
+    game = models.IntegerField()
+    similar_game = models.IntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'similar_game'], name='unique_game_similarity'),
+        ]
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='recommendations')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='recommendations')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event'], name='unique_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score'], name='recommendation_user_score_idx'),
+        ]
+
+
+class RecommendationRefresh(models.Model):
+    user = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True)
+    requested_at = models.DateTimeField(auto_now=True)
+
+
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'pending'), (RUNNING, 'running'), (DONE, 'done'), (FAILED, 'failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # when a pending task may run next; for a running task, when its lease expires
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # tasks with the same key coalesce only while queued: once one is running, a change it may
+            # already have read past queues a new task
+            models.UniqueConstraint(fields=['idempotency_key'], condition=models.Q(status='pending'),
+                                    name='unique_pending_task_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+
+class Notification(models.Model):
+    REQUEST_ANSWERED = 'request_answered'
+    FRIEND_REQUEST = 'friend_request'
+    EVENT_CHANGED = 'event_changed'
+    KINDS = [(REQUEST_ANSWERED, 'request answered'), (FRIEND_REQUEST, 'friend request'),
+             (EVENT_CHANGED, 'event changed')]
+
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=32, choices=KINDS)
+    data = models.JSONField(default=dict, blank=True)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # task that created the notification, so a retried task does not notify twice
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task'], name='unique_task_notification'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='notification_user_id_idx'),
+        ]
@@ -0,0 +1,79 @@
+from django.db.models import Q
+
+from boardgames.db_router import mark_write
+from boardgames.models import Event, FriendshipStatus, Notification, ParticipationRequest
+from boardgames.push import publish
+from boardgames.tasks import enqueue, task
+
+# users notified per INSERT when an event with many participants changes
+FAN_OUT_BATCH_SIZE = 500
+
+
+def notify_requests_answered(event_id, requests):
+    enqueue('notify_requests_answered', {
+        'event_id': event_id,
+        'answers': [[request.user_id, request.is_accepted, request.answer] for request in requests],
+    })
+
+
+def notify_friend_request(friendship):
+    enqueue('notify_friend_request', {'friendship_id': friendship.pk}, key='friend_request:%s' % friendship.pk)
+
+
+def notify_event_changed(event_id):
+    # edits made while the task is still queued are covered by the same notification
+    enqueue('notify_event_changed', {'event_id': event_id}, key='event_changed:%s' % event_id)
+
+
+def _create(task, kind, user_ids, data):
+    Notification.objects.bulk_create([Notification(user_id=user_id, kind=kind, data=data, task_id=task.pk)
+                                      for user_id in user_ids], batch_size=FAN_OUT_BATCH_SIZE, ignore_conflicts=True)
+    mark_write(*user_ids)
+
+
+@task('notify_requests_answered')
+def requests_answered(task, event_id, answers):
+    event = Event.objects.filter(pk=event_id).only('name').first()
+    if event is None:
+        return
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, kind=Notification.REQUEST_ANSWERED, task_id=task.pk,
+                     data={'event': event_id, 'event_name': event.name, 'is_accepted': is_accepted, 'answer': answer})
+        for user_id, is_accepted, answer in answers
+    ], ignore_conflicts=True)
+    mark_write(*(user_id for user_id, _, _ in answers))
+
+
+@task('notify_friend_request')
+def friend_request(task, friendship_id):
+    friendship = FriendshipStatus.objects.filter(pk=friendship_id, isAccepted=False) \
+        .select_related('user1').only('user1__username', 'user2', 'message').first()
+    if friendship is None:
+        return
+    _create(task, Notification.FRIEND_REQUEST, [friendship.user2_id],
+            {'user': friendship.user1_id, 'username': friendship.user1.username, 'message': friendship.message})
+
+
+@task('notify_event_changed')
+def event_changed(task, event_id):
+    event = Event.objects.filter(pk=event_id).only('name', 'date', 'time', 'is_active').first()
+    if event is None:
+        return
+    # participants and everybody still waiting for an answer
+    user_ids = ParticipationRequest.objects.filter(Q(is_accepted=True) | Q(is_handled=False), event=event_id) \
+        .values_list('user', flat=True).iterator()
+    data = {'event': event_id, 'event_name': event.name, 'date': event.date.isoformat(),
+            'time': event.time.isoformat(), 'is_active': event.is_active}
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= FAN_OUT_BATCH_SIZE:
+            _event_changed(task, batch, data)
+            batch = []
+    if batch:
+        _event_changed(task, batch, data)
+
+
+def _event_changed(task, user_ids, data):
+    _create(task, Notification.EVENT_CHANGED, user_ids, data)
+    publish(user_ids, 'event.changed', data)
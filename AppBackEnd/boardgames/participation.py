@@ -0,0 +1,87 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+from boardgames.caching import invalidate
+from boardgames.db_router import mark_write
+from boardgames.models import Event, ParticipationRequest
+from boardgames.notifications import notify_requests_answered
+from boardgames.push import publish
+
+ACCEPTED = 'accepted'
+PENDING = 'pending'
+
+
+def request_state(request):
+    """
+    Which Event counter the request is counted in: accepted, pending or none.
+    """
+    if request.is_accepted:
+        return ACCEPTED
+    if not request.is_handled:
+        return PENDING
+    return None
+
+
+def adjust_counters(event_id, changes):
+    """
+    Apply {state: delta} to the counters of the event with one UPDATE.
+    Must run inside the transaction that changed the requests.
+    """
+    updates = {'%s_count' % state: F('%s_count' % state) + delta for state, delta in changes.items()
+               if state is not None and delta}
+    if not updates:
+        return
+    # queryset updates skip auto_now, the sync feed relies on updated_at
+    Event.objects.filter(pk=event_id).update(updated_at=timezone.now(), **updates)
+    transaction.on_commit(lambda: invalidate('events', 'event:%s' % event_id))
+
+
+def move_request(event_id, old_state=None, new_state=None):
+    if old_state != new_state:
+        adjust_counters(event_id, {old_state: -1, new_state: 1})
+
+
+def apply_decisions(event_id, organizer, decisions):
+    """
+    Answer participation requests of one event in a single transaction.
+    decisions are validated ParticipationDecisionSerializer items. The event row is
+    locked, so concurrent moderation cannot accept more than max_players participants.
+    """
+    by_user = {decision['user_id']: decision for decision in decisions}
+    with transaction.atomic():
+        event = Event.objects.select_for_update().filter(pk=event_id) \
+            .only('organizer', 'max_players', 'accepted_count').first()
+        if event is None:
+            raise Http404
+        if event.organizer_id != organizer.id:
+            raise PermissionDenied("Отвечать на заявки может только организатор")
+        requests = list(ParticipationRequest.objects.filter(event=event_id, user__in=by_user))
+        missing = set(by_user) - {request.user_id for request in requests}
+        if missing:
+            raise ValidationError({'message': "Нет заявок от пользователей: %s" % ', '.join(map(str, sorted(missing)))})
+        changes = Counter()
+        now = timezone.now()
+        for request in requests:
+            decision = by_user[request.user_id]
+            changes[request_state(request)] -= 1
+            request.is_accepted = decision['is_accepted']
+            request.answer = decision.get('answer')
+            request.is_handled = True
+            request.updated_at = now
+            changes[request_state(request)] += 1
+        if event.max_players is not None and event.accepted_count + changes[ACCEPTED] > event.max_players:
+            raise ValidationError({'message': "Недостаточно мест: максимум %d участников" % event.max_players})
+        ParticipationRequest.objects.bulk_update(requests, ['is_accepted', 'answer', 'is_handled', 'updated_at'])
+        adjust_counters(event_id, changes)
+        notify_requests_answered(event.pk, requests)
+        mark_write(*(request.user_id for request in requests))
+        for request in requests:
+            publish([request.user_id], 'request.answered', {
+                'event': event.pk, 'request': request.pk, 'is_accepted': request.is_accepted, 'answer': request.answer})
+        transaction.on_commit(lambda: invalidate('participators:%s' % event_id))
+    return requests
@@ -0,0 +1,15 @@
+from rest_framework import permissions
+
+from boardgames.models import Profile
+
+
+class IsAdminUser(permissions.IsAdminUser):
+    """
+    IsAdminUser with is_staff and is_active read from the database: request.user of a token
+    carries the values the user had when logging in (boardgames.jwt).
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and
+                    Profile.objects.filter(pk=user.pk, is_staff=True, is_active=True).exists())
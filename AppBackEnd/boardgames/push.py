@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# message sent instead of the dropped ones when a client reads slower than it is sent to
+RESYNC = {'event': 'resync', 'data': {}}
+
+
+class Subscription:
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.PUSH_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        # runs in the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        if self.overflowed:
+            self.overflowed = False
+            self.drain()
+            return RESYNC
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class Broker:
+    """
+    Per-user subscriptions of this process. deliver() can be called from any thread,
+    messages are handed to the subscriber's event loop.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def deliver(self, user_ids, message):
+        with self._lock:
+            subscriptions = [subscription for user_id in user_ids
+                             for subscription in self._subscriptions.get(user_id, ())]
+        if not subscriptions:
+            return
+        message = dict(message, id=next(self._ids))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # the loop is closed, its stream is gone
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """
+    Delivers to the subscribers of the publishing process only: enough for one ASGI process and tests.
+    """
+
+    def publish(self, user_ids, message):
+        broker.deliver(user_ids, message)
+
+    async def listen(self):
+        pass
+
+
+class RedisBackend:
+    """
+    Fans messages out to every ASGI process through Redis pub/sub (settings.PUSH_REDIS_URL),
+    each process delivers them to its own subscribers. Needs the redis package.
+    """
+    channel = 'boardgames:push'
+
+    def __init__(self):
+        import redis
+
+        self.url = settings.PUSH_REDIS_URL
+        self.client = redis.Redis.from_url(self.url)
+        self.listener = None
+
+    def publish(self, user_ids, message):
+        self.client.publish(self.channel, json.dumps({'users': list(user_ids), 'message': message}))
+
+    async def listen(self):
+        # one listener per process, started by the first subscriber
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        import redis.asyncio
+
+        while True:
+            try:
+                client = redis.asyncio.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for item in pubsub.listen():
+                        if item['type'] == 'message':
+                            payload = json.loads(item['data'])
+                            broker.deliver(payload['users'], payload['message'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Push listener lost Redis, reconnecting')
+                await asyncio.sleep(1)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.PUSH_BACKEND)()
+
+
+def publish(user_ids, event, data):
+    """
+    Push {event, data} to the streams of the users once the current transaction commits.
+    Push is best effort: clients catch up through /api/sync/ after reconnecting.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids:
+        return
+
+    def send():
+        try:
+            get_backend().publish(user_ids, {'event': event, 'data': data})
+        except Exception:
+            logger.exception('Could not publish %s', event)
+
+    transaction.on_commit(send)
+
+
+def format_event(message):
+    return 'id: %s\nevent: %s\ndata: %s\n\n' % (message.get('id', ''), message['event'],
+                                                json.dumps(message['data'], ensure_ascii=False))
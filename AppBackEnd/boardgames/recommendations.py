@@ -0,0 +1,285 @@
+from collections import Counter
+from datetime import date
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from boardgames.models import Event, FriendshipStatus, GameSimilarity, ParticipationRequest, Profile, \
+    Recommendation, RecommendationRefresh, UserScore
+
+NEIGHBOURS = 50
+RECOMMENDATIONS_PER_USER = 50
+USER_CHUNK_SIZE = 1024
+GAME_CHUNK_SIZE = 1024
+
+# a centred rating of AFFINITY_SCALE points above the user's mean counts as full affinity
+AFFINITY_SCALE = 2.5
+FRIEND_WEIGHT = 0.5
+FRIENDS_FOR_FULL_BOOST = 3
+CITY_WEIGHT = 0.3
+
+
+def centred_ratings(user_index, game_index, scores, shape):
+    """
+    Sparse users x games matrix of scores minus each user's mean score.
+    """
+    ratings = sparse.csr_matrix((np.asarray(scores, dtype=np.float32), (user_index, game_index)), shape=shape)
+    ratings.sum_duplicates()
+    counts = np.diff(ratings.indptr)
+    means = np.asarray(ratings.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    ratings.data -= np.repeat(means, counts).astype(np.float32)
+    return ratings
+
+
+def game_similarity(ratings, neighbours=NEIGHBOURS, chunk_size=GAME_CHUNK_SIZE):
+    """
+    Item-item cosine similarity of the columns of the centred rating matrix,
+    keeping the `neighbours` most similar games with a positive score per game.
+    Works on column blocks so memory stays at chunk_size x games.
+    """
+    n_games = ratings.shape[1]
+    columns = ratings.tocsc()
+    norms = np.sqrt(np.asarray(columns.multiply(columns).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    normalized = (columns @ sparse.diags(1 / norms)).tocsc()
+    normalized_t = normalized.T.tocsr()
+    k = min(neighbours, n_games - 1)
+    rows, cols, values = [], [], []
+    for start in range(0, n_games, chunk_size):
+        block = (normalized_t[start:start + chunk_size] @ normalized).toarray()
+        block_rows = np.arange(block.shape[0])
+        block[block_rows, start + block_rows] = 0
+        if k <= 0:
+            break
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_values = np.take_along_axis(block, top, axis=1)
+        keep = top_values > 0
+        rows.append(np.repeat(start + block_rows, k)[keep.ravel()])
+        cols.append(top[keep])
+        values.append(top_values[keep])
+    if not rows:
+        return sparse.csr_matrix((n_games, n_games), dtype=np.float32)
+    return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(n_games, n_games), dtype=np.float32)
+
+
+def game_affinities(ratings, similarity):
+    """
+    Predicted affinity of users (rows of centred ratings) for the games near the ones they rated,
+    in [-1, 1]: similarity-weighted mean of their centred ratings of the neighbouring games.
+    Sparse users x games, games without rated neighbours are left out.
+    """
+    weighted = (ratings @ similarity).tocsr()
+    rated = ratings.copy()
+    rated.data = np.ones_like(rated.data)
+    # the similarity keeps positive scores only, so every stored weight is positive
+    inverse_weights = (rated @ similarity).tocsr()
+    inverse_weights.data = 1 / inverse_weights.data
+    affinity = weighted.multiply(inverse_weights).tocsr()
+    affinity.data = np.clip(affinity.data / AFFINITY_SCALE, -1, 1)
+    return affinity
+
+
+def incidence(positions, n_columns):
+    """
+    Sparse len(positions) x n_columns matrix with a 1 at (row, positions[row]) for every position >= 0.
+    """
+    positions = np.asarray(positions)
+    rows = np.flatnonzero(positions >= 0)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, positions[rows])),
+                             shape=(len(positions), n_columns))
+
+
+def top_per_row(matrix, k):
+    """
+    (rows, columns, values) of the k largest positive entries of every row of a sparse matrix.
+    """
+    entries = matrix.tocoo()
+    positive = entries.data > 0
+    rows, columns, values = entries.row[positive], entries.col[positive], entries.data[positive]
+    order = np.lexsort((-values, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < k
+    return rows[keep], columns[keep], values[keep]
+
+
+def rank_events(affinity, friend_activity, same_city, excluded, per_user=RECOMMENDATIONS_PER_USER):
+    """
+    Blend game affinity, friend activity and city match (sparse users x events) and return
+    (rows, event positions, scores) of the best positive-scored events per user. Only events
+    with a positive score are ever stored, so memory follows the candidates, not users x events.
+    """
+    friend_boost = friend_activity.tocsr(copy=True)
+    friend_boost.data = np.minimum(friend_boost.data, FRIENDS_FOR_FULL_BOOST) * (FRIEND_WEIGHT / FRIENDS_FOR_FULL_BOOST)
+    scores = (affinity + friend_boost + CITY_WEIGHT * same_city).tocsr()
+    scores = scores - scores.multiply(excluded)
+    return top_per_row(scores, per_user)
+
+
+def _index(ids):
+    return {value: position for position, value in enumerate(ids)}
+
+
+def _load_similarity(game_positions, neighbours=NEIGHBOURS):
+    """
+    Stored similarity between the games of game_positions, the `neighbours` most similar per game.
+    """
+    rows = GameSimilarity.objects.order_by('game', '-score').values_list('game', 'similar_game', 'score')
+    data, kept = [], Counter()
+    for game, similar, score in rows.iterator():
+        if game in game_positions and similar in game_positions and kept[game] < neighbours:
+            kept[game] += 1
+            data.append((game_positions[game], game_positions[similar], score))
+    n_games = len(game_positions)
+    if not data:
+        return sparse.csr_matrix((n_games, n_games), dtype=np.float32)
+    row, col, value = zip(*data)
+    return sparse.csr_matrix((value, (row, col)), shape=(n_games, n_games), dtype=np.float32)
+
+
+def _store_similarity(game_ids, similarity):
+    coo = similarity.tocoo()
+    with transaction.atomic():
+        GameSimilarity.objects.all().delete()
+        GameSimilarity.objects.bulk_create(
+            (GameSimilarity(game=game_ids[row], similar_game=game_ids[col], score=float(value))
+             for row, col, value in zip(coo.row, coo.col, coo.data)), batch_size=5000)
+
+
+def build_recommendations(user_ids=None, rebuild_similarity=True, per_user=RECOMMENDATIONS_PER_USER,
+                          neighbours=NEIGHBOURS):
+    """
+    Precompute Recommendation rows for the given users (all users when None).
+    With rebuild_similarity the game similarity is recomputed from every UserScore and
+    stored, otherwise the stored GameSimilarity is reused (incremental refresh).
+    Returns the number of users processed.
+    """
+    started = timezone.now()
+    scores = UserScore.objects.all()
+    if user_ids is not None and not rebuild_similarity:
+        scores = scores.filter(user__in=user_ids)
+    score_rows = np.array(list(scores.values_list('user', 'game', 'score')), dtype=np.int64).reshape(-1, 3)
+
+    profiles = Profile.objects.filter(is_active=True)
+    if user_ids is not None:
+        profiles = profiles.filter(pk__in=user_ids)
+    profile_rows = list(profiles.values_list('id', 'city'))
+    if not profile_rows:
+        return 0
+    users = np.array([row[0] for row in profile_rows], dtype=np.int64)
+    user_positions = _index(users.tolist())
+
+    if rebuild_similarity:
+        game_ids = np.unique(score_rows[:, 1]).tolist()
+    else:
+        game_ids = sorted(set(GameSimilarity.objects.values_list('game', flat=True).distinct())
+                          | set(score_rows[:, 1].tolist()))
+    game_positions = _index(game_ids)
+
+    if rebuild_similarity:
+        all_users = np.unique(score_rows[:, 0])
+        all_positions = np.searchsorted(all_users, score_rows[:, 0])
+        ratings_all = centred_ratings(all_positions, [game_positions[g] for g in score_rows[:, 1].tolist()],
+                                      score_rows[:, 2], (len(all_users), len(game_ids)))
+        similarity = game_similarity(ratings_all, neighbours)
+        _store_similarity(game_ids, similarity)
+    else:
+        similarity = _load_similarity(game_positions, neighbours)
+
+    own = np.isin(score_rows[:, 0], users)
+    ratings = centred_ratings([user_positions[u] for u in score_rows[own, 0].tolist()],
+                              [game_positions[g] for g in score_rows[own, 1].tolist()],
+                              score_rows[own, 2], (len(users), len(game_ids)))
+
+    events = list(Event.objects.filter(is_active=True, date__gte=date.today())
+                  .values_list('id', 'game', 'city', 'organizer'))
+    if not events:
+        Recommendation.objects.filter(user__in=users.tolist()).delete()
+        if user_ids is None:
+            RecommendationRefresh.objects.filter(requested_at__lte=started).delete()
+        return len(users)
+    event_ids = np.array([event[0] for event in events], dtype=np.int64)
+    event_positions = _index(event_ids.tolist())
+    # games x events, events of games without ratings have no affinity
+    game_events = incidence([game_positions.get(event[1], -1) for event in events], len(game_ids)).T.tocsr()
+
+    cities = {}
+    user_cities = [cities.setdefault((city or '').strip().lower(), len(cities)) if city else -1
+                   for _, city in profile_rows]
+    event_cities = [cities.setdefault((event[2] or '').strip().lower(), len(cities)) for event in events]
+    user_cities = incidence(user_cities, len(cities))
+    city_events = incidence(event_cities, len(cities)).T.tocsr()
+
+    # who takes part in which event: accepted participants and organizers
+    activity_rows = [(event[3], position) for position, event in enumerate(events)]
+    activity_rows += [(user, event_positions[event]) for user, event in ParticipationRequest.objects
+                      .filter(is_accepted=True, event__in=event_ids.tolist()).values_list('user', 'event').iterator()]
+    # events the users already organize or asked to join are not recommended
+    requested = ParticipationRequest.objects.filter(user__in=users.tolist(), event__in=event_ids.tolist()) \
+        .values_list('user', 'event')
+    excluded_rows = [(user_positions[user], event_positions[event]) for user, event in requested.iterator()]
+    excluded_rows += [(user_positions[event[3]], position) for position, event in enumerate(events)
+                      if event[3] in user_positions]
+
+    participant_ids = sorted({user for user, _ in activity_rows})
+    participant_positions = _index(participant_ids)
+    participation = sparse.csr_matrix(
+        (np.ones(len(activity_rows), dtype=np.float32),
+         ([participant_positions[user] for user, _ in activity_rows], [event for _, event in activity_rows])),
+        shape=(len(participant_ids), len(events)))
+    participation.data = np.minimum(participation.data, 1)
+
+    friend_rows = []
+    friendships = FriendshipStatus.objects.filter(isAccepted=True).values_list('user1', 'user2')
+    if user_ids is not None:
+        friendships = friendships.filter(user1__in=users.tolist()) | friendships.filter(user2__in=users.tolist())
+    for user1, user2 in friendships.iterator():
+        for user, friend in ((user1, user2), (user2, user1)):
+            if user in user_positions and friend in participant_positions:
+                friend_rows.append((user_positions[user], participant_positions[friend]))
+    friends = sparse.csr_matrix((np.ones(len(friend_rows), dtype=np.float32),
+                                 ([row for row, _ in friend_rows], [col for _, col in friend_rows])),
+                                shape=(len(users), len(participant_ids)))
+    friends.data = np.minimum(friends.data, 1)
+    excluded = sparse.csr_matrix((np.ones(len(excluded_rows), dtype=np.float32),
+                                  ([row for row, _ in excluded_rows], [col for _, col in excluded_rows])),
+                                 shape=(len(users), len(events)))
+    excluded.data = np.minimum(excluded.data, 1)
+
+    for start in range(0, len(users), USER_CHUNK_SIZE):
+        chunk = slice(start, start + USER_CHUNK_SIZE)
+        affinity = game_affinities(ratings[chunk], similarity) @ game_events
+        friend_activity = friends[chunk] @ participation
+        same_city = user_cities[chunk] @ city_events
+        rows, positions, values = rank_events(affinity, friend_activity, same_city, excluded[chunk], per_user)
+        chunk_users = users[chunk].tolist()
+        with transaction.atomic():
+            Recommendation.objects.filter(user__in=chunk_users).delete()
+            Recommendation.objects.bulk_create(
+                (Recommendation(user_id=chunk_users[row], event_id=int(event_ids[position]), score=float(value))
+                 for row, position, value in zip(rows, positions, values)), batch_size=5000)
+    if user_ids is None:
+        RecommendationRefresh.objects.filter(requested_at__lte=started).delete()
+    return len(users)
+
+
+def refresh_pending(per_user=RECOMMENDATIONS_PER_USER, neighbours=NEIGHBOURS):
+    """
+    Recompute recommendations of users whose scores changed since the last run.
+    """
+    pending = list(RecommendationRefresh.objects.values_list('user', 'requested_at'))
+    if not pending:
+        return 0
+    processed = build_recommendations([user for user, _ in pending], rebuild_similarity=False, per_user=per_user,
+                                      neighbours=neighbours)
+    for user, requested_at in pending:
+        RecommendationRefresh.objects.filter(user=user, requested_at=requested_at).delete()
+    return processed
+
+
+def request_refresh(user_id):
+    if not RecommendationRefresh.objects.filter(user=user_id).update(requested_at=timezone.now()):
+        RecommendationRefresh.objects.bulk_create([RecommendationRefresh(user_id=user_id)], ignore_conflicts=True)
@@ -0,0 +1,48 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ProfilingJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that reports its own time to QueryProfilingMiddleware.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        content = self.encode(data, accepted_media_type, renderer_context or {})
+        request = (renderer_context or {}).get('request')
+        if request is not None:
+            request = getattr(request, '_request', request)
+            request.profiling_render_ms = getattr(request, 'profiling_render_ms', 0) + \
+                (time.perf_counter() - started) * 1000
+        return content
+
+    def encode(self, data, accepted_media_type, renderer_context):
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(ProfilingJSONRenderer):
+    """
+    Encodes responses marked with fast_json (plain values from boardgames.fastpath) with orjson,
+    byte for byte like JSONRenderer. Other responses, indented output and installs without orjson
+    go through JSONRenderer.
+    """
+
+    def encode(self, data, accepted_media_type, renderer_context):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or \
+                not getattr(renderer_context.get('response'), 'fast_json', False) or \
+                self.get_indent(accepted_media_type, renderer_context):
+            return super().encode(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            # integers beyond 64 bits and other values only json.dumps handles
+            return super().encode(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two for JavaScript, orjson leaves them as is
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
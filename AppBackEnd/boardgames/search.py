@@ -0,0 +1,84 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, OuterRef, Subquery
+from rest_framework.filters import BaseFilterBackend
+
+from boardgames.models import Event, Game
+
+# names, cities and game titles are searched as typed, without language stemming
+SEARCH_CONFIG = 'simple'
+
+EVENT_SEARCH_VECTOR = SearchVector('name', weight='A', config=SEARCH_CONFIG) + \
+                      SearchVector(Subquery(Game.objects.filter(pk=OuterRef('game')).values('name')[:1]),
+                                   weight='A', config=SEARCH_CONFIG) + \
+                      SearchVector('city', weight='B', config=SEARCH_CONFIG) + \
+                      SearchVector('description', weight='C', config=SEARCH_CONFIG)
+EVENT_SEARCH_FIELDS = {'name', 'game', 'city', 'description'}
+
+PROFILE_SEARCH_VECTOR = SearchVector('first_name', weight='A', config=SEARCH_CONFIG) + \
+                        SearchVector('last_name', weight='A', config=SEARCH_CONFIG) + \
+                        SearchVector('city', weight='B', config=SEARCH_CONFIG)
+PROFILE_SEARCH_FIELDS = {'first_name', 'last_name', 'city'}
+
+
+def build_search_query(text, prefix=True):
+    """
+    Turn user input into a tsquery matching all words; with prefix=True the
+    last word also matches as a prefix, which is what autocomplete needs.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    if prefix:
+        words[-1] += ':*'
+    return SearchQuery(' & '.join(words), search_type='raw', config=SEARCH_CONFIG)
+
+
+def search(queryset, text, prefix=True):
+    query = build_search_query(text, prefix)
+    if query is None:
+        return queryset.none()
+    return queryset.filter(search_vector=query) \
+        .annotate(rank=SearchRank(F('search_vector'), query)).order_by('-rank', 'id')
+
+
+def update_in_batches(model, vector, batch_size, queryset=None):
+    """
+    Recompute search_vector for the queryset in primary key ranges of batch_size rows.
+    """
+    queryset = model.objects.all() if queryset is None else queryset
+    updated, last_id = 0, 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return updated
+        updated += queryset.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(search_vector=vector)
+        last_id = ids[-1]
+
+
+def update_game_events(game_id, batch_size=1000):
+    """
+    Recompute search_vector of the game's events, which includes the game name.
+    """
+    return update_in_batches(Event, EVENT_SEARCH_VECTOR, batch_size, Event.objects.filter(game=game_id))
+
+
+def update_search_vector(instance, vector, fields, update_fields=None):
+    if update_fields is not None and not fields.intersection(update_fields):
+        return
+    type(instance).objects.filter(pk=instance.pk).update(search_vector=vector)
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Replacement for SearchFilter that matches ?search= against the indexed search_vector column.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        query = build_search_query(text)
+        if query is None:
+            return queryset
+        return queryset.filter(search_vector=query)
@@ -0,0 +1,208 @@
+import itertools
+import random
+from datetime import date, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+
+from boardgames.aggregates import rebuild_aggregates
+from boardgames.caching import invalidate
+from boardgames.geo import encode_geohash
+from boardgames.models import Event, FriendshipStatus, Game, ParticipationRequest, Profile, UserScore
+from boardgames.search import EVENT_SEARCH_VECTOR, PROFILE_SEARCH_VECTOR, update_in_batches
+
+SEED_DOMAIN = 'seed.local'
+SEED_PASSWORD = 'seed-password'
+
+# city: (latitude, longitude), in order of popularity
+CITIES = {
+    'Москва': (55.7558, 37.6173),
+    'Санкт-Петербург': (59.9343, 30.3351),
+    'Новосибирск': (55.0084, 82.9357),
+    'Екатеринбург': (56.8389, 60.6057),
+    'Казань': (55.7963, 49.1088),
+    'Нижний Новгород': (56.2965, 43.9361),
+    'Самара': (53.1959, 50.1002),
+    'Омск': (54.9885, 73.3242),
+    'Пермь': (58.0105, 56.2502),
+    'Воронеж': (51.6720, 39.1843),
+}
+FIRST_NAMES = ['Алексей', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Никита', 'Дарья']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов']
+EVENT_TIMES = [time(hour, minute) for hour in range(11, 22) for minute in (0, 30)]
+
+
+def zipf_weights(count, exponent=1.1):
+    """
+    Cumulative weights of a power law over count items: item 0 is the most popular.
+    """
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Seeder:
+    """
+    Bulk-inserts a realistic data set: popularity of games, cities and users follows a power law,
+    so per-user and per-event row counts are as skewed as in production. Every seeded profile has
+    an @SEED_DOMAIN email, which is what clear() deletes by.
+    """
+
+    def __init__(self, chunk_size=10_000, seed=None, log=None):
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+
+    def bulk(self, model, objects):
+        created = 0
+        for chunk in iter(lambda: list(itertools.islice(objects, self.chunk_size)), []):
+            model.objects.bulk_create(chunk, ignore_conflicts=True)
+            created += len(chunk)
+        return created
+
+    def seed(self, profiles=10_000, games=2_000, events=20_000, friends=20, requests=8, scores=15, days=90):
+        """
+        friends, requests (per event) and scores (per profile) are means, the actual counts are skewed.
+        Returns {model name: rows created}.
+        """
+        counts = {}
+        user_ids = self.seed_profiles(profiles)
+        counts['profile'] = len(user_ids)
+        game_ids = self.seed_games(games)
+        counts['game'] = len(game_ids)
+        counts['friendshipstatus'] = self.seed_friendships(user_ids, friends)
+        counts['event'], counts['participationrequest'] = self.seed_events(user_ids, game_ids, events, requests, days)
+        counts['userscore'] = self.seed_scores(user_ids, game_ids, scores)
+        self.log('Rebuilding score aggregates')
+        rebuild_aggregates()
+        if connection.vendor == 'postgresql':
+            self.log('Rebuilding search vectors')
+            seeded = Profile.objects.filter(email__endswith='@' + SEED_DOMAIN)
+            update_in_batches(Profile, PROFILE_SEARCH_VECTOR, self.chunk_size, seeded)
+            update_in_batches(Event, EVENT_SEARCH_VECTOR, self.chunk_size, Event.objects.filter(organizer__in=seeded))
+        invalidate('events', 'games')
+        return counts
+
+    def seed_profiles(self, count):
+        self.log('Seeding %d profiles' % count)
+        password = make_password(SEED_PASSWORD)
+        city_weights = zipf_weights(len(CITIES))
+        start = Profile.objects.filter(email__endswith='@' + SEED_DOMAIN).count()
+
+        def profiles():
+            for number in range(start, start + count):
+                email = 'user%d@%s' % (number, SEED_DOMAIN)
+                yield Profile(username=email, email=email, password=password,
+                              first_name=self.random.choice(FIRST_NAMES), last_name=self.random.choice(LAST_NAMES),
+                              city=self.random.choices(list(CITIES), cum_weights=city_weights)[0],
+                              sex=self.random.choice('MFU'))
+
+        self.bulk(Profile, profiles())
+        return list(Profile.objects.filter(email__endswith='@' + SEED_DOMAIN).order_by('pk')
+                    .values_list('pk', flat=True))
+
+    def seed_games(self, count):
+        self.log('Seeding %d games' % count)
+        self.bulk(Game, (Game(id=game_id, name='Game %d' % game_id, min_players=2,
+                              max_players=self.random.randint(2, 8), year_published=self.random.randint(1990, 2024))
+                         for game_id in range(1, count + 1)))
+        return list(range(1, count + 1))
+
+    def seed_friendships(self, user_ids, mean_degree):
+        """
+        Preferential attachment: every profile befriends mean_degree / 2 earlier ones, picked in
+        proportion to their current number of friends, which gives a power-law degree distribution.
+        """
+        self.log('Seeding a friendship graph with %d friends per profile on average' % mean_degree)
+        links = max(mean_degree // 2, 1)
+        # every profile appears here once per friendship, so a uniform pick is a pick by degree
+        endpoints = list(user_ids[:links + 1])
+
+        def friendships():
+            for user_id in user_ids[links + 1:]:
+                friends = set()
+                while len(friends) < links:
+                    friends.add(self.random.choice(endpoints))
+                for friend_id in friends:
+                    endpoints.append(friend_id)
+                    endpoints.append(user_id)
+                    user1, user2 = (user_id, friend_id) if self.random.random() < 0.5 else (friend_id, user_id)
+                    yield FriendshipStatus(user1_id=user1, user2_id=user2, isAccepted=self.random.random() < 0.85)
+
+        return self.bulk(FriendshipStatus, friendships())
+
+    def seed_events(self, user_ids, game_ids, count, mean_requests, days):
+        """
+        Events from days ago to days ahead, together with their participation requests, so
+        accepted_count and pending_count match the requests from the start.
+        """
+        self.log('Seeding %d events with %d requests each on average' % (count, mean_requests))
+        city_weights = zipf_weights(len(CITIES))
+        game_weights = zipf_weights(len(game_ids))
+        user_weights = zipf_weights(len(user_ids), exponent=0.8)
+        today = date.today()
+        events_created = requests_created = 0
+        for offset in range(0, count, self.chunk_size):
+            events, planned = [], []
+            for number in range(offset, min(offset + self.chunk_size, count)):
+                city = self.random.choices(list(CITIES), cum_weights=city_weights)[0]
+                latitude, longitude = CITIES[city]
+                latitude += self.random.uniform(-0.15, 0.15)
+                longitude += self.random.uniform(-0.25, 0.25)
+                day = today + timedelta(days=self.random.randint(-days, days))
+                max_players = self.random.randint(3, 10)
+                organizer = self.random.choice(user_ids)
+                requesters = set(self.random.choices(user_ids, cum_weights=user_weights,
+                                                     k=int(self.random.expovariate(1 / mean_requests))))
+                requesters.discard(organizer)
+                states = []
+                for _ in requesters:
+                    handled = day < today or self.random.random() < 0.6
+                    states.append((handled, handled and self.random.random() < 0.7))
+                accepted = 0
+                for index, (handled, is_accepted) in enumerate(states):
+                    if is_accepted and accepted >= max_players:
+                        states[index] = (True, False)
+                    accepted += states[index][1]
+                events.append(Event(
+                    name='Игра %d' % number, address='ул. Тестовая, %d' % self.random.randint(1, 200), city=city,
+                    latitude=latitude, longitude=longitude, geohash=encode_geohash(latitude, longitude),
+                    date=day, time=self.random.choice(EVENT_TIMES), max_players=max_players,
+                    is_active=day >= today, accepted_count=accepted,
+                    pending_count=sum(1 for handled, _ in states if not handled),
+                    game_id=game_ids[self.random.choices(range(len(game_ids)), cum_weights=game_weights)[0]],
+                    organizer_id=organizer))
+                planned.append(zip(requesters, states))
+            Event.objects.bulk_create(events)
+            participation_requests = [
+                ParticipationRequest(event_id=event.pk, user_id=user_id, is_handled=handled, is_accepted=is_accepted)
+                for event, requests in zip(events, planned) for user_id, (handled, is_accepted) in requests]
+            requests_created += self.bulk(ParticipationRequest, iter(participation_requests))
+            events_created += len(events)
+        return events_created, requests_created
+
+    def seed_scores(self, user_ids, game_ids, mean_scores):
+        self.log('Seeding %d scores per profile on average' % mean_scores)
+        game_weights = zipf_weights(len(game_ids))
+
+        def scores():
+            for user_id in user_ids:
+                count = min(int(self.random.expovariate(1 / mean_scores)), len(game_ids))
+                games = set(self.random.choices(game_ids, cum_weights=game_weights, k=count))
+                for game_id in games:
+                    yield UserScore(user_id=user_id, game_id=game_id, score=self.random.randint(1, 10))
+
+        return self.bulk(UserScore, scores())
+
+
+def clear():
+    """
+    Delete everything created by Seeder (games are kept, events may reference them).
+    """
+    seeded = Profile.objects.filter(email__endswith='@' + SEED_DOMAIN)
+    UserScore.objects.filter(user__in=seeded).delete()
+    FriendshipStatus.objects.filter(user1__in=seeded).delete()
+    ParticipationRequest.objects.filter(user__in=seeded).delete()
+    Event.objects.filter(organizer__in=seeded).delete()
+    deleted, _ = seeded.delete()
+    rebuild_aggregates()
+    invalidate('events', 'games')
+    return deleted
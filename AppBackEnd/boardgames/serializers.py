@@ -1,50 +1,187 @@
 from django.contrib.auth.password_validation import validate_password
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from boardgames.catalog import ensure_game
+from boardgames.images import PICTURE_FORMATS
+from boardgames.jwt import AUTH_TIME_CLAIM, is_revoked, tokens_valid_after
+from boardgames.models import Event, Profile, UserScore, FriendshipStatus, ParticipationRequest, Game, Notification
+from boardgames.utils import requested_fields
+
+
+class SparseFieldsMixin:
+    """
+    Limits the representation to ?fields=id,name,date when the request asks for it.
+    nested_only maps nested serializer fields to (relation, serializer) and
+    field_sources maps computed fields to the columns they read, both for only_fields().
+    """
+    nested_only = {}
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def only_fields(cls, requested=None):
+        """
+        Model columns to pass to QuerySet.only() for this serializer (explicit Meta.fields only).
+        """
+        concrete = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        only = {'id'}
+        for name in cls.Meta.fields:
+            if requested is not None and name not in requested:
+                continue
+            if name in cls.field_sources:
+                only.update(cls.field_sources[name])
+            elif name in concrete:
+                only.add(name)
+            elif name in cls.nested_only:
+                relation, serializer_class = cls.nested_only[name]
+                only.add(relation)
+                only.update('%s__%s' % (relation, field) for field in serializer_class.only_fields())
+        return only
+
+
+class PictureField(serializers.ImageField):
+    """
+    Profile picture rendered as the URL of a resized variant: ?picture_size=64|128|512|original
+    and ?picture_format=webp|jpeg, defaulting to default_size and WebP. Falls back to the
+    uploaded file until the variants are made.
+    """
+
+    def __init__(self, default_size, **kwargs):
+        self.default_size = str(default_size)
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance), instance.picture_variants
+
+    def to_representation(self, value):
+        picture, variants = value
+        if not picture:
+            return None
+        request = self.context.get('request')
+        params = request.query_params if request is not None else {}
+        size = params.get('picture_size', self.default_size)
+        file_format = params.get('picture_format', 'webp')
+        if variants.get('source') != picture.name or size not in variants or file_format not in PICTURE_FORMATS:
+            return super().to_representation(picture)
+        url = picture.storage.url(variants[size][file_format])
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class ProfileShortSerializer(SparseFieldsMixin, ModelSerializer):
+    profilePicture = PictureField(default_size=128, read_only=True)
+    field_sources = {'profilePicture': ('profilePicture', 'picture_variants')}
 
-from boardgames.models import Event, Profile, UserScore, FriendshipStatus, ParticipationRequest
+    class Meta:
+        model = Profile
+        fields = ('id', 'first_name', 'last_name', 'city', 'sex', 'profilePicture')
 
 
-class EventsSerializer(ModelSerializer):
+class EventsSerializer(SparseFieldsMixin, ModelSerializer):
+    organizer_info = ProfileShortSerializer(source='organizer', read_only=True)
+    seats_left = serializers.IntegerField(read_only=True)
+    # игра из каталога; название и картинка от клиента нужны только для игр, которых ещё нет в каталоге
+    game = serializers.IntegerField(source='game_id', min_value=1)
+    game_name = serializers.CharField(source='game.name', max_length=255, required=False)
+    game_thumbnail = serializers.CharField(source='game.thumbnail', max_length=500, required=False, allow_blank=True)
+
     class Meta:
         model = Event
         # fields = ('name', 'location', 'playersMin', 'playersMax', 'date', 'time', 'game')
-        fields = '__all__'
-        read_only_fields = ('organizer',)
+        exclude = ('search_vector', 'potential_participators')
+        read_only_fields = ('organizer', 'geohash', 'accepted_count', 'pending_count')
+
+    def create(self, validated_data):
+        self.ensure_game(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self.ensure_game(validated_data)
+        return super().update(instance, validated_data)
 
+    def ensure_game(self, validated_data):
+        details = validated_data.pop('game', {})
+        if 'game_id' in validated_data:
+            ensure_game(validated_data['game_id'], details.get('name'), details.get('thumbnail'))
 
-# class GamesSerializer(ModelSerializer):
-#     class Meta:
-#         model = Game
-#         fields = '__all__'
 
+class EventListSerializer(EventsSerializer):
+    nested_only = {'organizer_info': ('organizer', ProfileShortSerializer)}
+    field_sources = {'seats_left': ('max_players', 'accepted_count'), 'game_name': ('game', 'game__name'),
+                     'game_thumbnail': ('game', 'game__thumbnail')}
+
+    class Meta(EventsSerializer.Meta):
+        exclude = None
+        fields = ('id', 'name', 'city', 'latitude', 'longitude', 'min_play_time', 'max_play_time', 'min_players',
+                  'max_players', 'accepted_count', 'pending_count', 'seats_left', 'date', 'time', 'is_active', 'game',
+                  'game_name', 'game_thumbnail', 'organizer', 'organizer_info')
+
+
+class GamesSerializer(SparseFieldsMixin, ModelSerializer):
+    score_value = serializers.FloatField(source='score_aggregate.average', read_only=True, default=None)
+    score_number = serializers.IntegerField(source='score_aggregate.score_count', read_only=True, default=0)
 
-class ProfilesSerializer(ModelSerializer):
     class Meta:
-        model = Profile
+        model = Game
         fields = '__all__'
 
 
-class UserScoresSerializer(ModelSerializer):
+class ProfilesSerializer(SparseFieldsMixin, ModelSerializer):
+    profilePicture = PictureField(default_size=512, required=False, allow_null=True)
+
+    class Meta:
+        model = Profile
+        exclude = ('search_vector', 'picture_variants', 'password', 'last_login', 'groups', 'user_permissions',
+                   'friends')
+
+
+class UserScoresSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = UserScore
         fields = '__all__'
         read_only_fields = ('user', 'game')
 
 
-class FriendshipStatusesSerializer(ModelSerializer):
+class FriendshipStatusesSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = FriendshipStatus
         fields = '__all__'
         read_only_fields = ('user1', 'user2', 'isAccepted')
 
 
-class ParticipationRequestsSerializer(ModelSerializer):
+class NotificationsSerializer(SparseFieldsMixin, ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ('id', 'kind', 'data', 'is_read', 'created_at')
+
+
+class ParticipationRequestsSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = ParticipationRequest
         fields = '__all__'
-        read_only_fields = ('user', 'event')
+        # the organizer's decision is taken through apply_decisions() only
+        read_only_fields = ('user', 'event', 'is_accepted', 'answer', 'is_handled')
+
+
+class PictureUploadSerializer(serializers.Serializer):
+    picture = serializers.ImageField()
+
+
+class ParticipationDecisionSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    is_accepted = serializers.BooleanField()
+    answer = serializers.CharField(max_length=200, allow_null=True, allow_blank=True, required=False)
 
 
 class RegisterSerializer(ModelSerializer):
@@ -73,7 +210,29 @@ class LoginSerializer(ModelSerializer):
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['email'] = user.email
+        token['is_active'] = user.is_active
+        token['is_staff'] = user.is_staff
+        token[AUTH_TIME_CLAIM] = timezone.now().timestamp()
+        return token
+
     def validate(self, attrs):
         data = super(CustomTokenObtainPairSerializer, self).validate(attrs)
         data.update({'id': self.user.id})
         return data
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refuses refresh tokens issued before the user's tokens were revoked, they would copy the old claims.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is not None and is_revoked(refresh.payload, tokens_valid_after(user_id)):
+            raise AuthenticationFailed(_('Token was revoked, log in again'), code='token_revoked')
+        return super().validate(attrs)
@@ -0,0 +1,171 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from boardgames.caching import invalidate_on_commit, profile_namespaces
+from boardgames.friends import invalidate_friends
+from boardgames.images import schedule_picture_processing
+from boardgames.jwt import forget_revocations
+from boardgames.models import FriendshipStatus, Event, Profile, ParticipationRequest, UserScore, Game
+from boardgames.recommendations import request_refresh
+from boardgames.search import update_search_vector, update_game_events, EVENT_SEARCH_VECTOR, EVENT_SEARCH_FIELDS, \
+    PROFILE_SEARCH_VECTOR, PROFILE_SEARCH_FIELDS
+from boardgames.serializers import ProfileShortSerializer
+from boardgames.sync import record_deletion, record_deletions
+
+
+@receiver([post_save, post_delete], sender=FriendshipStatus)
+def friendship_changed(sender, instance, **kwargs):
+    invalidate_friends(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, update_fields=None, **kwargs):
+    update_search_vector(instance, EVENT_SEARCH_VECTOR, EVENT_SEARCH_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=Game)
+def game_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields) or not instance.name_changed():
+        return
+    update_game_events(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, update_fields=None, **kwargs):
+    update_search_vector(instance, PROFILE_SEARCH_VECTOR, PROFILE_SEARCH_FIELDS, update_fields)
+
+
+@receiver([post_save, post_delete], sender=Event)
+def event_changed(sender, instance, **kwargs):
+    invalidate_on_commit('events', 'event:%s' % instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Game)
+def game_changed(sender, instance, **kwargs):
+    # event lists and details embed the game
+    invalidate_on_commit('games', 'events', 'event_details')
+
+
+@receiver([post_save, post_delete], sender=ParticipationRequest)
+def participation_request_changed(sender, instance, **kwargs):
+    invalidate_on_commit('participators:%s' % instance.event_id)
+
+
+@receiver([post_save, post_delete], sender=UserScore)
+def score_changed(sender, instance, **kwargs):
+    # the game list shows the score aggregates too
+    invalidate_on_commit('games', 'game_scores:%s' % instance.game_id)
+
+
+@receiver(post_save, sender=UserScore)
+def score_saved(sender, instance, **kwargs):
+    request_refresh(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or ProfileShortSerializer.only_fields() & set(update_fields):
+        invalidate_on_commit(*profile_namespaces(instance.pk))
+    else:
+        invalidate_on_commit('profile:%s' % instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def profile_claims_changed(sender, instance, update_fields=None, **kwargs):
+    # Profile.save() moves tokens_valid_after when a column copied into the tokens changes
+    if update_fields is None or 'tokens_valid_after' in update_fields:
+        forget_revocations(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def profile_picture_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'profilePicture' not in update_fields:
+        return
+    if {'profilePicture', 'picture_variants'} & instance.get_deferred_fields():
+        return
+    source = instance.profilePicture.name
+    if source and instance.picture_variants.get('source') != source:
+        schedule_picture_processing(instance.pk, source)
+
+
+@receiver(post_delete, sender=Profile)
+def profile_deleted(sender, instance, **kwargs):
+    forget_revocations(instance.pk)
+
+
+def deletion_state(origin):
+    """
+    State shared by the delete signals of one Model.delete() or QuerySet.delete() call, kept on its origin.
+    """
+    state = {'events': set(), 'requests': set(), 'request_rows': None, 'organizers': {}}
+    if origin is None:
+        return state
+    if not hasattr(origin, '_deletion_state'):
+        origin._deletion_state = state
+    return origin._deletion_state
+
+
+def is_queryset_of(origin, model):
+    return isinstance(origin, QuerySet) and origin.model is model
+
+
+@receiver(pre_delete, sender=Event)
+def event_deleting(sender, instance, origin=None, **kwargs):
+    # cascaded requests are deleted before the event, so record them now: pre_delete is sent for every
+    # collected row before anything is deleted. All events of a QuerySet.delete() are recorded at once.
+    state = deletion_state(origin)
+    if instance.pk in state['events']:
+        return
+    if is_queryset_of(origin, Event):
+        organizers = dict(origin.values_list('pk', 'organizer'))
+    else:
+        organizers = {instance.pk: instance.organizer_id}
+    requesters = {event_id: [] for event_id in organizers}
+    deletions = []
+    for event_id, request_id, user_id in ParticipationRequest.objects.filter(event__in=list(organizers)) \
+            .values_list('event', 'pk', 'user'):
+        requesters[event_id].append(user_id)
+        deletions.append(('requests', request_id, [user_id, organizers[event_id]]))
+        state['requests'].add(request_id)
+    deletions.extend(('events', event_id, [organizer_id, *requesters[event_id]])
+                     for event_id, organizer_id in organizers.items())
+    state['events'].update(organizers)
+    record_deletions(deletions)
+
+
+@receiver(pre_delete, sender=ParticipationRequest)
+def participation_request_deleting(sender, instance, origin=None, **kwargs):
+    # the rows of a QuerySet.delete() are read with their organizers once, while they still exist
+    state = deletion_state(origin)
+    if state['request_rows'] is None and is_queryset_of(origin, ParticipationRequest):
+        state['request_rows'] = list(origin.values_list('pk', 'user', 'event', 'event__organizer'))
+
+
+@receiver(post_delete, sender=ParticipationRequest)
+def participation_request_deleted(sender, instance, origin=None, **kwargs):
+    state = deletion_state(origin)
+    if instance.pk in state['requests']:
+        # recorded with its event or with the rest of the QuerySet.delete()
+        return
+    rows = state['request_rows']
+    if rows is None:
+        organizer_id = Event.objects.filter(pk=instance.event_id).values_list('organizer', flat=True).first()
+        rows = [(instance.pk, instance.user_id, instance.event_id, organizer_id)]
+    # the event leaves the requester's feed with the request
+    deletions = []
+    for request_id, user_id, event_id, organizer_id in rows:
+        if request_id not in state['requests']:
+            deletions += [('requests', request_id, [user_id, organizer_id]), ('events', event_id, [user_id])]
+    record_deletions(deletions)
+    state['requests'].update(request_id for request_id, *_ in rows)
+
+
+@receiver(post_delete, sender=FriendshipStatus)
+def friendship_deleted(sender, instance, **kwargs):
+    record_deletion('friendships', instance.pk, [instance.user1_id, instance.user2_id])
+
+
+@receiver(post_delete, sender=UserScore)
+def score_deleted(sender, instance, **kwargs):
+    record_deletion('scores', instance.pk, [instance.user_id])
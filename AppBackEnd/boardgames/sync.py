@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from boardgames.models import Event, FriendshipStatus, ParticipationRequest, Tombstone, UserScore
+from boardgames.serializers import EventsSerializer, FriendshipStatusesSerializer, ParticipationRequestsSerializer, \
+    UserScoresSerializer
+
+
+def encode_token(moment):
+    """
+    Opaque sync token: microseconds since the epoch.
+    """
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_token(token):
+    return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+
+
+def collections(user):
+    """
+    name: (rows of the user's feed, serializer). A user syncs their events and the events they
+    asked to join, their own requests and the requests to their events, friendships and scores.
+    """
+    return {
+        'events': (Event.objects.filter(Q(organizer=user) |
+                                        Q(pk__in=ParticipationRequest.objects.filter(user=user).values('event')))
+                   .select_related('organizer', 'game'), EventsSerializer),
+        'requests': (ParticipationRequest.objects.filter(Q(user=user) | Q(event__organizer=user)),
+                     ParticipationRequestsSerializer),
+        'friendships': (FriendshipStatus.objects.filter(Q(user1=user) | Q(user2=user)), FriendshipStatusesSerializer),
+        'scores': (UserScore.objects.filter(user=user), UserScoresSerializer),
+    }
+
+
+def _page(items, timestamp, limit):
+    """
+    Cut limit + 1 items ordered by timestamp to a page that ends before a timestamp boundary,
+    so the next page can start at the returned cut-off without repeating or skipping rows.
+    """
+    if len(items) <= limit:
+        return items, None
+    cut_off = timestamp(items[limit])
+    page = [item for item in items[:limit] if timestamp(item) < cut_off]
+    if not page:
+        # more than limit changes within one microsecond, nothing to cut between
+        return items[:limit], cut_off + timedelta(microseconds=1)
+    return page, cut_off
+
+
+def changes(user, since=None, context=None):
+    """
+    Rows of the user's feed changed at or after since (everything when since is None) and ids
+    deleted since then, at most SYNC_PAGE_SIZE per collection. Clients upsert by id: rows can be
+    sent twice, because the next token starts SYNC_OVERLAP_SECONDS back to catch transactions
+    that committed late.
+    """
+    started = timezone.now()
+    limit = settings.SYNC_PAGE_SIZE
+    data = {}
+    cut_offs = []
+    for name, (queryset, serializer_class) in collections(user).items():
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since)
+        rows, cut_off = _page(list(queryset.order_by('updated_at', 'pk')[:limit + 1]),
+                              lambda row: row.updated_at, limit)
+        if cut_off is not None:
+            cut_offs.append(cut_off)
+        data[name] = serializer_class(rows, many=True, context=context).data
+    data['deleted'] = {name: [] for name in data}
+    if since is not None:
+        tombstones, cut_off = _page(list(Tombstone.objects.filter(user_id=user.pk, deleted_at__gte=since)
+                                         .order_by('deleted_at', 'pk')
+                                         .values_list('model', 'object_id', 'deleted_at')[:limit + 1]),
+                                    lambda tombstone: tombstone[2], limit)
+        if cut_off is not None:
+            cut_offs.append(cut_off)
+        for model, object_id, _ in tombstones:
+            data['deleted'][model].append(object_id)
+    if cut_offs:
+        data['next'], data['has_more'] = encode_token(min(cut_offs)), True
+    else:
+        data['next'] = encode_token(started - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS))
+        data['has_more'] = False
+    return data
+
+
+def is_expired(since):
+    """
+    Tombstones older than SYNC_TOMBSTONE_DAYS are purged, so such a token needs a full resync.
+    """
+    return since < timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+
+
+def record_deletions(deletions):
+    """
+    Tombstones of several (name, object_id, user_ids) deletions with one INSERT.
+    """
+    Tombstone.objects.bulk_create([Tombstone(model=name, object_id=object_id, user_id=user_id)
+                                   for name, object_id, user_ids in deletions
+                                   for user_id in set(user_ids) if user_id is not None])
+
+
+def record_deletion(name, object_id, user_ids):
+    record_deletions([(name, object_id, user_ids)])
+
+
+def purge_tombstones():
+    deleted, _ = Tombstone.objects.filter(
+        deleted_at__lt=timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)).delete()
+    return deleted
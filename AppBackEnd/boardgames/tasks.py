@@ -0,0 +1,119 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def task(name):
+    """
+    Register handler(task, **payload) for the tasks called name. Handlers can run more than
+    once for the same task (a retry after a failure or a lost worker), so they must be idempotent.
+    """
+    def register(handler):
+        _handlers[name] = handler
+        return handler
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """
+    Queue a task in the current transaction, so it is committed or rolled back together with
+    the change that caused it. Does nothing while a task with the same idempotency key is
+    still pending; a running one may have read the data before the change, so it does not count.
+    """
+    from boardgames.models import Task
+
+    Task.objects.bulk_create([Task(name=name, payload=payload or {}, idempotency_key=key,
+                                   run_at=timezone.now() + timedelta(seconds=delay))], ignore_conflicts=True)
+
+
+def backoff(attempts):
+    """
+    Seconds before the next attempt: exponential in the number of attempts, capped, with jitter.
+    """
+    delay = min(settings.TASK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.TASK_RETRY_MAX_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim(batch_size=10):
+    """
+    Lock up to batch_size due tasks for this worker. skip_locked lets several workers claim
+    concurrently; a running task whose lease has expired (its worker died) is claimed again.
+    """
+    from boardgames.models import Task
+
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(Task.objects.select_for_update(skip_locked=True)
+                     .filter(status__in=[Task.PENDING, Task.RUNNING], run_at__lte=now)
+                     .order_by('run_at')[:batch_size])
+        Task.objects.filter(pk__in=[task.pk for task in tasks]) \
+            .update(status=Task.RUNNING, attempts=F('attempts') + 1,
+                    run_at=now + timedelta(seconds=settings.TASK_LEASE_SECONDS))
+    for task in tasks:
+        task.status = Task.RUNNING
+        task.attempts += 1
+    return tasks
+
+
+def execute(task):
+    """
+    Run a claimed task in its own transaction and record the outcome.
+    Returns True when the task is done.
+    """
+    from boardgames.models import Task
+
+    try:
+        handler = _handlers.get(task.name)
+        if handler is None:
+            raise LookupError('No handler for task %s' % task.name)
+        if task.attempts > settings.TASK_MAX_ATTEMPTS:
+            raise RuntimeError('Lease expired %d times' % settings.TASK_MAX_ATTEMPTS)
+        with transaction.atomic():
+            handler(task, **task.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts >= settings.TASK_MAX_ATTEMPTS:
+            logger.error('Task %s #%s failed for good:\n%s', task.name, task.pk, error)
+            Task.objects.filter(pk=task.pk).update(status=Task.FAILED, last_error=error)
+        else:
+            logger.warning('Task %s #%s failed, attempt %d', task.name, task.pk, task.attempts)
+            try:
+                with transaction.atomic():
+                    Task.objects.filter(pk=task.pk).update(
+                        status=Task.PENDING, last_error=error,
+                        run_at=timezone.now() + timedelta(seconds=backoff(task.attempts)))
+            except IntegrityError:
+                # a task with the same key was queued while this one ran, it does the same work
+                logger.warning('Task %s #%s is retried by the pending task with its key', task.name, task.pk)
+                Task.objects.filter(pk=task.pk).update(status=Task.FAILED, last_error=error)
+        return False
+    Task.objects.filter(pk=task.pk).update(status=Task.DONE, last_error='', run_at=timezone.now())
+    return True
+
+
+def run_pending(batch_size=10):
+    """
+    Claim and execute one batch. Returns the number of tasks claimed.
+    """
+    tasks = claim(batch_size)
+    for task in tasks:
+        execute(task)
+    return len(tasks)
+
+
+def purge_finished(older_than_days):
+    from boardgames.models import Task
+
+    deleted, _ = Task.objects.filter(status=Task.DONE,
+                                     run_at__lt=timezone.now() - timedelta(days=older_than_days)).delete()
+    return deleted
@@ -1,3 +1,807 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from boardgames.db_router import check_sticky_cache
+from boardgames.friends import get_friend_ids
+from boardgames.geo import OfflineGeocoder, bounding_box, covering_cells, distance_km, encode_geohash, \
+    within
+from boardgames.jwt import tokens_valid_after
+from boardgames.lifecycle import archive_events, deactivate_past_events
+from boardgames.middleware import QueryBudgetExceeded
+from boardgames.models import ArchivedEvent, ArchivedParticipationRequest, Event, FriendshipStatus, Game, \
+    GameSimilarity, ParticipationRequest, Profile, Recommendation, RecommendationRefresh, Task, Tombstone, UserScore
+from boardgames.recommendations import build_recommendations, refresh_pending
+from boardgames.serializers import CustomTokenObtainPairSerializer
+from boardgames.tasks import claim, enqueue, execute, task
+from boardgames.views import EventViewSet
+
+KAZAN = OfflineGeocoder.CITIES['казань']
+MOSCOW = OfflineGeocoder.CITIES['москва']
+
+
+def create_event(organizer, game, **fields):
+    fields = dict({'name': 'Вечер игр', 'address': 'ул. Баумана, 1', 'city': 'Казань',
+                   'date': date.today() + timedelta(days=1), 'time': time(18, 0), 'max_players': 4}, **fields)
+    return Event.objects.create(organizer=organizer, game=game, **fields)
+
+
+class GeohashTests(TestCase):
+    def test_encode(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(*MOSCOW, 5), 'ucfv0')
+
+    def test_covering_cells_contain_points_within_radius(self):
+        radius = 5
+        cells = covering_cells(*KAZAN, radius)
+        precision = len(cells[0])
+        # points at the radius in eight directions, 1 degree of latitude is about 111 km
+        step = radius / 111.2 * 0.99
+        for d_lat, d_lon in ((1, 0), (-1, 0), (0, 1), (0, -1), (0.7, 0.7), (-0.7, 0.7), (0.7, -0.7), (-0.7, -0.7)):
+            point = (KAZAN[0] + d_lat * step, KAZAN[1] + d_lon * step / 0.57)
+            self.assertLessEqual(distance_km(*KAZAN, *point), radius)
+            self.assertIn(encode_geohash(*point, precision), cells)
+
+    def test_covering_cells_wrap_the_antimeridian(self):
+        cells = covering_cells(0.5, 179.99, 10)
+        precision = len(cells[0])
+        self.assertIn(encode_geohash(0.5, 179.99, precision), cells)
+        self.assertIn(encode_geohash(0.5, -179.99, precision), cells)
+
+    def test_bounding_box(self):
+        (min_lat, max_lat), [(min_lon, max_lon)] = bounding_box(*KAZAN, 10)
+        self.assertAlmostEqual(distance_km(*KAZAN, max_lat, KAZAN[1]), 10, places=6)
+        self.assertAlmostEqual(distance_km(*KAZAN, min_lat, KAZAN[1]), 10, places=6)
+        # the circle touches the meridian of max_lon at a single point
+        self.assertGreaterEqual(min(distance_km(*KAZAN, lat / 1000, max_lon) for lat in range(55000, 56500)), 9.999)
+        self.assertLess(min(distance_km(*KAZAN, lat / 1000, max_lon - 0.001) for lat in range(55000, 56500)), 10)
+        self.assertAlmostEqual(KAZAN[1] - min_lon, max_lon - KAZAN[1])
+
+    def test_bounding_box_wraps_the_antimeridian_and_the_poles(self):
+        _, lon_ranges = bounding_box(0.5, 179.99, 10)
+        self.assertEqual(len(lon_ranges), 2)
+        self.assertEqual((lon_ranges[0][1], lon_ranges[1][0]), (180, -180))
+        self.assertEqual(bounding_box(89.99, 10, 10)[1], [(-180, 180)])
+
+
+class NearbyTests(TestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(username='nearby@example.com', email='nearby@example.com',
+                                                password='secret123', city='Казань')
+        self.game = Game.objects.create(id=13, name='Catan')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def nearby(self, point, radius=5):
+        return self.client.get('/api/events/nearby/', {'lat': point[0], 'lon': point[1], 'radius': radius})
+
+    def test_geocodes_the_city_offline(self):
+        event = create_event(self.user, self.game)
+        self.assertEqual((event.latitude, event.longitude), KAZAN)
+        self.assertEqual(event.geohash, encode_geohash(*KAZAN))
+
+    def test_returns_events_within_radius_by_distance(self):
+        far = create_event(self.user, self.game, latitude=KAZAN[0] + 0.03, longitude=KAZAN[1])
+        near = create_event(self.user, self.game)
+        create_event(self.user, self.game, city='Москва')
+        create_event(self.user, self.game, is_active=False)
+        create_event(self.user, self.game, date=date.today() - timedelta(days=1))
+        response = self.nearby(KAZAN)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data], [near.pk, far.pk])
+        self.assertEqual(response.data[0]['distance'], 0)
+        self.assertAlmostEqual(response.data[1]['distance'], 3.336, places=2)
+
+    def test_leaves_out_events_beyond_the_radius(self):
+        # about 5.6 km north, in the same covering cells as the centre
+        beyond = create_event(self.user, self.game, latitude=KAZAN[0] + 0.05, longitude=KAZAN[1])
+        inside = create_event(self.user, self.game, latitude=KAZAN[0], longitude=KAZAN[1] + 0.07)
+        self.assertEqual([item['id'] for item in self.nearby(KAZAN, radius=5).data], [inside.pk])
+        self.assertEqual([item['id'] for item in self.nearby(KAZAN, radius=6).data], [inside.pk, beyond.pk])
+
+    def test_sparse_fields_keep_the_coordinates_loaded(self):
+        for _ in range(3):
+            create_event(self.user, self.game)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/events/nearby/', {'lat': KAZAN[0], 'lon': KAZAN[1], 'fields': 'id'})
+        self.assertEqual([set(item) for item in response.data], [{'id', 'distance'}] * 3)
+
+    def test_exact_distances_of_the_closest_candidates_only(self):
+        events = [create_event(self.user, self.game, latitude=KAZAN[0] + offset, longitude=KAZAN[1])
+                  for offset in (0.03, 0.01, 0.02)]
+        # inside the covering cells, outside the bounding box
+        create_event(self.user, self.game, latitude=KAZAN[0] + 0.05, longitude=KAZAN[1])
+        with override_settings(NEARBY_MAX_CANDIDATES=2):
+            response = self.nearby(KAZAN, radius=4)
+        self.assertEqual([item['id'] for item in response.data], [events[1].pk, events[2].pk])
+        with override_settings(NEARBY_MAX_CANDIDATES=10):
+            response = self.nearby(KAZAN, radius=4)
+        self.assertEqual([item['id'] for item in response.data], [events[1].pk, events[2].pk, events[0].pk])
+        self.assertEqual(Event.objects.filter(within(*KAZAN, 4)).count(), 3)
+
+    def test_follows_a_changed_city(self):
+        event = create_event(self.user, self.game)
+        event = Event.objects.get(pk=event.pk)
+        event.city = 'Москва'
+        event.save()
+        self.assertEqual(self.nearby(KAZAN).data, [])
+        self.assertEqual([item['id'] for item in self.nearby(MOSCOW).data], [event.pk])
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/events/nearby/', {'lat': 55}).status_code, 400)
+        self.assertEqual(self.nearby((95, 10)).status_code, 400)
+        self.assertEqual(self.nearby(KAZAN, radius=10_000).status_code, 400)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = Profile.objects.create_user(username='budget@example.com', email='budget@example.com',
+                                           password='secret123')
+        game = Game.objects.create(id=13, name='Catan')
+        create_event(user, game)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_within_budget(self):
+        response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(int(response['X-Query-Count']), EventViewSet.query_budgets['list'])
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_mode_fails_over_budget(self):
+        with mock.patch.dict(EventViewSet.query_budgets, {'list': 0}):
+            with self.assertRaisesRegex(QueryBudgetExceeded, r'EventViewSet.list ran \d+ queries, budget is 0'):
+                self.client.get('/api/events/')
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_overrun_is_logged_otherwise(self):
+        with mock.patch.dict(EventViewSet.query_budgets, {'list': 0}):
+            with self.assertLogs('boardgames.middleware', 'WARNING') as logs:
+                response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(logs.output[0], r'EventViewSet.list ran \d+ queries, budget is 0')
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create_user(username='fields@example.com', email='fields@example.com',
+                                                password='secret123', first_name='Анна', city='Казань')
+        self.event = create_event(self.user, Game.objects.create(id=13, name='Catan'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_returns_the_requested_fields(self):
+        response = self.client.get('/api/events/', {'fields': 'id,name,seats_left,game_name'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.event.pk, 'name': 'Вечер игр', 'seats_left': 4, 'game_name': 'Catan'}])
+        response = self.client.get('/api/events/', {'fields': 'id,organizer_info'})
+        self.assertEqual(response.json()['results'][0]['organizer_info']['first_name'], 'Анна')
+        response = self.client.get('/api/profiles/', {'fields': 'id,city'})
+        self.assertEqual(response.json()['results'], [{'id': self.user.pk, 'city': 'Казань'}])
+
+    def test_list_reads_only_the_requested_columns(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.get('/api/events/', {'fields': 'id,name'})
+        select = next(query['sql'] for query in queries if 'boardgames_event' in query['sql'])
+        self.assertNotIn('description', select)
+        self.assertNotIn('boardgames_profile', select)
+
+    def test_detail_and_list_actions_return_the_requested_fields(self):
+        response = self.client.get('/api/events/%d/' % self.event.pk, {'fields': 'id,city'})
+        self.assertEqual(response.json(), {'id': self.event.pk, 'city': 'Казань'})
+        response = self.client.get('/api/events/my_events/', {'fields': 'id'})
+        self.assertEqual(response.json()['results'], [{'id': self.event.pk}])
+
+    def test_without_fields_the_whole_representation(self):
+        item = self.client.get('/api/events/').json()['results'][0]
+        self.assertLessEqual({'id', 'name', 'city', 'organizer_info', 'game_name', 'seats_left'}, set(item))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create_user(username='cache@example.com', email='cache@example.com',
+                                                password='secret123')
+        self.game = Game.objects.create(id=13, name='Catan')
+        self.events = [create_event(self.user, self.game) for _ in range(2)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_renamed_game_refreshes_event_details(self):
+        url = '/api/events/%d/' % self.events[0].pk
+        self.assertEqual(self.client.get(url).json()['game_name'], 'Catan')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.name = 'Колонизаторы'
+            self.game.save()
+        self.assertEqual(self.client.get(url).json()['game_name'], 'Колонизаторы')
+
+    @override_settings(ALLOWED_HOSTS=['a.example.com', 'b.example.com'])
+    def test_links_are_cached_per_host(self):
+        for host in ('a.example.com', 'b.example.com'):
+            response = self.client.get('/api/events/', {'page_size': 1}, HTTP_HOST=host)
+            self.assertTrue(response.json()['next'].startswith('http://%s/' % host))
+
+
+class FriendListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.friend = [
+            Profile.objects.create_user(username='%s@example.com' % name, email='%s@example.com' % name,
+                                        password='secret123') for name in ('user', 'friend')]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def friend_ids(self, user_id):
+        response = self.client.get('/api/profiles/friendlist/%s/' % user_id)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_new_friendship_clears_the_cached_list(self):
+        self.assertEqual(get_friend_ids('0%d' % self.user.pk), [])
+        self.assertEqual(self.friend_ids(self.user.pk), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendshipStatus.objects.create(user1=self.user, user2=self.friend, isAccepted=True)
+        self.assertEqual(get_friend_ids('0%d' % self.user.pk), [self.friend.pk])
+        self.assertEqual(self.friend_ids(self.friend.pk), [self.user.pk])
+
+    def test_non_numeric_ids_are_not_found(self):
+        self.assertEqual(self.client.get('/api/profiles/friendlist/abc/').status_code, 404)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = Profile.objects.create_user(username='staff@example.com', email='staff@example.com',
+                                                 password='secret123', is_staff=True)
+        self.client = APIClient()
+        self.tokens = self.login()
+
+    def login(self):
+        response = self.client.post('/api/token/', {'email': 'staff@example.com', 'password': 'secret123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_metrics(self, tokens):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + tokens['access'])
+        return self.client.get('/api/metrics/')
+
+    def refresh(self, tokens):
+        return self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+
+    def test_staff_token(self):
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 200)
+        self.assertEqual(self.refresh(self.tokens).status_code, 200)
+
+    def test_demotion_revokes_tokens(self):
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            staff = Profile.objects.get(pk=self.staff.pk)
+            staff.is_staff = False
+            staff.save(update_fields=['is_staff'])
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 401)
+        self.assertEqual(self.refresh(self.tokens).status_code, 401)
+        self.assertEqual(self.get_metrics(self.login()).status_code, 403)
+
+    def test_queryset_update_revokes_tokens(self):
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.filter(pk=self.staff.pk).update(email='moved@example.com')
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 401)
+        self.assertEqual(self.refresh(self.tokens).status_code, 401)
+
+    def test_other_changes_keep_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.filter(pk=self.staff.pk).update(first_name='Анна')
+            staff = Profile.objects.get(pk=self.staff.pk)
+            staff.city = 'Казань'
+            staff.save()
+        self.assertEqual(tokens_valid_after(self.staff.pk), 0)
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 200)
+
+    def test_admin_permission_reads_the_database(self):
+        # a per-process cache of another worker may not know about the demotion yet
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 200)
+        Profile.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.assertEqual(tokens_valid_after(self.staff.pk), 0)
+        self.assertEqual(self.get_metrics(self.tokens).status_code, 403)
+
+
+class ParticipationRequestUpdateTests(TestCase):
+    def setUp(self):
+        self.organizer = Profile.objects.create_user(username='organizer@example.com', email='organizer@example.com',
+                                                     password='secret123')
+        self.player = Profile.objects.create_user(username='player@example.com', email='player@example.com',
+                                                  password='secret123')
+        self.event = create_event(self.organizer, Game.objects.create(id=13, name='Catan'), max_players=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.player)
+        response = self.client.post('/api/requests/participate/%d/' % self.event.pk, {'message': 'Можно?'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.request = ParticipationRequest.objects.get(event=self.event, user=self.player)
+
+    def test_decision_fields_are_read_only(self):
+        response = self.client.patch('/api/requests/%d/' % self.request.pk,
+                                     {'message': 'Можно с другом?', 'is_accepted': True, 'is_handled': True,
+                                      'answer': 'Да'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.request.refresh_from_db()
+        self.assertEqual((self.request.message, self.request.is_accepted, self.request.is_handled,
+                          self.request.answer), ('Можно с другом?', False, False, None))
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.accepted_count, self.event.pending_count), (0, 1))
+
+    def test_respond_needs_an_object(self):
+        self.client.force_authenticate(self.organizer)
+        url = '/api/requests/respond/%d/%d/' % (self.event.pk, self.player.pk)
+        for body in ([{'is_accepted': True}], 'yes', 1):
+            self.assertEqual(self.client.patch(url, body, format='json').status_code, 400, body)
+        response = self.client.patch(url, {'is_accepted': True, 'answer': 'Ждём'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['is_accepted'], response.data['answer']), (True, 'Ждём'))
+
+    def test_only_the_requester_edits_the_request(self):
+        self.client.force_authenticate(self.organizer)
+        response = self.client.patch('/api/requests/%d/' % self.request.pk, {'message': 'Чужая'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ReconcileEventCountersTests(TestCase):
+    def setUp(self):
+        organizer = Profile.objects.create_user(username='organizer@example.com', email='organizer@example.com',
+                                                password='secret123')
+        players = [Profile.objects.create_user(username='p%d@example.com' % number, email='p%d@example.com' % number,
+                                               password='secret123') for number in range(3)]
+        game = Game.objects.create(id=13, name='Catan')
+        self.consistent, self.drifted = create_event(organizer, game), create_event(organizer, game)
+        # created past the views, the counters are not maintained
+        ParticipationRequest.objects.create(event=self.drifted, user=players[0], is_accepted=True, is_handled=True)
+        ParticipationRequest.objects.create(event=self.drifted, user=players[1])
+        ParticipationRequest.objects.create(event=self.drifted, user=players[2], is_handled=True)
+
+    def counters(self, event):
+        event.refresh_from_db()
+        return event.accepted_count, event.pending_count
+
+    def test_reports_drift(self):
+        with self.assertRaisesRegex(CommandError, r'events: %d$' % self.drifted.pk):
+            call_command('reconcile_event_counters', stdout=StringIO())
+        self.assertEqual(self.counters(self.drifted), (0, 0))
+
+    def test_fixes_only_the_drifted_events(self):
+        updated_at = self.consistent.updated_at
+        output = StringIO()
+        call_command('reconcile_event_counters', fix=True, batch_size=1, stdout=output)
+        self.assertIn('Fixed counters of 1 events', output.getvalue())
+        self.assertEqual(self.counters(self.drifted), (1, 1))
+        self.assertEqual((self.counters(self.consistent), self.consistent.updated_at), ((0, 0), updated_at))
+        call_command('reconcile_event_counters', stdout=output)
+        self.assertIn('All event counters are consistent', output.getvalue())
+
+
+class EventLifecycleTests(TestCase):
+    def setUp(self):
+        self.organizer, self.player = [
+            Profile.objects.create_user(username='%s@example.com' % name, email='%s@example.com' % name,
+                                        password='secret123') for name in ('organizer', 'player')]
+        self.game = Game.objects.create(id=13, name='Catan')
+        self.today = timezone.localdate()
+
+    def create_event(self, days, moment=time(18, 0), **fields):
+        return create_event(self.organizer, self.game, date=self.today + timedelta(days=days), time=moment, **fields)
+
+    def active_ids(self):
+        return set(Event.objects.filter(is_active=True).values_list('pk', flat=True))
+
+    def test_deactivates_started_events_in_batches(self):
+        started = [self.create_event(-3), self.create_event(-1), self.create_event(0, time(11, 0))]
+        upcoming = [self.create_event(0, time(13, 0)), self.create_event(1)]
+        self.create_event(-2, is_active=False)
+        noon = timezone.make_aware(datetime.combine(self.today, time(12, 0)))
+        # two batches of SELECT and UPDATE in a savepoint, then the empty SELECT
+        with self.assertNumQueries(9):
+            self.assertEqual(deactivate_past_events(batch_size=2, now=noon), 3)
+        self.assertEqual(self.active_ids(), {event.pk for event in upcoming})
+        self.assertFalse(Event.objects.filter(pk__in=[event.pk for event in started], is_active=True).exists())
+        self.assertEqual(deactivate_past_events(now=noon), 0)
+
+    def test_archives_old_inactive_events_with_their_requests(self):
+        old = self.create_event(-40, is_active=False, description='Старое', max_players=3)
+        ParticipationRequest.objects.create(event=old, user=self.player, message='Можно?', is_accepted=True,
+                                            is_handled=True, answer='Да')
+        recent = self.create_event(-10, is_active=False)
+        ParticipationRequest.objects.create(event=recent, user=self.player)
+        # the sweep deactivates it first
+        stale = self.create_event(-50)
+        self.assertEqual(archive_events(30), 1)
+        self.assertEqual(set(Event.objects.values_list('pk', flat=True)), {recent.pk, stale.pk})
+        archived = ArchivedEvent.objects.get()
+        self.assertEqual((archived.pk, archived.name, archived.description, archived.max_players, archived.game_id,
+                          archived.organizer_id, archived.date), (old.pk, old.name, 'Старое', 3, 13,
+                                                                  self.organizer.pk, old.date))
+        request = ArchivedParticipationRequest.objects.get()
+        self.assertEqual((request.event_id, request.user_id, request.message, request.is_accepted, request.answer),
+                         (old.pk, self.player.pk, 'Можно?', True, 'Да'))
+        self.assertEqual(ParticipationRequest.objects.get().event_id, recent.pk)
+
+    def test_sweep_command(self):
+        self.create_event(-50)
+        self.create_event(1)
+        output = StringIO()
+        call_command('sweep_events', archive_after=0, stdout=output)
+        self.assertRegex(output.getvalue(), r'Deactivated 1 and archived 0 events')
+        call_command('sweep_events', archive_after=30, stdout=output)
+        self.assertRegex(output.getvalue(), r'Deactivated 0 and archived 1 events')
+        self.assertEqual(Event.objects.count(), 1)
+
+
+class DeletionTombstoneTests(TestCase):
+    def setUp(self):
+        self.organizer, self.first, self.second = [
+            Profile.objects.create_user(username='%s@example.com' % name, email='%s@example.com' % name,
+                                        password='secret123') for name in ('organizer', 'first', 'second')]
+        game = Game.objects.create(id=13, name='Catan')
+        self.events = [create_event(self.organizer, game, is_active=False, date=date.today() - timedelta(days=60))
+                       for _ in range(3)]
+        self.requests = [ParticipationRequest.objects.create(event=event, user=user)
+                         for event in self.events for user in (self.first, self.second)]
+
+    def tombstones(self, user):
+        return set(Tombstone.objects.filter(user_id=user.pk).values_list('model', 'object_id'))
+
+    def test_archived_events_leave_every_feed(self):
+        # one batch: the same queries for any number of events and requests
+        with self.assertNumQueries(17):
+            self.assertEqual(archive_events(30), 3)
+        self.assertEqual(ArchivedEvent.objects.count(), 3)
+        self.assertEqual(ArchivedParticipationRequest.objects.count(), 6)
+        self.assertFalse(ParticipationRequest.objects.exists())
+        events = {('events', event.pk) for event in self.events}
+        self.assertEqual(self.tombstones(self.organizer),
+                         events | {('requests', request.pk) for request in self.requests})
+        self.assertEqual(self.tombstones(self.first),
+                         events | {('requests', request.pk) for request in self.requests if request.user == self.first})
+
+    def test_withdrawn_request_removes_the_event_from_the_requester_feed(self):
+        request = self.requests[0]
+        request_id = request.pk
+        request.delete()
+        self.assertEqual(self.tombstones(self.first), {('events', request.event_id), ('requests', request_id)})
+        self.assertEqual(self.tombstones(self.organizer), {('requests', request_id)})
+
+    def test_deleted_requests_are_recorded_at_once(self):
+        with self.assertNumQueries(4):
+            ParticipationRequest.objects.filter(user=self.first).delete()
+        self.assertEqual(len(self.tombstones(self.first)), 6)
+        self.assertEqual(len(self.tombstones(self.organizer)), 3)
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create_user(username='catalog@example.com', email='catalog@example.com',
+                                                password='secret123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rating_a_game_outside_the_catalog_adds_a_stub(self):
+        response = self.client.post('/api/scores/rate/4242/', {'score': 8}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Game.objects.filter(pk=4242).exists())
+        self.assertEqual(self.client.get('/api/games/4242/').json()['score_number'], 1)
+
+    def test_renaming_a_game_refreshes_the_search_vectors_of_its_events(self):
+        Game.objects.create(id=13, name='Catan')
+        with mock.patch('boardgames.signals.update_game_events') as update_game_events:
+            game = Game.objects.get(pk=13)
+            game.year_published = 1995
+            game.save()
+            game.name = 'Колонизаторы'
+            game.save(update_fields=['year_published'])
+            update_game_events.assert_not_called()
+            game.save()
+            game.save()
+        update_game_events.assert_called_once_with(13)
+
+    def import_catalog(self, name, content):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        output = StringIO()
+        with mock.patch('boardgames.management.commands.import_bgg_catalog.update_in_batches') as update_in_batches:
+            call_command('import_bgg_catalog', path, stdout=output)
+        return output.getvalue(), update_in_batches
+
+    def test_imports_a_csv_dump(self):
+        event = create_event(self.user, Game.objects.create(id=13, name='Catan'))
+        output, update_in_batches = self.import_catalog('games.csv', 'objectid,Name,YearPublished,minplayers\n'
+                                                                     '13,Catan,1995,3\n822,Carcassonne,2000,2\n')
+        self.assertIn('Imported 1 new games, updated 1', output)
+        self.assertEqual(list(Game.objects.order_by('pk').values_list('pk', 'name', 'year_published', 'min_players')),
+                         [(13, 'Catan', 1995, 3), (822, 'Carcassonne', 2000, 2)])
+        # the events of updated games are searched by the new names
+        self.assertEqual(list(update_in_batches.call_args.args[3]), [event])
+        output, update_in_batches = self.import_catalog('games.csv', 'objectid,name\n13,Catan\n')
+        self.assertIn('Imported 0 new games, updated 0', output)
+        update_in_batches.assert_not_called()
+
+    def test_imports_an_xml_dump(self):
+        output, _ = self.import_catalog('games.xml', '''<items>
+            <item type="boardgame" id="822">
+                <thumbnail>https://example.com/822.png</thumbnail>
+                <name type="alternate" value="Каркассон"/><name type="primary" value="Carcassonne"/>
+                <yearpublished value="2000"/><maxplayers value="5"/>
+                <statistics><ratings><average value="7.4"/></ratings></statistics>
+            </item>
+            <item type="boardgame" id="x"><name type="primary" value="Broken"/></item>
+        </items>''')
+        self.assertIn('Imported 1 new games', output)
+        game = Game.objects.get()
+        self.assertEqual((game.pk, game.name, game.year_published, game.max_players, game.rating, game.thumbnail),
+                         (822, 'Carcassonne', 2000, 5, 7.4, 'https://example.com/822.png'))
+
+    def test_rejects_unknown_dumps(self):
+        with self.assertRaisesRegex(CommandError, 'Unknown dump format'):
+            call_command('import_bgg_catalog', 'games.json')
+        with self.assertRaises(CommandError):
+            self.import_catalog('games.csv', 'title_only\nCatan\n')
+
+    def add_legacy_columns(self):
+        table = connection.ops.quote_name(Event._meta.db_table)
+        with connection.cursor() as cursor:
+            for column in ('game_name', 'game_thumbnail'):
+                cursor.execute('ALTER TABLE %s ADD COLUMN %s varchar(500) NULL' % (table, column))
+
+    def backfill(self):
+        output = StringIO()
+        call_command('backfill_game_catalog', stdout=output)
+        return output.getvalue()
+
+    def test_backfill_names_the_missing_games_from_the_legacy_columns(self):
+        # before the rows: PostgreSQL does not alter a table with pending foreign key checks
+        self.add_legacy_columns()
+        Game.objects.create(id=13, name='Catan')
+        create_event(self.user, Game(id=13))
+        event = create_event(self.user, Game(id=230802))
+        UserScore.objects.create(user=self.user, game_id=266192, score=8)
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE %s SET game_name = %%s, game_thumbnail = %%s WHERE id = %%s' % (
+                connection.ops.quote_name(Event._meta.db_table)), ['Azul', 'https://example.com/azul.png', event.pk])
+        self.assertIn('Added 2 of 3 games', self.backfill())
+        self.assertEqual(list(Game.objects.order_by('pk').values_list('pk', 'name', 'thumbnail')), [
+            (13, 'Catan', ''), (230802, 'Azul', 'https://example.com/azul.png'), (266192, '', '')])
+        self.assertIn('Added 0 of 3 games', self.backfill())
+
+    def test_backfill_without_the_legacy_columns(self):
+        create_event(self.user, Game(id=230802))
+        self.assertIn('Added 1 of 1 games', self.backfill())
+        self.assertEqual(list(Game.objects.values_list('pk', 'name')), [(230802, '')])
+
+    def test_game_events_are_paged_by_date(self):
+        game = Game.objects.create(id=13, name='Catan')
+        later = create_event(self.user, game, date=date.today() + timedelta(days=3))
+        sooner = create_event(self.user, game, date=date.today() + timedelta(days=1))
+        response = self.client.get('/api/games/13/events/', {'page_size': 1})
+        self.assertEqual([item['id'] for item in response.data['results']], [sooner.pk])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [later.pk])
+
+
+class RecommendationRefreshTests(TestCase):
+    def setUp(self):
+        self.organizer, self.fan, self.other, *self.raters = [
+            Profile.objects.create_user(username='%s@example.com' % name, email='%s@example.com' % name,
+                                        password='secret123', city='Москва')
+            for name in ('organizer', 'fan', 'other', 'first', 'second', 'third')]
+        self.catan, self.carcassonne, self.chess = [Game.objects.create(id=game_id, name=name) for game_id, name in
+                                                    ((13, 'Catan'), (822, 'Carcassonne'), (171, 'Chess'))]
+        # whoever likes Catan likes Carcassonne
+        for rater, scores in zip(self.raters, ((9, 9, 2), (8, 9, 3), (2, 3, 9))):
+            for game, score in zip((self.catan, self.carcassonne, self.chess), scores):
+                UserScore.objects.create(user=rater, game=game, score=score)
+        self.event = create_event(self.organizer, self.carcassonne)
+        self.requested = create_event(self.organizer, self.carcassonne)
+        ParticipationRequest.objects.create(event=self.requested, user=self.fan)
+        UserScore.objects.create(user=self.other, game=self.catan, score=9)
+        UserScore.objects.create(user=self.other, game=self.chess, score=2)
+        build_recommendations()
+        RecommendationRefresh.objects.all().delete()
+
+    def recommended(self, user):
+        return list(Recommendation.objects.filter(user=user).values_list('event', flat=True))
+
+    def test_refreshes_the_users_whose_scores_changed(self):
+        self.assertEqual(self.recommended(self.fan), [])
+        other_recommendations = list(Recommendation.objects.filter(user=self.other).order_by('pk')
+                                     .values_list('pk', 'event'))
+        self.assertEqual({event for _, event in other_recommendations}, {self.event.pk, self.requested.pk})
+        similarity = set(GameSimilarity.objects.values_list('game', 'similar_game', 'score'))
+        self.assertIn((self.catan.pk, self.carcassonne.pk), {pair[:2] for pair in similarity})
+        UserScore.objects.create(user=self.fan, game=self.catan, score=9)
+        UserScore.objects.create(user=self.fan, game=self.chess, score=2)
+        self.assertEqual(list(RecommendationRefresh.objects.values_list('user', flat=True)), [self.fan.pk])
+        self.assertEqual(refresh_pending(), 1)
+        # the event they asked to join is left out
+        self.assertEqual(self.recommended(self.fan), [self.event.pk])
+        self.assertFalse(RecommendationRefresh.objects.exists())
+        self.assertEqual(list(Recommendation.objects.filter(user=self.other).order_by('pk')
+                                     .values_list('pk', 'event')),
+                         other_recommendations)
+        # incremental refreshes reuse the stored similarity
+        self.assertEqual(set(GameSimilarity.objects.values_list('game', 'similar_game', 'score')), similarity)
+        self.assertEqual(refresh_pending(), 0)
+
+
+class EventFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = Profile.objects.create_user(username='feed@example.com', email='feed@example.com', password='secret123')
+        game = Game.objects.create(id=13, name='Catan')
+        self.events = [create_event(user, game, time=time(18, 0)) for _ in range(3)]
+        self.headers = {'Authorization': 'Bearer %s' % CustomTokenObtainPairSerializer.get_token(user).access_token}
+        self.client = AsyncClient()
+        # cached for a logged-in user, a cold cache costs one query per AUTH_REVOCATION_CACHE_SECONDS
+        tokens_valid_after(user.pk)
+
+    async def test_pages_follow_the_cursor(self):
+        response = await self.client.get('/api/events/feed/', {'page_size': 2}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [event.pk for event in self.events[:2]])
+        response = await self.client.get(response.json()['next'], headers=self.headers)
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.events[2].pk])
+        self.assertIsNone(response.json()['next'])
+
+    async def test_rejects_invalid_cursors(self):
+        day = (date.today() + timedelta(days=1)).isoformat()
+        for cursor in ([day, '18:00:00', 'abc'], [day, '18:00:00', None], [day, '18:00:00'], [day, 'noon', 1], {}):
+            after = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            response = await self.client.get('/api/events/feed/', {'after': after}, headers=self.headers)
+            self.assertEqual(response.status_code, 400, cursor)
+        response = await self.client.get('/api/events/feed/', {'after': 'not a cursor'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+@task('failing_test_task')
+def failing_test_task(task):
+    raise ValueError('failed')
+
+
+class TaskQueueTests(TestCase):
+    def test_tasks_coalesce_only_while_pending(self):
+        enqueue('failing_test_task', key='key')
+        enqueue('failing_test_task', key='key')
+        self.assertEqual(Task.objects.count(), 1)
+        claim()
+        enqueue('failing_test_task', key='key')
+        self.assertEqual(sorted(Task.objects.values_list('status', flat=True)), [Task.PENDING, Task.RUNNING])
+
+    def test_failed_task_leaves_the_retry_to_the_pending_one(self):
+        enqueue('failing_test_task', key='key')
+        running = claim()[0]
+        enqueue('failing_test_task', key='key')
+        with self.assertLogs('boardgames.tasks', 'WARNING'):
+            self.assertFalse(execute(running))
+        self.assertEqual(Task.objects.get(pk=running.pk).status, Task.FAILED)
+        self.assertEqual(Task.objects.filter(status=Task.PENDING).count(), 1)
+
+
+REPLICA = 'replica1'
+
+
+class ReplicaCheckTests(TestCase):
+    def test_replicas_need_a_shared_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(REPLICA_DATABASES=[REPLICA], CACHES=locmem):
+            self.assertEqual([error.id for error in check_sticky_cache(None)], ['boardgames.E001'])
+        with override_settings(REPLICA_DATABASES=[REPLICA], CACHES=redis):
+            self.assertEqual(check_sticky_cache(None), [])
+        with override_settings(REPLICA_DATABASES=[], CACHES=locmem):
+            self.assertEqual(check_sticky_cache(None), [])
+
+
+@skipUnless(REPLICA in settings.DATABASES, 'needs a replica mirroring the test database: DB_REPLICA_HOSTS=localhost')
+@override_settings(REPLICA_DATABASES=[REPLICA])
+class ReplicaRoutingTests(TransactionTestCase):
+    # the replica is a second connection to the test database, it sees committed rows only,
+    # the runner opens these connections even for a skipped class
+    databases = {'default', REPLICA} & set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create_user(username='replica@example.com', email='replica@example.com',
+                                                password='secret123')
+        self.event = create_event(self.user, Game.objects.create(id=13, name='Catan'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, *args, **kwargs):
+        """
+        (response, queries on the primary, queries on the replica)
+        """
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(*args, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        response, primary, replica = self.request('get', '/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.event.pk])
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_exports_stream_from_the_replica(self):
+        response = self.client.get('/api/events/export/')
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in rows], [self.event.pk])
+        self.assertEqual(len(primary), 0)
+        self.assertGreater(len(replica), 0)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        response, _, replica = self.request('post', '/api/scores/rate/13/', {'score': 7}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(replica, 0)
+        response, primary, replica = self.request('get', '/api/scores/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        cache.clear()
+        _, primary, replica = self.request('get', '/api/scores/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_failed_writes_do_not_stick(self):
+        response, _, _ = self.request('post', '/api/scores/rate/13/', {'score': 'many'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        _, primary, replica = self.request('get', '/api/events/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_writes_for_other_users_stick(self):
+        player = Profile.objects.create_user(username='player@example.com', email='player@example.com',
+                                             password='secret123')
+        player_client = APIClient()
+        player_client.force_authenticate(player)
+        response = player_client.post('/api/requests/participate/%d/' % self.event.pk, {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        # the organizer sees the new request
+        _, primary, replica = self.request('get', '/api/events/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        cache.clear()
+        response = self.client.patch('/api/requests/respond/%d/%d/' % (self.event.pk, player.pk),
+                                     {'is_accepted': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # and the player the answer
+        self.client.force_authenticate(player)
+        _, primary, replica = self.request('get', '/api/events/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_views_without_the_mixin_read_from_the_primary(self):
+        # sync tokens are read back against updated_at, a lagging replica would skip changes
+        response, primary, replica = self.request('get', '/api/sync/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['events']], [self.event.pk])
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
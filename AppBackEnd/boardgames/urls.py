@@ -1,19 +1,20 @@
 from rest_framework.routers import SimpleRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenObtainPairView
 
-from boardgames import views
+from boardgames import views, async_views
 from django.urls import path
 
 from boardgames.views import EventViewSet, ProfileViewSet, ScoresViewSet, ParticipationRequestsViewSet, \
-    FriendshipStatusViewSet
+    FriendshipStatusViewSet, GameViewSet, NotificationViewSet
 
 router = SimpleRouter()
 router.register(r'events', EventViewSet, basename='events')
 router.register(r'profiles', ProfileViewSet)
-# router.register(r'games', GameViewSet)
+router.register(r'games', GameViewSet)
 router.register(r'scores', ScoresViewSet)
 router.register(r'requests', ParticipationRequestsViewSet)
 router.register(r'friends', FriendshipStatusViewSet)
+router.register(r'notifications', NotificationViewSet, basename='notifications')
 
 
 
@@ -22,8 +23,13 @@ urlpatterns = [
     # path('login/', views.LoginAPIView.as_view(), name='login'),
     path('user/', views.AuthUserAPIView.as_view(), name='user'),
     # path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', views.CustomTokenRefreshView.as_view(), name='token_refresh'),
     path('token/', views.CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('metrics/', views.MetricsAPIView.as_view(), name='metrics'),
+    path('sync/', views.SyncAPIView.as_view(), name='sync'),
+    path('events/feed/', async_views.EventFeedView.as_view(), name='events_feed'),
+    path('events/<int:pk>/overview/', async_views.EventOverviewView.as_view(), name='event_overview'),
+    path('stream/', async_views.EventStreamView.as_view(), name='stream'),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
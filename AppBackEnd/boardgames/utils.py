@@ -1,11 +1,59 @@
+import json
+
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+EXPORT_CHUNK_SIZE = 2000
+
 
+def requested_fields(request):
+    """
+    Field names from ?fields=id,name,date or None when the whole representation is wanted.
+    """
+    if request is None or not request.query_params.get('fields'):
+        return None
+    return {name.strip() for name in request.query_params['fields'].split(',')}
 
-def serialize_data(view_set, queryset):
-    serializer = view_set.serializer_class(queryset, many=True, read_only=True)
+
+def serialize_data(view_set, queryset, serializer_class=None):
+    serializer_class = serializer_class or view_set.get_serializer_class()
+    context = view_set.get_serializer_context()
+    page = view_set.paginate_queryset(queryset)
+    if page is not None:
+        serializer = serializer_class(page, many=True, read_only=True, context=context)
+        return view_set.get_paginated_response(serializer.data)
+    serializer = serializer_class(queryset, many=True, read_only=True, context=context)
     return Response(serializer.data)
 
 
 def serialize_single_obj_data(view_set, queryset):
-    serializer = view_set.serializer_class(queryset, many=False, read_only=True)
+    serializer = view_set.get_serializer_class()(queryset, many=False, read_only=True,
+                                                 context=view_set.get_serializer_context())
     return Response(serializer.data)
+
+
+def stream_data(view_set, queryset, serializer_class=None):
+    """
+    Stream the whole queryset as a JSON array (or NDJSON with ?output=ndjson)
+    reading it through a server-side cursor, so memory use does not depend on the row count.
+    The rows are read after the view has returned: the database is chosen now, while the view's
+    replica routing applies, and the queries are not counted by QueryProfilingMiddleware.
+    """
+    queryset = queryset.using(queryset.db)
+    serializer = (serializer_class or view_set.get_serializer_class())(context=view_set.get_serializer_context())
+
+    def rows():
+        for obj in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield json.dumps(serializer.to_representation(obj), cls=JSONEncoder, ensure_ascii=False)
+
+    if view_set.request.query_params.get('output') == 'ndjson':
+        return StreamingHttpResponse((row + '\n' for row in rows()), content_type='application/x-ndjson')
+
+    def json_array():
+        yield '['
+        for i, row in enumerate(rows()):
+            yield row if i == 0 else ',' + row
+        yield ']'
+
+    return StreamingHttpResponse(json_array(), content_type='application/json')
@@ -1,65 +1,154 @@
+from datetime import date
+
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.db import transaction, IntegrityError
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import response, status, permissions
 from rest_framework.decorators import action, permission_classes
-from rest_framework.exceptions import ValidationError
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.generics import GenericAPIView, CreateAPIView, get_object_or_404
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from rest_framework_simplejwt.views import TokenObtainPairView
-
-from boardgames.models import Event, Profile, UserScore, ParticipationRequest, FriendshipStatus
-from boardgames.serializers import EventsSerializer, ProfilesSerializer, RegisterSerializer, LoginSerializer, \
-    UserScoresSerializer, ParticipationRequestsSerializer, FriendshipStatusesSerializer, CustomTokenObtainPairSerializer
-from boardgames.utils import serialize_data, serialize_single_obj_data
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from boardgames import metrics, sync
+from boardgames.aggregates import apply_score_change
+from boardgames.caching import cache_response
+from boardgames.catalog import ensure_game
+from boardgames.db_router import ReplicaReadMixin, mark_write
+from boardgames.fastpath import serialize_values
+from boardgames.filters import EventFilter
+from boardgames.friends import get_friend_ids
+from boardgames.geo import approximate_distance, distance_km, within
+from boardgames.models import Event, Profile, UserScore, ParticipationRequest, FriendshipStatus, GameScoreAggregate, \
+    Game, Notification
+from boardgames.notifications import notify_event_changed, notify_friend_request
+from boardgames.pagination import EventCursorPagination, NewestFirstCursorPagination
+from boardgames.permissions import IsAdminUser
+from boardgames.push import publish
+from boardgames.participation import apply_decisions, move_request, request_state
+from boardgames.search import FullTextSearchFilter, search
+from boardgames.serializers import EventsSerializer, EventListSerializer, ProfilesSerializer, RegisterSerializer, \
+    LoginSerializer, UserScoresSerializer, ParticipationRequestsSerializer, FriendshipStatusesSerializer, \
+    CustomTokenObtainPairSerializer, CustomTokenRefreshSerializer, ProfileShortSerializer, \
+    ParticipationDecisionSerializer, GamesSerializer, PictureUploadSerializer, NotificationsSerializer
+from boardgames.utils import serialize_data, serialize_single_obj_data, stream_data, requested_fields
 from django.utils.translation import activate
 
 
-# TODO: рекомендательная система
-
-
-class ProfileViewSet(ModelViewSet):
+class ProfileViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = Profile.objects.all()
     serializer_class = ProfilesSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filter_fields = ['city']
-    search_fields = ['first_name', 'last_name']
+    query_budgets = {'list': 2, 'retrieve': 2, 'search': 2, 'get_friendlist': 3}
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProfileShortSerializer
+        return ProfilesSerializer
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.queryset.only(*ProfileShortSerializer.only_fields(requested_fields(self.request)))
+        return self.queryset
+
+    @cache_response('profile:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    # загрузка фотографии профиля, уменьшенные копии делаются в фоне
+
+    @action(detail=False, methods=['post'], url_path='picture', parser_classes=[MultiPartParser])
+    def upload_picture(self, request):
+        serializer = PictureUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        profile = get_object_or_404(Profile.objects.all(), pk=request.user.pk)
+        profile.profilePicture = serializer.validated_data['picture']
+        profile.save(update_fields=['profilePicture'])
+        return Response(ProfileShortSerializer(profile, context=self.get_serializer_context()).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+    # поиск по имени, фамилии и городу с ранжированием и автодополнением: ?q=
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        profiles = search(self.queryset, request.query_params.get('q', '')) \
+            .only(*ProfileShortSerializer.only_fields(requested_fields(request)))
+        profiles = profiles[:self.paginator.get_page_size(request)]
+        return Response(ProfileShortSerializer(profiles, many=True, context=self.get_serializer_context()).data)
 
     # френдлист
 
-    @action(detail=False, methods=['get'], url_path='friendlist/(?P<user_id>[^/.]+)')
+    @action(detail=False, methods=['get'], url_path='friendlist/(?P<user_id>[0-9]+)')
     def get_friendlist(self, request, user_id):
-        list1 = FriendshipStatusViewSet.queryset.filter(user1=user_id, isAccepted=True).values_list('user2',
-                                                                                                    flat=True).distinct()
-        list2 = FriendshipStatusViewSet.queryset.filter(user2=user_id, isAccepted=True).values_list('user1',
-                                                                                                    flat=True).distinct()
-        qs1 = self.queryset.filter(pk__in=list1)
-        qs2 = self.queryset.filter(pk__in=list2)
-        return serialize_data(self, qs1.union(qs2))
-
-
-# class GameViewSet(ReadOnlyModelViewSet):
-#     queryset = Game.objects.all()
-#     serializer_class = GamesSerializer
-#     filter_backends = [DjangoFilterBackend, SearchFilter]
-#     filter_fields = ['year']
-#     search_fields = ['title']
+        friends = self.queryset.filter(pk__in=get_friend_ids(user_id)) \
+            .only(*ProfileShortSerializer.only_fields(requested_fields(request))).order_by('id')
+        return serialize_data(self, friends, ProfileShortSerializer)
+
+
+class GameViewSet(ReplicaReadMixin, ReadOnlyModelViewSet):
+    queryset = Game.objects.select_related('score_aggregate')
+    serializer_class = GamesSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['year_published']
+    query_budgets = {'list': 2, 'retrieve': 2, 'events': 2}
+
+    @cache_response('games')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('games', 'game_scores:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    # предстоящие активные мероприятия по игре
+
+    @action(detail=True, methods=['get'], pagination_class=EventCursorPagination)
+    def events(self, request, pk):
+        only = EventListSerializer.only_fields(requested_fields(request)) | {'date', 'time'}
+        events = Event.objects.filter(game=pk, is_active=True, date__gte=date.today()).only(*only) \
+            .select_related(*{'organizer', 'game'} & only).order_by('date', 'time', 'id')
+        return serialize_values(self, events, EventListSerializer)
+
 
 @permission_classes([permissions.IsAuthenticated])
-class EventViewSet(ModelViewSet):
+class EventViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventsSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    filter_fields = {
-        'game': ['exact'],
-        'organizer': ['exact'],
-        'is_active': ['exact'],
-        'city': ['exact'],
-        'date': ['gte', 'lte', ]
-    }
-    search_fields = ['game']
+    pagination_class = EventCursorPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
+    filterset_class = EventFilter
+    query_budgets = {'list': 2, 'retrieve': 2, 'nearby': 2, 'search': 2, 'my_events': 2, 'by_user': 2,
+                     'recommended': 2}
+
+    list_actions = ('list', 'nearby', 'search', 'export', 'my_events', 'by_user', 'recommended')
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return EventListSerializer
+        return EventsSerializer
+
+    def get_queryset(self):
+        if self.action not in self.list_actions:
+            return self.queryset.select_related('organizer', 'game')
+        # date и time нужны для курсорной пагинации, координаты - для расстояния в nearby
+        only = EventListSerializer.only_fields(requested_fields(self.request)) | {'date', 'time'}
+        if self.action == 'nearby':
+            only |= {'latitude', 'longitude'}
+        return self.queryset.only(*only).select_related(*{'organizer', 'game'} & only)
+
+    @cache_response('events')
+    def list(self, request, *args, **kwargs):
+        return serialize_values(self, self.filter_queryset(self.get_queryset()))
+
+    @cache_response('event:{pk}', 'event_details')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     # создание
 
@@ -67,21 +156,77 @@ class EventViewSet(ModelViewSet):
         serializer.save(organizer=self.request.user, is_active=True)
         return Response(serializer.data)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+        notify_event_changed(serializer.instance.pk)
+
     # поиск по нескольким критериям: http://127.0.0.1: 8000 / api / events /?game_id = 2 & playersMax = 4
 
+    # активные предстоящие мероприятия рядом с точкой: ?lat=&lon=&radius= (км)
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lon'])
+            radius = float(request.query_params.get('radius', 10))
+        except (KeyError, ValueError):
+            return Response({'message': "Нужно указать lat, lon и radius"}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius <= settings.NEARBY_MAX_RADIUS_KM):
+            return Response({'message': "Недопустимые координаты или радиус"}, status=status.HTTP_400_BAD_REQUEST)
+        # ближайшие NEARBY_MAX_CANDIDATES по приближённому расстоянию, точное считается только для них
+        candidates = self.get_queryset().filter(within(latitude, longitude, radius), is_active=True,
+                                                date__gte=date.today()) \
+            .alias(approximate_distance=approximate_distance(latitude, longitude)) \
+            .order_by('approximate_distance')[:settings.NEARBY_MAX_CANDIDATES]
+        nearby = []
+        for event in candidates:
+            distance = distance_km(latitude, longitude, event.latitude, event.longitude)
+            if distance <= radius:
+                nearby.append((distance, event))
+        nearby.sort(key=lambda item: (item[0], item[1].date, item[1].time, item[1].id))
+        limit = self.paginator.get_page_size(request)
+        data = []
+        for distance, event in nearby[:limit]:
+            item = self.get_serializer(event).data
+            item['distance'] = round(distance, 3)
+            data.append(item)
+        return Response(data)
+
+    # рекомендованные мероприятия, заранее посчитанные командой build_recommendations: ?page_size=
+
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        events = self.get_queryset().filter(recommendations__user=request.user, is_active=True,
+                                            date__gte=date.today()).order_by('-recommendations__score')
+        return Response(self.get_serializer(events[:self.paginator.get_page_size(request)], many=True).data)
+
+    # поиск по названию, игре, городу и описанию с ранжированием и автодополнением: ?q=
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        events = search(self.filter_queryset(self.get_queryset()), request.query_params.get('q', ''))
+        return Response(self.get_serializer(events[:self.paginator.get_page_size(request)], many=True).data)
+
+    # выгрузка всех мероприятий (с учётом фильтров) потоком
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).order_by('date', 'time', 'id')
+        return stream_data(self, queryset)
+
     # получение событий, организованных пользователем
 
     @action(detail=False, methods=['get'])
     def my_events(self, request):
-        return serialize_data(self, self.queryset.filter(organizer=self.request.user))
+        return serialize_values(self, self.get_queryset().filter(organizer=self.request.user))
 
     # получение прошлых мероприятий пользователя, активных мероприятий пользователя, PUT
 
     @action(detail=False, methods=['get'], url_path='by_user/(?P<org_id>[^/.]+)')
     def by_user(self, request, org_id):
-        queryset = self.queryset.filter(organizer=org_id)
-        serializer = self.serializer_class(queryset, many=True, read_only=True)
-        return Response(serializer.data)
+        return serialize_values(self, self.get_queryset().filter(organizer=org_id))
 
     # изменение мероприятия
     @action(detail=False, methods=['put'], url_path='(?P<event_id>[^/.]+)/edit')
@@ -91,7 +236,9 @@ class EventViewSet(ModelViewSet):
         if self.request.data['organizer'] == self.request.user.id:
             serializer = self.serializer_class(instance, data=self.request.data)
             if serializer.is_valid():
-                serializer.save(organizer=self.request.user)
+                with transaction.atomic():
+                    serializer.save(organizer=self.request.user)
+                    notify_event_changed(instance.pk)
                 return Response(serializer.data)
             return Response(status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_403_FORBIDDEN)
@@ -104,20 +251,44 @@ class EventViewSet(ModelViewSet):
         # return Response(serializer.   data)
 
 
-class ScoresViewSet(ModelViewSet):
+class ScoresViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = UserScore.objects.all()
     serializer_class = UserScoresSerializer
+    query_budgets = {'scores_by_games': 2, 'scores_by_users': 2, 'my_score': 2, 'my_scores': 2}
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        serializer.save()
+        apply_score_change(serializer.instance.game_id, new_score=serializer.instance.score)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_score = serializer.instance.score
+        serializer.save()
+        apply_score_change(serializer.instance.game_id, old_score, serializer.instance.score)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        apply_score_change(instance.game_id, old_score=instance.score)
 
     # получение оценок игры
     @action(detail=False, methods=['get'], url_path='game/(?P<game_id>[^/.]+)')
+    @cache_response('game_scores:{game_id}')
     def scores_by_games(self, request, game_id):
-        return serialize_data(self, self.queryset.filter(game=game_id))
+        return serialize_values(self, self.queryset.filter(game=game_id))
+
+    # выгрузка всех оценок игры потоком
+
+    @action(detail=False, methods=['get'], url_path='game/(?P<game_id>[^/.]+)/export')
+    def export_by_game(self, request, game_id):
+        return stream_data(self, self.queryset.filter(game=game_id).order_by('id'))
 
     # получение оценок пользователя
 
     @action(detail=False, methods=['get'], url_path='user/(?P<user_id>[^/.]+)')
     def scores_by_users(self, request, user_id):
-        return serialize_data(self, self.queryset.filter(user=user_id))
+        return serialize_values(self, self.queryset.filter(user=user_id))
 
     # получение оценок текущего пользователя
 
@@ -128,73 +299,95 @@ class ScoresViewSet(ModelViewSet):
     # получение средней оценки
 
     @action(detail=False, methods=['get'], url_path='score/(?P<game_id>[^/.]+)')
+    @cache_response('game_scores:{game_id}')
     def my_scores(self, request, game_id):
-        scores = self.queryset.filter(game=game_id)
-        score_number = scores.count()
-        if score_number == 0:
+        aggregate = GameScoreAggregate.objects.filter(game=game_id).first()
+        if aggregate is None or aggregate.score_count == 0:
             return Response(status=status.HTTP_204_NO_CONTENT)
-        score_value = 0
-        for score_obj in scores:
-            score_value += score_obj.score
-        score_value /= score_number
-        return Response({'score_value': score_value, 'score_number': score_number})
+        return Response({'score_value': aggregate.average, 'score_number': aggregate.score_count,
+                         'histogram': aggregate.histogram})
 
     # выставление или изменение оценки
 
-    @action(detail=False, methods=['post'], url_path='rate/(?P<game_id>[^/.]+)')
+    @action(detail=False, methods=['post'], url_path='rate/(?P<game_id>[0-9]+)')
+    @transaction.atomic
     def rate(self, request, game_id):
-        user_rate = self.queryset.filter(user=self.request.user, game=game_id).first()
-        if user_rate is None:
-            serializer = self.serializer_class(data=request.data)
-            if serializer.is_valid():
-                serializer.save(user=self.request.user, game=game_id)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            score_obj = user_rate
-            score_obj.score = request.data["score"]
-            score_obj.save()
-            serializer = self.serializer_class(score_obj)
-            return Response(serializer.data)
+        score = serializer.validated_data['score']
+        # игра, которой ещё нет в каталоге, добавляется заготовкой, как при создании мероприятия
+        game = ensure_game(int(game_id))
+        score_obj, created = self.queryset.select_for_update().get_or_create(user=self.request.user, game=game,
+                                                                             defaults={'score': score})
+        if created:
+            apply_score_change(score_obj.game_id, new_score=score)
+            return Response(self.serializer_class(score_obj).data, status=status.HTTP_201_CREATED)
+        old_score = score_obj.score
+        score_obj.score = score
+        score_obj.save(update_fields=['score', 'updated_at'])
+        apply_score_change(score_obj.game_id, old_score, score)
+        return Response(self.serializer_class(score_obj).data)
 
     # удаление оценки
 
     @action(detail=False, methods=['delete'], url_path='delete/(?P<game_id>[^/.]+)')
+    @transaction.atomic
     def delete(self, request, game_id):
-        user_rate = self.queryset.filter(user=self.request.user, game=game_id).first()
+        user_rate = self.queryset.select_for_update().filter(user=self.request.user, game=game_id).first()
         if user_rate is not None:
             user_rate.delete()
+            apply_score_change(user_rate.game_id, old_score=user_rate.score)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ParticipationRequestsViewSet(ModelViewSet):
+class ParticipationRequestsViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = ParticipationRequest.objects.all()
     serializer_class = ParticipationRequestsSerializer
+    query_budgets = {'unhandled_requests_by_event': 3, 'participators_of_event': 2, 'requests_by_event': 3,
+                     'my_request_status': 3, 'my_requests': 2, 'participate': 5, 'respond_bulk': 8}
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        serializer.save()
+        move_request(serializer.instance.event_id, new_state=request_state(serializer.instance))
+
+    # изменить сообщение заявки может только её автор, решение организатора принимается через respond
+    def perform_update(self, serializer):
+        if serializer.instance.user_id != self.request.user.id:
+            raise PermissionDenied
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        move_request(instance.event_id, old_state=request_state(instance))
 
     # получение нерассмотренных заявок на мероприятие
 
     @action(detail=False, methods=['get'], url_path='event/(?P<event_id>[^/.]+)/unhandled_requests')
     def unhandled_requests_by_event(self, request, event_id):
-        if Event.objects.get(id=event_id).organizer == self.request.user:
-            return serialize_data(self, self.queryset.filter(event=event_id, is_handled=False))
+        if Event.objects.filter(id=event_id).values_list('organizer', flat=True).get() == self.request.user.id:
+            return serialize_values(self, self.queryset.filter(event=event_id, is_handled=False))
 
     # получение списка участников
 
     @action(detail=False, methods=['get'], url_path='event/(?P<event_id>[^/.]+)/participators')
+    @cache_response('participators:{event_id}')
     def participators_of_event(self, request, event_id):
-        return serialize_data(self, self.queryset.filter(event=event_id, is_accepted=True))
+        return serialize_values(self, self.queryset.filter(event=event_id, is_accepted=True))
 
     # получение всех заявок на участие
 
     @action(detail=False, methods=['get'], url_path='event/(?P<event_id>[^/.]+)/requests')
     def requests_by_event(self, request, event_id):
-        if Event.objects.get(id=event_id).organizer == self.request.user:
-            return serialize_data(self, self.queryset.filter(event=event_id))
+        if Event.objects.filter(id=event_id).values_list('organizer', flat=True).get() == self.request.user.id:
+            return serialize_values(self, self.queryset.filter(event=event_id))
 
     # получение статуса моей заявки
     @action(detail=False, methods=['get'], url_path='event/(?P<event_id>[^/.]+)/my_request')
     def my_request_status(self, request, event_id):
-        if Event.objects.get(id=event_id).organizer != self.request.user:
+        if Event.objects.filter(id=event_id).values_list('organizer', flat=True).get() != self.request.user.id:
             return serialize_data(self, self.queryset.filter(event=event_id))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -202,33 +395,40 @@ class ParticipationRequestsViewSet(ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def my_requests(self, request):
-        return serialize_data(self, self.queryset.filter(user=self.request.user))
+        return serialize_values(self, self.queryset.filter(user=self.request.user))
 
     # отправление заявки
 
     @action(detail=False, methods=['post'], url_path='participate/(?P<event_id>[^/.]+)')
     def participate(self, request, event_id):
-        if self.queryset.filter(user=self.request.user, event=Event.objects.get(id=event_id)).first() is None:
-            if Event.objects.get(id=event_id).organizer == self.request.user:
-                return Response({'message': "Нельзя отправить заявку на участие в собственном мероприятии"},
-                                status=status.HTTP_400_BAD_REQUEST)
-            serializer = self.serializer_class(data=request.data)
-            if serializer.is_valid():
-                serializer.save(user=self.request.user, event=Event.objects.get(id=event_id), is_accepted=False)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+        event = get_object_or_404(Event.objects.all(), pk=event_id)
+        if event.organizer_id == self.request.user.id:
+            return Response({'message': "Нельзя отправить заявку на участие в собственном мероприятии"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        else:
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user, event=event, is_accepted=False)
+                move_request(event.id, new_state=request_state(serializer.instance))
+                mark_write(event.organizer_id)
+                publish([event.organizer_id], 'request.created', {'event': event.id, 'request': serializer.instance.pk,
+                                                                  'user': self.request.user.id})
+        except IntegrityError:
             return Response({'message': "Заявка уже отправлена"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     # изменение заявки(ответ на заявку)
 
     @action(detail=False, methods=['patch'], url_path='respond/(?P<event_id>[^/.]+)/(?P<user_id>[^/.]+)')
     def respond(self, request, event_id, user_id):
-        user_request = self.queryset.filter(user=user_id, event=event_id).first()
-        user_request.answer = request.data['answer']
-        user_request.is_accepted = request.data['is_accepted']
-        user_request.is_handled = True
-        user_request.save()
+        if not isinstance(request.data, dict):
+            return Response({'message': "Ожидается объект с полями is_accepted и answer"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        decision = ParticipationDecisionSerializer(data=dict(request.data, user_id=user_id))
+        decision.is_valid(raise_exception=True)
+        user_request, = apply_decisions(event_id, self.request.user, [decision.validated_data])
         serializer = self.serializer_class(user_request)
         return Response(serializer.data)
         # if(user_request.or):
@@ -240,21 +440,33 @@ class ParticipationRequestsViewSet(ModelViewSet):
         #     serializer = self.serializer_class(user_rate)
         #     return Response(serializer.data)
 
+    # ответ сразу на несколько заявок: [{user_id, is_accepted, answer}, ...]
+
+    @action(detail=False, methods=['patch'], url_path='respond/(?P<event_id>[^/.]+)')
+    def respond_bulk(self, request, event_id):
+        decisions = ParticipationDecisionSerializer(data=request.data, many=True)
+        decisions.is_valid(raise_exception=True)
+        user_requests = apply_decisions(event_id, self.request.user, decisions.validated_data)
+        return Response(self.serializer_class(user_requests, many=True).data)
+
     # удаление заявки
 
     @action(detail=False, methods=['delete'], url_path='delete/(?P<event_id>[^/.]+)')
+    @transaction.atomic
     def delete(self, request, event_id):
-        user_request = self.queryset.filter(user=self.request.user, event=event_id).first()
+        user_request = self.queryset.select_for_update().filter(user=self.request.user, event=event_id).first()
         if user_request is not None:
             user_request.delete()
+            move_request(user_request.event_id, old_state=request_state(user_request))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     # получение статуса заявки
 
 
-class FriendshipStatusViewSet(ModelViewSet):
+class FriendshipStatusViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = FriendshipStatus.objects.all()
     serializer_class = FriendshipStatusesSerializer
+    query_budgets = {'my_requests': 2, 'sent_requests': 2}
 
     # входящие заявки в друзья
     @action(detail=False, methods=['get'])
@@ -276,7 +488,12 @@ class FriendshipStatusViewSet(ModelViewSet):
                                 status=status.HTTP_400_BAD_REQUEST)
             serializer = self.serializer_class(data=request.data)
             if serializer.is_valid():
-                serializer.save(user1=self.request.user, user2=Profile.objects.get(id=user2_id))
+                with transaction.atomic():
+                    friendship = serializer.save(user1=self.request.user, user2=Profile.objects.get(id=user2_id))
+                    notify_friend_request(friendship)
+                    mark_write(friendship.user2_id)
+                    publish([friendship.user2_id], 'friend_request.created', {
+                        'friendship': friendship.pk, 'user': friendship.user1_id, 'message': friendship.message})
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
@@ -293,6 +510,31 @@ class FriendshipStatusViewSet(ModelViewSet):
     #     return Response(serializer.data)
 
 
+class NotificationViewSet(ReplicaReadMixin, ReadOnlyModelViewSet):
+    serializer_class = NotificationsSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = NewestFirstCursorPagination
+    query_budgets = {'list': 2, 'retrieve': 2, 'read': 2}
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get('unread'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+    # отметить уведомления прочитанными: {"ids": [...]}, без ids - все
+
+    @action(detail=False, methods=['post'])
+    def read(self, request):
+        queryset = Notification.objects.filter(user=self.request.user, is_read=False)
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+                raise ValidationError({'ids': "Ожидается список id"})
+            queryset = queryset.filter(pk__in=ids)
+        return Response({'updated': queryset.update(is_read=True)})
+
+
 class RegisterAPIView(GenericAPIView):
     authentication_classes = []
     serializer_class = RegisterSerializer
@@ -338,5 +580,35 @@ class AuthUserAPIView(GenericAPIView):
         return response.Response({'user': serializer.data})
 
 
+class SyncAPIView(APIView):
+    """
+    Изменения для мобильного клиента: ?since=<next из прошлого ответа>, без since - всё.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 5
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = sync.decode_token(since)
+            except (ValueError, OverflowError):
+                raise ValidationError({'since': "Некорректный токен синхронизации"})
+            if sync.is_expired(since):
+                return Response({'message': "Токен устарел, нужна полная синхронизация"}, status=status.HTTP_410_GONE)
+        return Response(sync.changes(request.user, since, {'request': request, 'view': self}))
+
+
+class MetricsAPIView(GenericAPIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return response.Response(metrics.snapshot())
+
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = CustomTokenRefreshSerializer